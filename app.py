@@ -1,76 +1,274 @@
-print("Starting app.py...")
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-print("Imported Flask and dependencies")
+from flask import (Flask, Response, render_template, request, redirect, url_for, session, flash, jsonify,
+                   stream_with_context)
+from pymongo import ReturnDocument
+from pymongo.errors import ConnectionFailure
+from dotenv import load_dotenv
+from werkzeug.local import LocalProxy
+from bson.objectid import ObjectId
+from markupsafe import Markup
 
-from pymongo import MongoClient
-print("Imported pymongo")
+from instrumentation import Instrumentation, configure_logging, with_request_stats
+from db import MongoConnection
+from cache import book_cache_key, create_cache
+from compression import compress_response
+from conditional import add_page_etag, not_modified, set_validators
+from catalog_version import CatalogVersion
+from live_updates import AvailabilityFeed, LiveUpdatesUnavailable, TooManySubscribers, LIVE_UPDATES
+from indexes import ensure_indexes as apply_indexes, missing_booking_indexes, students_query, user_query
+from credentials import CredentialService, CredentialServiceBusy
+from async_support import EventLoopThread
+from expiry import ExpiryScheduler, book_reservation_threshold
+from inventory import (books_by_id_query, cancel_hold, fill_from_waitlist, new_title, parse_copies,
+                       reserved_holds_query, return_holds, set_total_copies, student_holds_query, title_holds_query)
+from waitlist import (WAITLIST_POSITION_LIMIT, get_waitlist_entry, leave_waitlist, titles_waitlist_query,
+                      waitlist_counters, waitlist_position)
+from search import CatalogSearchIndex
+from pagination import get_page_size, keyset_page, keyset_page_async, ranked_page, sorted_keyset_page
+from genres import GenreCatalog, genre_query
+from reservations import (get_room_day_reservations,
+                          student_has_active_reservation, student_has_active_reservation_async,
+                          cancel_reservations, is_on_slot_grid,
+                          SLOT_GRANULARITY_MINUTES)
+from scheduling import DaySchedule, SLOT_DURATION, ROOM_SLOT_MINUTES, opening_hours
+from room_status import get_room_reservations, get_room_reservations_async, room_statuses_at
+from formatting import format_clock, register_template_filters
+from bulk_actions import apply_bulk_action, borrow_change, parse_book_ids, BULK_ACTIONS, MAX_BULK_BOOKS
+from loans import (close_loans, fee_balances, open_loans, open_loans_query, overdue_loans_query, overdue_summary,
+                   settle_fees, LATE_FEE_PER_DAY, LOAN_DAYS)
+from catalog_io import (export_books, format_from_filename, import_books, read_records,
+                        FORMATS)
+from booking import (reserve_book_atomically, book_room_slot, book_next_room_slot,
+                     booking_counters, join_book_waitlist, ALREADY_HOLDING, ALREADY_QUEUED, QUEUED,
+                     RESERVED, UNAVAILABLE)
 
-from dotenv import load_dotenv
-print("Imported dotenv")
+configure_logging()
+logger = logging.getLogger(__name__)
 
-import os
-print("Imported os")
+app = Flask(__name__)
 
-from werkzeug.security import generate_password_hash, check_password_hash
-print("Imported werkzeug.security")
+# Per-route request, MongoDB and template metrics, served at /metrics
+instrumentation = Instrumentation()
 
-from bson.objectid import ObjectId
-print("Imported bson.objectid")
+# The MongoDB client is created per process on first use (see db.py); the
+# collections below resolve to it lazily
+mongo = MongoConnection(event_listeners=[instrumentation.command_listener])
+users_collection = LocalProxy(lambda: mongo.db.users)
+books_collection = LocalProxy(lambda: mongo.db.books)
+holds_collection = LocalProxy(lambda: mongo.db.book_holds)
+waitlist_collection = LocalProxy(lambda: mongo.db.book_waitlist)
+conference_rooms_collection = LocalProxy(lambda: mongo.db.conference_rooms)
+conference_reservations_collection = LocalProxy(lambda: mongo.db.conference_reservations)
+loans_collection = LocalProxy(lambda: mongo.db.loans)
+counters_collection = LocalProxy(lambda: mongo.db.counters)
 
-from datetime import datetime, timedelta
-print("Imported datetime")
+# Version of the book catalog, bumped by every route that changes books (and
+# by the expiry sweep when it releases lapsed reservations)
+catalog_version = CatalogVersion(counters_collection)
 
-app = Flask(__name__)
-app.secret_key = 'your-very-long-and-random-secret-key-123456'  # Updated for security
-print("Flask app initialized")
+# VIEW_MODE=async loads the student dashboard's independent queries concurrently
+# on a per-process event loop, using PyMongo's async client (the successor of
+# Motor). The default, sync, runs them one after another on the request thread.
+VIEW_MODE = os.getenv("VIEW_MODE", "sync").lower()
+event_loop = EventLoopThread("async-views")
+async_db = None
+async_db_pid = None
+async_db_lock = threading.Lock()
+
+# Helper function to get the async database, connecting on first use. Only
+# called from coroutines on event_loop, so the client is bound to that loop.
+def get_async_db():
+    global async_db, async_db_pid
+    with async_db_lock:
+        if async_db is None or async_db_pid != os.getpid():
+            from pymongo import AsyncMongoClient
+            async_db = AsyncMongoClient(mongo.uri, event_listeners=mongo.event_listeners,
+                                        **mongo.options)[mongo.database]
+            async_db_pid = os.getpid()
+    return async_db
+
+# Sweep expired reservations in the background instead of on every request.
+# Set EXPIRY_SCHEDULER=off when running `python expiry.py` as a separate worker.
+expiry_scheduler = ExpiryScheduler(books_collection, holds_collection, conference_reservations_collection,
+                                   loans_collection=loans_collection,
+                                   on_books_expired=lambda book_ids: invalidate_books(*book_ids),
+                                   waitlist_collection=waitlist_collection)
+
+# Export the expiry sweep and booking counters alongside the request metrics
+def expiry_collector():
+    metrics = expiry_scheduler.metrics()
+    collected = [
+        (f"library_expiry_{name}", "counter", f"Expiry scheduler {name.replace('_', ' ')}.", metrics[name])
+        for name in ("sweeps_total", "sweep_errors_total", "sweep_duration_seconds_total",
+                     "books_expired_total", "room_reservations_expired_total", "loans_accrued_total")
+    ]
+    collected.append(("library_expiry_last_sweep_duration_seconds", "gauge",
+                      "Duration of the last expiry sweep.", metrics["last_sweep_duration_seconds"]))
+    return collected
+
+def booking_collector():
+    return [(f"library_{name}", "counter", f"Booking {name.replace('_', ' ')}.", value)
+            for name, value in sorted({**booking_counters.snapshot(), **waitlist_counters.snapshot()}.items())]
+
+# Inverted index used for catalog search; built on first search
+search_index = CatalogSearchIndex(books_collection)
+
+# Cached genre list and per-genre counts for the dropdowns
+genre_catalog = GenreCatalog(books_collection)
+
+# Cache for user records, hot book documents and the conference room status
+# (CACHE_URL, see cache.py). The routes that change them invalidate the entries.
+cache = create_cache()
+BOOK_CACHE_TTL = float(os.getenv("BOOK_CACHE_TTL", "30"))
+ROOM_STATUS_CACHE_TTL = float(os.getenv("ROOM_STATUS_CACHE_TTL", "15"))
+
+# Rendered book tables are cached in the same cache, keyed by the catalog
+# version, so a change to any book retires them all at once
+FRAGMENT_CACHE_TTL = float(os.getenv("FRAGMENT_CACHE_TTL", "300"))
+
+# Compiled templates are kept on disk (JINJA_BYTECODE_CACHE: `on` for Jinja's
+# default temporary directory, a directory, or `off`) so new worker processes
+# skip compiling them
+JINJA_BYTECODE_CACHE = os.getenv("JINJA_BYTECODE_CACHE", "on")
+
+# Password hashing and verification, in a process pool (see credentials.py)
+credentials = CredentialService()
+
+# Where the indexes are created (INDEX_CREATION): `startup` has every worker
+# create them before its first request; `deploy` leaves that to `python
+# library.py indexes` run at deploy time, and workers only check they exist.
+# Until the unique indexes booking relies on are in place, booking answers 503
+# and the check is retried at most every INDEX_RETRY_SECONDS.
+INDEX_CREATION = os.getenv("INDEX_CREATION", "startup").lower()
+INDEX_RETRY_SECONDS = float(os.getenv("INDEX_RETRY_SECONDS", "10"))
+
+# Raised by booking routes while the booking indexes are missing
+class BookingUnavailable(Exception):
+    pass
+
+# Create the indexes the queries rely on (declared in indexes.py). Conference
+# room reservations are stored one per document (run `python
+# migrate_reservations.py` once to move embedded reservations over) and one
+# reserved or borrowed book per student is enforced by a unique index.
+def ensure_indexes():
+    return apply_indexes(mongo.db)
+
+process_started_pid = None
+process_start_lock = threading.Lock()
+index_check = (None, 0.0)  # (pid, time.monotonic()) of the last check
 
-# Load MongoDB URI from .env
-try:
+# A forked worker must not inherit the lock held by a thread of its parent
+def reset_process_start_lock():
+    global process_start_lock
+    process_start_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=reset_process_start_lock)
+
+# Helper function to make sure the booking indexes exist (creating every index
+# first when INDEX_CREATION is `startup`); returns whether they do
+def prepare_indexes():
+    global index_check
+    index_check = (os.getpid(), time.monotonic())
+    try:
+        if INDEX_CREATION == "startup":
+            ensure_indexes()
+        missing = missing_booking_indexes(mongo.db)
+    except ConnectionFailure as e:
+        logger.error("Could not check the indexes, MongoDB is unreachable: %s", e)
+        return False
+    if missing:
+        logger.error("Booking is disabled until these indexes exist (run `python library.py indexes`): %s",
+                     ", ".join(missing))
+    return not missing
+
+# Per-process startup, run before the requests a worker serves (so after any
+# fork) until it succeeds: prepare the indexes and start the expiry scheduler.
+# The process only counts as started once the booking indexes exist; until
+# then the check is retried every INDEX_RETRY_SECONDS.
+def start_process():
+    global process_started_pid
+    if process_started_pid == os.getpid():
+        return
+    checked_pid, checked_at = index_check
+    if checked_pid == os.getpid() and time.monotonic() - checked_at < INDEX_RETRY_SECONDS:
+        return
+    if not process_start_lock.acquire(blocking=False):
+        return  # Another thread is preparing this process
+    try:
+        if process_started_pid == os.getpid() or not prepare_indexes():
+            return
+        if os.getenv("EXPIRY_SCHEDULER", "thread").lower() != "off":
+            expiry_scheduler.start()
+        process_started_pid = os.getpid()
+    finally:
+        process_start_lock.release()
+
+# Helper function for the routes that create or hand out reservations: raises
+# BookingUnavailable until this process has started (see start_process)
+def require_booking_indexes():
+    if process_started_pid != os.getpid():
+        raise BookingUnavailable()
+
+# Answer with a 503 instead of a stack trace while MongoDB is unreachable
+def database_unavailable(e):
+    logger.error("MongoDB unavailable: %s", e)
+    return "The library database is temporarily unavailable. Please try again shortly.", 503
+
+# Answer with a 503 while the booking indexes are missing
+def booking_unavailable(e):
+    return "Booking is temporarily unavailable while the library database is being prepared. Please try again shortly.", 503
+
+# Answer with a 503 when a burst of logins fills the password hashing pool
+def credential_service_busy(e):
+    logger.warning("Password hashing pool busy: %s", e)
+    return "Too many people are signing in right now. Please try again shortly.", 503
+
+# Configure the app for this process: settings, metrics, the MongoDB connection
+# settings and per-process startup. Nothing here touches the network; the client
+# connects on first use and /healthz reports whether MongoDB is reachable.
+def create_app(mongo_uri=None):
     load_dotenv()
-    print("Loaded .env file")
-    mongo_uri = os.getenv("MONGO_URI")
-    if not mongo_uri:
-        raise ValueError("MONGO_URI not found in .env file")
-    print(f"MONGO_URI: {mongo_uri}")
-except Exception as e:
-    print(f"Error loading MONGO_URI: {e}")
-    exit(1)
-
-# Connect to MongoDB
-try:
-    client = MongoClient(mongo_uri)
-    client.server_info()  # Test the connection
-    print("Connected to MongoDB successfully")
-except Exception as e:
-    print(f"Failed to connect to MongoDB: {e}")
-    exit(1)
-
-# Access database and collections
-try:
-    db = client.library
-    users_collection = db.users
-    books_collection = db.books
-    conference_rooms_collection = db.conference_rooms
-    print("Accessed database and collections")
-except Exception as e:
-    print(f"Error accessing database/collections: {e}")
-    exit(1)
-
-# Helper function to check and cancel expired book reservations (48 hours)
-def cancel_expired_book_reservations():
-    print("Checking for expired book reservations...")
-    expiration_threshold = datetime.utcnow() - timedelta(hours=48)
-    expired_books = books_collection.find({
-        "status": "reserved",
-        "reserved_at": {"$lt": expiration_threshold}
-    })
-    for book in expired_books:
-        print(f"Cancelling expired reservation for book: {book['title']}")
-        books_collection.update_one(
-            {"_id": book["_id"]},
-            {"$set": {"status": "available"}, "$unset": {"reserved_by": "", "reserved_at": ""}}
-        )
+    mongo.uri = mongo_uri or os.getenv("MONGO_URI")
+    if not mongo.uri:
+        raise RuntimeError("MONGO_URI is not set (add it to .env)")
+    if app.config.get("LIBRARY_CONFIGURED"):
+        return app
+    app.secret_key = 'your-very-long-and-random-secret-key-123456'  # Updated for security
+    register_template_filters(app)
+    if JINJA_BYTECODE_CACHE.lower() != "off":
+        from jinja2 import FileSystemBytecodeCache
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(
+            None if JINJA_BYTECODE_CACHE.lower() == "on" else JINJA_BYTECODE_CACHE)
+    instrumentation.init_app(app)
+    instrumentation.register_collector(expiry_collector)
+    instrumentation.register_collector(booking_collector)
+    instrumentation.register_collector(mongo.collect_metrics)
+    instrumentation.register_collector(cache.collect)
+    instrumentation.register_collector(credentials.collect)
+    instrumentation.register_collector(catalog_version.collect)
+    instrumentation.register_collector(availability_feed.collect)
+    app.before_request(start_process)
+    # after_request hooks run last registered first: pages get their ETag
+    # (and 304s their empty body) before being compressed
+    app.after_request(compress_response)
+    app.after_request(add_page_etag)
+    app.register_error_handler(ConnectionFailure, database_unavailable)
+    app.register_error_handler(CredentialServiceBusy, credential_service_busy)
+    app.register_error_handler(BookingUnavailable, booking_unavailable)
+    app.config["LIBRARY_CONFIGURED"] = True
+    logger.debug("Flask app initialized")
+    return app
+
+# Fields the book list templates need
+BOOK_LIST_PROJECTION = {"title": 1, "author": 1, "genre": 1, "total_copies": 1, "available_copies": 1}
 
 # Helper function to calculate remaining time for book reservation (48 hours)
 def calculate_remaining_time_book_reservation(reserved_at):
@@ -89,11 +287,11 @@ def calculate_remaining_time_book_reservation(reserved_at):
         "remaining_str": f"{days} days, {hours} hours, {minutes} minutes"
     }
 
-# Helper function to calculate remaining time and late fees for borrowing (7 days)
+# Helper function to calculate remaining time and late fees for borrowing (LOAN_DAYS days)
 def calculate_borrowing_info(borrowed_at):
     if not borrowed_at:
         return {"has_expired": True, "remaining_str": "Expired", "late_fee": 0}
-    borrowing_end = borrowed_at + timedelta(days=7)
+    borrowing_end = borrowed_at + timedelta(days=LOAN_DAYS)
     now = datetime.utcnow()
     remaining_time = borrowing_end - now
     if remaining_time.total_seconds() > 0:
@@ -110,71 +308,305 @@ def calculate_borrowing_info(borrowed_at):
         # Expired: calculate late fee
         overdue_time = now - borrowing_end
         overdue_days = overdue_time.days + (1 if overdue_time.seconds > 0 else 0)  # Round up to the next day
-        late_fee = overdue_days * 25  # 25 pesos per day
+        late_fee = overdue_days * LATE_FEE_PER_DAY  # pesos per day
         return {
             "has_expired": True,
             "remaining_str": "Overdue",
             "late_fee": late_fee
         }
 
-# Helper function to clean up expired conference room reservations
-def clean_expired_conference_reservations():
-    print("Cleaning up expired conference room reservations...")
-    now = datetime.utcnow()
-    rooms = conference_rooms_collection.find()
-    for room in rooms:
-        updated_reservations = [
-            res for res in room["reservations"]
-            if res["end_time"] > now
-        ]
-        conference_rooms_collection.update_one(
-            {"_id": room["_id"]},
-            {"$set": {"reservations": updated_reservations}}
-        )
-
 # Helper function to check if a student can reserve a conference room
 def can_student_reserve_conference_room(student_id):
-    rooms = conference_rooms_collection.find()
-    for room in rooms:
-        for res in room["reservations"]:
-            if res["reserved_by"] == student_id:
-                return False  # Student already has a reservation
-    return True
-
-# Helper function to find the next available time slot for a conference room
-def find_next_available_slot(room, reservation_date_str):
+    return not student_has_active_reservation(conference_reservations_collection, student_id, datetime.utcnow())
+
+# Helper function to find the next available time slot for a conference room,
+# given that room's reservations. Only gaps long enough for a full slot count.
+def find_next_available_slot(room_reservations, reservation_date_str, duration=SLOT_DURATION):
     reservation_date = datetime.strptime(reservation_date_str, "%Y-%m-%d").date()
-    reservations = sorted(
-        [res for res in room["reservations"] if res["date"] == reservation_date_str],
-        key=lambda x: x["start_time"]
+    schedule = DaySchedule.from_reservations(
+        reservation_date,
+        [res for res in room_reservations if res["date"] == reservation_date_str]
     )
+    return schedule.next_free_slot(duration, not_before=datetime.utcnow())
+
+# Helper function to get a user record (without the password hash), cached
+def get_user(id_number):
+    return cache.get_or_load(f"user:{id_number}",
+                             lambda: users_collection.find_one(user_query(id_number), {"password": 0}))
+
+# Helper function to get the students for the reservation form dropdown, cached
+def get_students():
+    return cache.get_or_load("students", lambda: list(users_collection.find(students_query(), {"IDNumber": 1})))
+
+# Helper function to drop a user's cached records after a change
+def invalidate_user(id_number):
+    cache.delete(f"user:{id_number}", "students")
+
+# Helper function to get books (the list fields) by id, in the order of the ids,
+# reading the cache first and MongoDB only for the misses
+def get_books(book_ids):
+    cached = cache.get_many([book_cache_key(book_id) for book_id in book_ids])
+    books = {book["_id"]: book for book in cached.values()}
+    missing = [book_id for book_id in book_ids if book_id not in books]
+    if missing:
+        fetched = list(books_collection.find(books_by_id_query(missing), BOOK_LIST_PROJECTION))
+        cache.set_many({book_cache_key(book["_id"]): book for book in fetched}, BOOK_CACHE_TTL)
+        books.update((book["_id"], book) for book in fetched)
+    return [books[book_id] for book_id in book_ids if book_id in books]
+
+# Helper function to drop books from the cache after they were changed, and
+# record the change in the catalog version
+def invalidate_books(*book_ids):
+    cache.delete(*[book_cache_key(book_id) for book_id in book_ids])
+    catalog_version.bump()
+
+# Helper function to build the cache key of a rendered catalog fragment for the
+# current catalog version; `params` are whatever the fragment depends on
+# besides the catalog (search, genre, page...)
+def fragment_key(name, params):
+    version, _ = catalog_version.current()
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    return f"fragment:{name}:{version}:{digest}"
+
+# Helper function to get the conference room status at `now`. The rooms'
+# unfinished reservations are cached for ROOM_STATUS_CACHE_TTL seconds and the
+# status is worked out from them on every call, so it is never out of date.
+def get_room_statuses(now, upcoming_date=None):
+    room_reservations = cache.get_or_load(
+        "room_status",
+        lambda: get_room_reservations(conference_rooms_collection, conference_reservations_collection, now),
+        ROOM_STATUS_CACHE_TTL)
+    return room_statuses_at(room_reservations, now, upcoming_date)
+
+# Same as get_room_statuses, loading the reservations with the async client
+async def get_room_statuses_async(adb, now, upcoming_date=None):
+    import asyncio
     
-    # Start time must be between 8:00 AM and 6:00 PM
-    start_of_day = datetime.combine(reservation_date, datetime.min.time()) + timedelta(hours=8)
-    end_of_day = datetime.combine(reservation_date, datetime.min.time()) + timedelta(hours=18)
+    room_reservations = await asyncio.to_thread(cache.get, "room_status")
+    if room_reservations is None:
+        room_reservations = await get_room_reservations_async(adb.conference_rooms, adb.conference_reservations, now)
+        await asyncio.to_thread(cache.set, "room_status", room_reservations, ROOM_STATUS_CACHE_TTL)
+    return room_statuses_at(room_reservations, now, upcoming_date)
+
+# Helper function to drop the cached room status after a reservation changed
+def invalidate_room_status():
+    cache.delete("room_status")
+
+# Helper function to get the room status pushed to live update subscribers:
+# [{room_id, in_use_by, until}]. Called after a reservation changed, possibly
+# in another worker, so the cached reservations are dropped first.
+def live_room_statuses():
+    invalidate_room_status()
+    return [
+        {"room_id": status["room_id"],
+         "in_use_by": status["current"]["reserved_by"] if status["current"] else None,
+         "until": format_clock(status["current"]["end_time"]) if status["current"] else None}
+        for status in get_room_statuses(datetime.utcnow())
+    ]
+
+# Pushes book and room availability changes to the student dashboards (/events)
+availability_feed = AvailabilityFeed(lambda: mongo.db, live_room_statuses)
+
+# Helper function to add remaining time or late fee info to reserved and borrowed copies (holds)
+def add_timing_info(holds):
+    for hold in holds:
+        if hold["status"] == "reserved":
+            hold["timing_info"] = calculate_remaining_time_book_reservation(hold.get("reserved_at"))
+        elif hold["status"] == "borrowed":
+            hold["timing_info"] = calculate_borrowing_info(hold.get("borrowed_at"))
+
+# Helper function to run a catalog search. A search is a single index lookup
+# that feeds both the suggestions and one page of results.
+def search_catalog(search_query, selected_genre, after, before, page_size):
+    results = search_index.search(search_query, genre=selected_genre or None)
+    return results[:5], ranked_page(results, after, before, page_size)
+
+# Helper function to get the waitlist entry of a student with their place in
+# line (None past WAITLIST_POSITION_LIMIT), or None if they are not waiting
+def get_student_waitlist(student_id):
+    entry = get_waitlist_entry(waitlist_collection, student_id)
+    if entry:
+        entry["position"] = waitlist_position(waitlist_collection, entry)
+    return entry
+
+# Helper function to describe a student's place on a waitlist in a message
+def waitlist_place_text(entry):
+    position = waitlist_position(waitlist_collection, entry)
+    if position is None:
+        return f"behind more than {WAITLIST_POSITION_LIMIT} students"
+    return f"number {position}"
+
+# Helper function to turn the dashboard query results into the template context
+def build_dashboard_context(books_page, books, suggestions, student_books, genre_counts,
+                            conference_room_statuses, can_reserve, tomorrow_str, now, waitlist_entry=None):
+    add_timing_info(student_books)
     
-    # If no reservations, start at 8:00 AM
-    if not reservations:
-        return start_of_day
+    # Offer tomorrow's next slot if the student can reserve
+    if can_reserve:
+        for status in conference_room_statuses:
+            next_slot = find_next_available_slot(status["reservations"], tomorrow_str)
+            if next_slot:
+                status["next_available_slot"] = next_slot
+                status["next_slot_end"] = next_slot + SLOT_DURATION
     
-    # Find the next available slot
-    last_end_time = start_of_day
-    for res in reservations:
-        if res["start_time"] > last_end_time:
-            return last_end_time
-        last_end_time = max(last_end_time, res["end_time"])
+    return {
+        "books": books,
+        "books_page": books_page,
+        "student_books": student_books,
+        "waitlist_entry": waitlist_entry,
+        "waitlist_position_limit": WAITLIST_POSITION_LIMIT,
+        "suggestions": suggestions,
+        "genres": sorted(genre_counts),
+        "genre_counts": genre_counts,
+        "conference_room_statuses": conference_room_statuses,
+        "tomorrow_date": tomorrow_str,
+        "live_updates": LIVE_UPDATES
+    }
+
+# Helper function to load the student dashboard: one page of books (searched,
+# or paged by _id; skipped when the book table is cached), the student's
+# books, genre counts and room statuses
+def load_dashboard(student_id, search_query, selected_genre, after, before, page_size, now, load_books=True):
+    suggestions = []
+    books_page = None
+    books = []
+    if load_books and search_query:
+        suggestions, books_page = search_catalog(search_query, selected_genre, after, before, page_size)
+        books = get_books([res["_id"] for res in books_page.items])
+    elif load_books:
+        books_page = keyset_page(books_collection, genre_query(selected_genre), after, before, page_size,
+                                 BOOK_LIST_PROJECTION)
+        books = books_page.items
+    student_books = list(holds_collection.find(student_holds_query(student_id, book_reservation_threshold(now))))
+    genre_counts = genre_catalog.counts()
+    tomorrow_str = (now + timedelta(days=1)).strftime("%Y-%m-%d")
+    conference_room_statuses = get_room_statuses(now, upcoming_date=tomorrow_str)
+    can_reserve = not student_has_active_reservation(conference_reservations_collection, student_id, now)
+    waitlist_entry = get_student_waitlist(student_id)
+    return build_dashboard_context(books_page, books, suggestions, student_books, genre_counts,
+                                   conference_room_statuses, can_reserve, tomorrow_str, now, waitlist_entry)
+
+# Same as load_dashboard, with the independent queries running concurrently.
+# The in-process search index and genre cache are consulted in a thread, as
+# they may need to reload from MongoDB.
+async def load_dashboard_async(student_id, search_query, selected_genre, after, before, page_size, now,
+                               load_books=True):
+    import asyncio
+    
+    adb = get_async_db()
+    tomorrow_str = (now + timedelta(days=1)).strftime("%Y-%m-%d")
     
-    # If there's space after the last reservation
-    if last_end_time < end_of_day:
-        # Ensure there's enough time for a 1.5-hour slot
-        if (end_of_day - last_end_time).total_seconds() >= 1.5 * 3600:
-            return last_end_time
+    async def fetch_books():
+        if not load_books:
+            return None, [], []
+        if search_query:
+            suggestions, books_page = await asyncio.to_thread(
+                search_catalog, search_query, selected_genre, after, before, page_size)
+            books = await asyncio.to_thread(get_books, [res["_id"] for res in books_page.items])
+            return books_page, books, suggestions
+        books_page = await keyset_page_async(adb.books, genre_query(selected_genre), after, before, page_size,
+                                             BOOK_LIST_PROJECTION)
+        return books_page, books_page.items, []
     
-    return None  # No available slot
+    (books_page, books, suggestions), student_books, genre_counts, conference_room_statuses, has_reservation, waitlist_entry = await asyncio.gather(
+        fetch_books(),
+        adb.book_holds.find(student_holds_query(student_id, book_reservation_threshold(now))).to_list(None),
+        asyncio.to_thread(genre_catalog.counts),
+        get_room_statuses_async(adb, now, upcoming_date=tomorrow_str),
+        student_has_active_reservation_async(adb.conference_reservations, student_id, now),
+        asyncio.to_thread(get_student_waitlist, student_id)
+    )
+    return build_dashboard_context(books_page, books, suggestions, student_books, genre_counts,
+                                   conference_room_statuses, not has_reservation, tomorrow_str, now, waitlist_entry)
+
+# Book fields the JSON API can return (`?fields=title,author`); the id is always included
+API_BOOK_FIELDS = ("title", "author", "genre", "available_copies", "total_copies")
+# Fields only MongoDB has; the search index keeps title, author and genre
+API_COUNTER_FIELDS = ("available_copies", "total_copies")
+MAX_SUGGESTIONS = int(os.getenv("MAX_SUGGESTIONS", "10"))
+
+# Helper function to read the requested API fields, ignoring unknown ones
+def get_api_fields(args):
+    requested = [field.strip() for field in args.get("fields", "").split(",") if field.strip()]
+    return [field for field in API_BOOK_FIELDS if field in requested] or list(API_BOOK_FIELDS)
+
+# Helper function to turn a book into its JSON representation
+def book_json(book, fields):
+    data = {"id": str(book["_id"])}
+    for field in fields:
+        data[field] = book.get(field)
+    return data
+
+# Search the catalog without rendering the dashboard. With `q`, results come
+# from the in-process search index (ranked, `cursor` is an offset); without it
+# the catalog is paged by _id. Only the copy counters need MongoDB for search
+# results.
+@app.route("/api/books/search")
+def api_search_books():
+    if "user" not in session:
+        return jsonify({"error": "login required"}), 401
+    search_query = request.args.get("q", "").strip()
+    genre = request.args.get("genre", "")
+    fields = get_api_fields(request.args)
+    limit = get_page_size(request.args, "limit")
+    cursor = request.args.get("cursor")
+    
+    # The results only change with the catalog, so a client holding the
+    # current version's copy gets a 304 without a search
+    version, updated_at = catalog_version.current()
+    etag = f"catalog-{version}"
+    unchanged = not_modified(etag, updated_at)
+    if unchanged:
+        return unchanged
+    
+    if search_query:
+        page = ranked_page(search_index.search(search_query, genre=genre or None), cursor, None, limit)
+        counters = any(field in API_COUNTER_FIELDS for field in fields)
+        books = get_books([book["_id"] for book in page.items]) if counters else page.items
+    else:
+        projection = dict.fromkeys(fields, 1)
+        page = keyset_page(books_collection, genre_query(genre), cursor, None, limit, projection)
+        books = page.items
+    return set_validators(jsonify({
+        "books": [book_json(book, fields) for book in books],
+        "next_cursor": page.next_cursor
+    }), etag, updated_at)
+
+# Typeahead suggestions for the dashboard search box, answered from the
+# in-process search index alone
+@app.route("/api/books/suggest")
+def api_suggest_books():
+    if "user" not in session:
+        return jsonify({"error": "login required"}), 401
+    search_query = request.args.get("q", "").strip()
+    genre = request.args.get("genre", "")
+    limit = get_page_size(request.args, "limit", default=5, maximum=MAX_SUGGESTIONS)
+    suggestions = search_index.search(search_query, genre=genre or None, limit=limit) if search_query else []
+    response = jsonify({
+        "query": search_query,
+        "suggestions": [book_json(book, ("title", "author", "genre")) for book in suggestions]
+    })
+    response.cache_control.private = True
+    response.cache_control.max_age = 30
+    return response
+
+# Server-Sent Events stream of availability changes (see live_updates.py),
+# so students see books and rooms free up without reloading the dashboard
+@app.route("/events")
+def live_events():
+    if "user" not in session:
+        return jsonify({"error": "login required"}), 401
+    if not LIVE_UPDATES:
+        return jsonify({"error": "live updates are disabled"}), 404
+    try:
+        subscription = availability_feed.subscribe()
+    except (TooManySubscribers, LiveUpdatesUnavailable) as e:
+        return jsonify({"error": str(e)}), 503
+    return Response(availability_feed.stream(subscription), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/")
 def index():
-    print("Accessing / route")
     if "user" in session:
         if session["user"].get("is_admin", False):
             return redirect(url_for("admin_dashboard"))
@@ -183,7 +615,6 @@ def index():
 
 @app.route("/register", methods=["GET", "POST"])
 def register():
-    print("Accessing /register route")
     if request.method == "POST":
         IDNumber = request.form["IDNumber"].strip()
         password = request.form["password"].strip()
@@ -198,18 +629,19 @@ def register():
             return render_template("register.html")
         
         # Check if IDNumber already exists
-        existing_user = users_collection.find_one({"IDNumber": IDNumber})
+        existing_user = get_user(IDNumber)
         if existing_user:
             flash("IDNumber already exists", "danger")
             return render_template("register.html")
         
         # Hash the password and create a new student user (not admin)
-        hashed_password = generate_password_hash(password)
+        hashed_password = credentials.hash(password)
         users_collection.insert_one({
             "IDNumber": IDNumber,
             "password": hashed_password,
             "is_admin": False
         })
+        invalidate_user(IDNumber)
         flash("Registration successful! Please log in.", "success")
         return redirect(url_for("login"))
     
@@ -217,15 +649,19 @@ def register():
 
 @app.route("/login", methods=["GET", "POST"])
 def login():
-    print("Accessing /login route")
     if request.method == "POST":
         IDNumber = request.form["IDNumber"].strip()
         password = request.form["password"].strip()
         if not IDNumber or not password:
             flash("IDNumber and password are required", "danger")
             return render_template("login.html")
-        user = users_collection.find_one({"IDNumber": IDNumber})
-        if user and check_password_hash(user["password"], password):
+        user = users_collection.find_one(user_query(IDNumber))
+        valid, new_hash = credentials.verify_and_rehash(user["password"], password) if user else (False, None)
+        if valid:
+            # Store the hash again when the hashing parameters have changed
+            if new_hash:
+                users_collection.update_one({"_id": user["_id"], "password": user["password"]},
+                                            {"$set": {"password": new_hash}})
             session["user"] = {
                 "IDNumber": user["IDNumber"],
                 "is_admin": user.get("is_admin", False)
@@ -240,211 +676,126 @@ def login():
 
 @app.route("/logout")
 def logout():
-    print("Accessing /logout route")
     session.pop("user", None)
     flash("Logged out successfully", "success")
     return redirect(url_for("index"))
 
 @app.route("/dashboard")
 def dashboard():
-    print("Accessing /dashboard route")
     if "user" not in session:
         flash("Please log in to access the dashboard", "danger")
         return redirect(url_for("login"))
     if session["user"].get("is_admin", False):
         return redirect(url_for("admin_dashboard"))
     
-    # Check for expired reservations
-    cancel_expired_book_reservations()
-    clean_expired_conference_reservations()
-    
     # Get search query
     search_query = request.args.get("search", "").lower()
     selected_genre = request.args.get("genre", "")
     
-    # Fetch suggestions for the choices bar (limit to 5)
-    suggestions = []
-    if search_query:
-        suggestions_cursor = books_collection.find({
-            "$or": [
-                {"title": {"$regex": search_query, "$options": "i"}},
-                {"author": {"$regex": search_query, "$options": "i"}},
-                {"genre": {"$regex": search_query, "$options": "i"}}
-            ]
-        }).limit(5)
-        suggestions = list(suggestions_cursor)
-    
-    # Fetch books based on search query and selected genre
-    query = {}
-    if search_query:
-        query["$or"] = [
-            {"title": {"$regex": search_query, "$options": "i"}},
-            {"author": {"$regex": search_query, "$options": "i"}},
-            {"genre": {"$regex": search_query, "$options": "i"}}
-        ]
-    if selected_genre:
-        query["genre"] = selected_genre
-    
-    books_cursor = books_collection.find(query) if query else books_collection.find()
-    books = list(books_cursor)
-    
-    # Fetch reserved or borrowed books for the student
-    student_books = list(books_collection.find({
-        "$or": [
-            {"status": "reserved", "reserved_by": session["user"]["IDNumber"]},
-            {"status": "borrowed", "reserved_by": session["user"]["IDNumber"]}
-        ]
-    }))
-    
-    # Add timing info to each book
-    for book in student_books:
-        if book["status"] == "reserved":
-            book["timing_info"] = calculate_remaining_time_book_reservation(book.get("reserved_at"))
-        elif book["status"] == "borrowed":
-            book["timing_info"] = calculate_borrowing_info(book.get("borrowed_at"))
-    
-    # Fetch all unique genres for the dropdown
-    genres = sorted(list(set(book.get("genre", "Unknown") for book in books_collection.find())))
+    page_size = get_page_size(request.args)
+    after = request.args.get("after")
+    before = request.args.get("before")
     
-    # Fetch conference rooms and their reservations
-    conference_rooms = list(conference_rooms_collection.find())
-    now = datetime.utcnow()
-    tomorrow = (now + timedelta(days=1)).date()
-    tomorrow_str = tomorrow.strftime("%Y-%m-%d")
-    
-    # Prepare conference room statuses
-    conference_room_statuses = []
-    for room in conference_rooms:
-        status = {
-            "room_id": str(room["_id"]),
-            "room_name": room["room_name"],
-            "current_status": "Available",
-            "reservations": []
+    # The book table (and the suggestions that go with a search) is the same
+    # for every student, so it is rendered once per catalog version
+    books_key = fragment_key("dashboard-books", [search_query, selected_genre, after, before, page_size])
+    books_fragment = cache.get(books_key)
+    load_args = (session["user"]["IDNumber"], search_query, selected_genre, after, before, page_size, datetime.utcnow(),
+                 books_fragment is None)
+    if VIEW_MODE == "async":
+        dashboard_data = event_loop.run(with_request_stats(load_dashboard_async(*load_args)))
+    else:
+        dashboard_data = load_dashboard(*load_args)
+    if books_fragment is None:
+        books_fragment = {
+            "html": render_template("_book_table.html", books=dashboard_data["books"],
+                                    books_page=dashboard_data["books_page"], search_query=search_query,
+                                    selected_genre=selected_genre),
+            "suggestions": dashboard_data["suggestions"]
         }
-        
-        # Check current and upcoming reservations
-        for res in room["reservations"]:
-            start_time = res["start_time"]
-            end_time = res["end_time"]
-            res_date = datetime.strptime(res["date"], "%Y-%m-%d").date()
-            
-            # Format the time for display
-            start_str = start_time.strftime("%I:%M %p").lstrip("0")
-            end_str = end_time.strftime("%I:%M %p").lstrip("0")
-            date_str = start_time.strftime("%B %d, %Y")
-            
-            if now >= start_time and now <= end_time:
-                status["current_status"] = f"Currently in use by {res['reserved_by']} until {end_str}"
-            elif res_date == tomorrow:
-                status["reservations"].append({
-                    "reserved_by": res["reserved_by"],
-                    "time_frame": f"{date_str}, {start_str} - {end_str}",
-                    "start_time": start_time,
-                    "end_time": end_time
-                })
-        
-        # Sort reservations by start time
-        status["reservations"].sort(key=lambda x: x["start_time"])
-        
-        # Check if the student can reserve this room for tomorrow
-        can_reserve = can_student_reserve_conference_room(session["user"]["IDNumber"])
-        if can_reserve:
-            next_slot = find_next_available_slot(room, tomorrow_str)
-            if next_slot:
-                status["next_available_slot"] = next_slot
-                status["next_slot_str"] = next_slot.strftime("%I:%M %p").lstrip("0")
-                status["next_slot_end"] = (next_slot + timedelta(hours=1, minutes=30)).strftime("%I:%M %p").lstrip("0")
-        
-        conference_room_statuses.append(status)
+        cache.set(books_key, books_fragment, FRAGMENT_CACHE_TTL)
+    dashboard_data["suggestions"] = books_fragment["suggestions"]
     
     return render_template("dashboard.html", 
-                         books=books, 
-                         student_books=student_books, 
                          user=session["user"], 
-                         suggestions=suggestions, 
                          search_query=search_query, 
                          selected_genre=selected_genre, 
-                         genres=genres,
-                         conference_room_statuses=conference_room_statuses,
-                         tomorrow_date=tomorrow_str)
+                         books_html=Markup(books_fragment["html"]),
+                         **dashboard_data)
 
 @app.route("/reserve/<book_id>", methods=["POST"])
 def reserve_book(book_id):
-    print(f"Accessing /reserve/{book_id} route")
     if "user" not in session:
         flash("Please log in to reserve a book", "danger")
         return redirect(url_for("login"))
     if session["user"].get("is_admin", False):
         return redirect(url_for("admin_dashboard"))
+    require_booking_indexes()
     
-    # Check for expired reservations
-    cancel_expired_book_reservations()
-    
-    # Check if the student already has a reserved or borrowed book
-    existing_book = books_collection.find_one({
-        "$or": [
-            {"status": "reserved", "reserved_by": session["user"]["IDNumber"]},
-            {"status": "borrowed", "reserved_by": session["user"]["IDNumber"]}
-        ]
-    })
-    if existing_book:
-        # Add timing info for the error display
-        if existing_book["status"] == "reserved":
-            existing_book["timing_info"] = calculate_remaining_time_book_reservation(existing_book.get("reserved_at"))
-        elif existing_book["status"] == "borrowed":
-            existing_book["timing_info"] = calculate_borrowing_info(existing_book.get("borrowed_at"))
-        books = list(books_collection.find())
+    # Take a copy with one conditional write; the unique student_id index on
+    # the holds enforces one reserved or borrowed book per student. With every
+    # copy out, the student joins the title's waitlist instead.
+    student_id = session["user"]["IDNumber"]
+    outcome = reserve_book_atomically(books_collection, holds_collection, ObjectId(book_id), student_id,
+                                      waitlist_collection=waitlist_collection)
+    entry = None
+    if outcome == UNAVAILABLE:
+        outcome, entry = join_book_waitlist(books_collection, holds_collection, waitlist_collection,
+                                            ObjectId(book_id), student_id)
+    if outcome == RESERVED:
+        # Only a copy taken changes what the catalog shows
+        invalidate_books(ObjectId(book_id))
+    if outcome == ALREADY_HOLDING:
+        # The dashboard lists the student's current book alongside this message
         flash("You can only reserve or borrow one book at a time.", "danger")
-        return render_template("dashboard.html", 
-                             books=books, 
-                             student_books=[existing_book], 
-                             user=session["user"])
-    
-    # Reserve the book
-    books_collection.update_one(
-        {"_id": ObjectId(book_id), "status": "available"},
-        {"$set": {
-            "status": "reserved",
-            "reserved_by": session["user"]["IDNumber"],
-            "reserved_at": datetime.utcnow()
-        }}
-    )
-    flash("Book reserved successfully!", "success")
+    elif outcome == UNAVAILABLE:
+        flash("This book is no longer in the catalog.", "danger")
+    elif outcome == QUEUED:
+        flash(f"All copies are out. You are {waitlist_place_text(entry)} on the waitlist; "
+              f"the next copy returned will be reserved for you.", "info")
+    elif outcome == ALREADY_QUEUED:
+        flash(f"You are already on the waitlist for {entry['title']} "
+              f"({waitlist_place_text(entry)}).", "info")
+    else:
+        flash("Book reserved successfully!", "success")
     return redirect(url_for("dashboard"))
 
 @app.route("/cancel_reservation/<book_id>", methods=["POST"])
 def cancel_book_reservation(book_id):
-    print(f"Accessing /cancel_reservation/{book_id} route")
     if "user" not in session:
         flash("Please log in to cancel a reservation", "danger")
         return redirect(url_for("login"))
     if session["user"].get("is_admin", False):
         return redirect(url_for("admin_dashboard"))
+    require_booking_indexes()
     
-    # Cancel the reservation
-    books_collection.update_one(
-        {"_id": ObjectId(book_id), "reserved_by": session["user"]["IDNumber"], "status": "reserved"},
-        {"$set": {"status": "available"}, "$unset": {"reserved_by": "", "reserved_at": ""}}
-    )
+    # Cancel the reservation, putting the copy back
+    if cancel_hold(books_collection, holds_collection, ObjectId(book_id), session["user"]["IDNumber"],
+                   waitlist_collection):
+        invalidate_books(ObjectId(book_id))
     flash("Book reservation cancelled successfully!", "success")
     return redirect(url_for("dashboard"))
 
+@app.route("/leave_waitlist/<book_id>", methods=["POST"])
+def leave_book_waitlist(book_id):
+    if "user" not in session:
+        flash("Please log in to leave a waitlist", "danger")
+        return redirect(url_for("login"))
+    if session["user"].get("is_admin", False):
+        return redirect(url_for("admin_dashboard"))
+    
+    if leave_waitlist(waitlist_collection, ObjectId(book_id), session["user"]["IDNumber"]):
+        flash("You left the waitlist.", "success")
+    return redirect(url_for("dashboard"))
+
 @app.route("/reserve_conference_room/<room_id>", methods=["POST"])
 def reserve_conference_room(room_id):
-    print(f"Accessing /reserve_conference_room/{room_id} route")
     if "user" not in session:
         flash("Please log in to reserve a conference room", "danger")
         return redirect(url_for("login"))
     if session["user"].get("is_admin", False):
         return redirect(url_for("admin_dashboard"))
-    
-    # Clean up expired reservations
-    clean_expired_conference_reservations()
-    
-    # Check if the student already has a conference room reservation
-    if not can_student_reserve_conference_room(session["user"]["IDNumber"]):
-        flash("You can only reserve one conference room at a time.", "danger")
-        return redirect(url_for("dashboard"))
+    require_booking_indexes()
     
     # Get the reservation date (should be tomorrow)
     reservation_date_str = request.form.get("reservation_date")
@@ -462,38 +813,30 @@ def reserve_conference_room(room_id):
         return redirect(url_for("dashboard"))
     
     # Find the room
-    room = conference_rooms_collection.find_one({"_id": ObjectId(room_id)})
+    room = conference_rooms_collection.find_one({"_id": ObjectId(room_id)}, {"room_name": 1})
     if not room:
         flash("Conference room not found", "danger")
         return redirect(url_for("dashboard"))
     
-    # Find the next available slot
-    start_time = find_next_available_slot(room, reservation_date_str)
-    if not start_time:
+    # Book the next available slot. The insert is guarded by unique indexes, so
+    # a concurrent booking of the same slot (or a second room for the student)
+    # is rejected by the database and the next slot is tried instead.
+    outcome, start_time = book_next_room_slot(conference_reservations_collection, room["_id"],
+                                              session["user"]["IDNumber"], reservation_date, SLOT_DURATION, now)
+    if outcome == ALREADY_HOLDING:
+        flash("You can only reserve one conference room at a time.", "danger")
+        return redirect(url_for("dashboard"))
+    if outcome == UNAVAILABLE:
         flash(f"No available slots for {room['room_name']} on {reservation_date_str}.", "danger")
         return redirect(url_for("dashboard"))
     
-    # Create the reservation
-    end_time = start_time + timedelta(hours=1, minutes=30)
-    reservation = {
-        "reserved_by": session["user"]["IDNumber"],
-        "date": reservation_date_str,
-        "start_time": start_time,
-        "end_time": end_time
-    }
-    
-    # Add the reservation to the room
-    conference_rooms_collection.update_one(
-        {"_id": ObjectId(room_id)},
-        {"$push": {"reservations": reservation}}
-    )
-    
-    flash(f"Successfully reserved {room['room_name']} for {reservation_date_str} from {start_time.strftime('%I:%M %p').lstrip('0')} to {end_time.strftime('%I:%M %p').lstrip('0')}.", "success")
+    invalidate_room_status()
+    end_time = start_time + SLOT_DURATION
+    flash(f"Successfully reserved {room['room_name']} for {reservation_date_str} from {format_clock(start_time)} to {format_clock(end_time)}.", "success")
     return redirect(url_for("dashboard"))
 
 @app.route("/cancel_conference_reservation/<room_id>", methods=["POST"])
 def cancel_conference_reservation(room_id):
-    print(f"Accessing /cancel_conference_reservation/{room_id} route")
     if "user" not in session:
         flash("Please log in to cancel a reservation", "danger")
         return redirect(url_for("login"))
@@ -501,167 +844,272 @@ def cancel_conference_reservation(room_id):
         return redirect(url_for("admin_dashboard"))
     
     # Find the room
-    room = conference_rooms_collection.find_one({"_id": ObjectId(room_id)})
+    room = conference_rooms_collection.find_one({"_id": ObjectId(room_id)}, {"room_name": 1})
     if not room:
         flash("Conference room not found", "danger")
         return redirect(url_for("dashboard"))
     
-    # Find and remove the student's reservation
-    updated_reservations = [
-        res for res in room["reservations"]
-        if res["reserved_by"] != session["user"]["IDNumber"]
-    ]
-    
-    conference_rooms_collection.update_one(
-        {"_id": ObjectId(room_id)},
-        {"$set": {"reservations": updated_reservations}}
-    )
+    # Remove the student's reservation
+    cancel_reservations(conference_reservations_collection, room["_id"], session["user"]["IDNumber"])
+    invalidate_room_status()
     
     flash(f"Successfully cancelled your reservation for {room['room_name']}.", "success")
     return redirect(url_for("dashboard"))
 
+# Views of the Active Books tab, and the orders the loan views can be sorted
+# in: (field, direction), each served by an index on the open loans
+ACTIVE_BOOK_VIEWS = ("loans", "overdue", "reserved", "balances")
+LOAN_SORTS = {"due": ("due_at", 1), "fee": ("fee", -1)}
+
 @app.route("/admin/dashboard")
 def admin_dashboard():
-    print("Accessing /admin/dashboard route")
     if "user" not in session or not session["user"].get("is_admin", False):
         flash("You must be an admin to access this page", "danger")
         return redirect(url_for("login"))
     
-    # Check for expired reservations
-    cancel_expired_book_reservations()
-    clean_expired_conference_reservations()
-    
     # Get the active tab from the query parameter (default to 'manage-books')
     active_tab = request.args.get("tab", "manage-books")
-    
-    # Fetch all books
-    books = list(books_collection.find())
-    
-    # Fetch all students (users with is_admin: False)
-    students = list(users_collection.find({"is_admin": False}))
-    
-    # Fetch all reserved or borrowed books
-    active_books = list(books_collection.find({"status": {"$in": ["reserved", "borrowed"]}}))
-    
-    # Add timing info to each book
-    for book in active_books:
-        if book["status"] == "reserved":
-            book["timing_info"] = calculate_remaining_time_book_reservation(book.get("reserved_at"))
-        elif book["status"] == "borrowed":
-            book["timing_info"] = calculate_borrowing_info(book.get("borrowed_at"))
-    
-    # Fetch conference rooms and their reservations
-    conference_rooms = list(conference_rooms_collection.find())
+    page_size = get_page_size(request.args)
+    after = request.args.get("after")
+    before = request.args.get("before")
     now = datetime.utcnow()
+    
+    # Only load the data (one page of it) for the tab being shown
+    page = None
+    books_html = None
+    students = []
+    active_books = []
+    loans = []
+    balances = []
+    overdue = None
+    show = request.args.get("show", "loans")
+    if show not in ACTIVE_BOOK_VIEWS:
+        show = "loans"
+    sort = request.args.get("sort", "due")
+    if sort not in LOAN_SORTS:
+        sort = "due"
     conference_room_statuses = []
-    for room in conference_rooms:
-        status = {
-            "room_id": str(room["_id"]),
-            "room_name": room["room_name"],
-            "current_status": "Available",
-            "reservations": []
-        }
-        
-        # Check current and upcoming reservations
-        for res in room["reservations"]:
-            start_time = res["start_time"]
-            end_time = res["end_time"]
-            
-            # Format the time for display
-            start_str = start_time.strftime("%I:%M %p").lstrip("0")
-            end_str = end_time.strftime("%I:%M %p").lstrip("0")
-            date_str = start_time.strftime("%B %d, %Y")
-            
-            if now >= start_time and now <= end_time:
-                status["current_status"] = f"Currently in use by {res['reserved_by']} until {end_str}"
-            else:
-                status["reservations"].append({
-                    "reserved_by": res["reserved_by"],
-                    "time_frame": f"{date_str}, {start_str} - {end_str}",
-                    "start_time": start_time,
-                    "end_time": end_time
-                })
-        
-        # Sort reservations by start time
-        status["reservations"].sort(key=lambda x: x["start_time"])
-        
-        conference_room_statuses.append(status)
+    if active_tab == "manage-books":
+        # The book table is rendered once per catalog version and page
+        books_key = fragment_key("manage-books", [after, before, page_size])
+        books_fragment = cache.get(books_key)
+        if books_fragment is None:
+            page = keyset_page(books_collection, genre_query(None), after, before, page_size, BOOK_LIST_PROJECTION)
+            books_fragment = {"html": render_template("_manage_books_table.html", books=page.items, page=page,
+                                                      active_tab=active_tab)}
+            cache.set(books_key, books_fragment, FRAGMENT_CACHE_TTL)
+        books_html = Markup(books_fragment["html"])
+    elif active_tab == "students":
+        # Students are users with is_admin: False
+        page = keyset_page(users_collection, students_query(), after, before, page_size, {"IDNumber": 1})
+        students = page.items
+    elif active_tab == "active-books" and show == "reserved":
+        # Reserved (and not lapsed) copies, waiting to be picked up
+        page = keyset_page(holds_collection, reserved_holds_query(book_reservation_threshold(now)),
+                           after, before, page_size)
+        active_books = page.items
+        add_timing_info(active_books)
+    elif active_tab == "active-books" and show == "balances":
+        page = ranked_page(fee_balances(loans_collection), after, before, page_size)
+        balances = page.items
+    elif active_tab == "active-books":
+        # Borrowed books from the loans ledger, with the late fees accrued by
+        # the expiry sweep, sorted and paged by MongoDB
+        field, order = LOAN_SORTS[sort]
+        query = overdue_loans_query(now) if show == "overdue" else open_loans_query()
+        page = sorted_keyset_page(loans_collection, query, field, order, after, before, page_size)
+        loans = page.items
+        overdue = overdue_summary(loans_collection, now)
+    elif active_tab == "conference-rooms":
+        conference_room_statuses = get_room_statuses(now)
     
     return render_template("admin_dashboard.html", 
-                         books=books, 
+                         books_html=books_html, 
                          students=students, 
                          active_books=active_books, 
+                         loans=loans,
+                         balances=balances,
+                         overdue=overdue,
+                         show=show,
+                         sort=sort,
+                         now=now,
                          conference_room_statuses=conference_room_statuses,
+                         page=page,
                          user=session["user"], 
                          active_tab=active_tab)
 
-@app.route("/admin/mark_borrowed/<book_id>", methods=["POST"])
-def mark_borrowed(book_id):
-    print(f"Accessing /admin/mark_borrowed/{book_id} route")
+@app.route("/admin/mark_borrowed/<hold_id>", methods=["POST"])
+def mark_borrowed(hold_id):
     if "user" not in session or not session["user"].get("is_admin", False):
         flash("You must be an admin to access this page", "danger")
         return redirect(url_for("login"))
     
-    # Mark the book as borrowed
-    books_collection.update_one(
-        {"_id": ObjectId(book_id), "status": "reserved"},
-        {"$set": {
-            "status": "borrowed",
-            "borrowed_at": datetime.utcnow()
-        }}
-    )
+    # Mark the reserved copy as borrowed and open its loan. The title's copy
+    # counters do not change: the copy was already out.
+    now = datetime.utcnow()
+    hold = holds_collection.find_one_and_update(*borrow_change(ObjectId(hold_id), now),
+                                                return_document=ReturnDocument.AFTER)
+    if hold:
+        open_loans(loans_collection, [hold], now)
     flash("Book marked as borrowed!", "success")
     return redirect(url_for("admin_dashboard", tab="active-books"))
 
-@app.route("/admin/mark_returned/<book_id>", methods=["POST"])
-def mark_returned(book_id):
-    print(f"Accessing /admin/mark_returned/{book_id} route")
+@app.route("/admin/mark_returned/<hold_id>", methods=["POST"])
+def mark_returned(hold_id):
     if "user" not in session or not session["user"].get("is_admin", False):
         flash("You must be an admin to access this page", "danger")
         return redirect(url_for("login"))
+    require_booking_indexes()
     
-    # Mark the book as returned
-    books_collection.update_one(
-        {"_id": ObjectId(book_id), "status": "borrowed"},
-        {"$set": {
-            "status": "available",
-            "returned_at": datetime.utcnow()
-        }, "$unset": {"reserved_by": "", "reserved_at": "", "borrowed_at": ""}}
-    )
+    # Put the copy back (or reserve it for the first student on the waitlist)
+    # and close its loan, settling the late fee
+    now = datetime.utcnow()
+    returned = return_holds(books_collection, holds_collection, [ObjectId(hold_id)], waitlist_collection)
+    if returned:
+        close_loans(loans_collection, [ObjectId(hold_id)], now)
+        invalidate_books(returned[0]["book_id"])
     flash("Book marked as returned!", "success")
     return redirect(url_for("admin_dashboard", tab="active-books"))
 
+# Apply borrow or return to the copies (hold_ids), or delete to the titles
+# (book_ids), selected on the admin dashboard with one bulk write, answering
+# with JSON so the page can update in place
+@app.route("/admin/books/bulk", methods=["POST"])
+def bulk_books():
+    if "user" not in session or not session["user"].get("is_admin", False):
+        return jsonify({"error": "admin access required"}), 403
+    require_booking_indexes()
+    payload = request.get_json(silent=True) or {}
+    action = payload.get("action") or request.form.get("action")
+    if action not in BULK_ACTIONS:
+        return jsonify({"error": f"action must be one of {', '.join(BULK_ACTIONS)}"}), 400
+    ids_key = "book_ids" if action == "delete" else "hold_ids"
+    raw_ids = payload.get(ids_key) if payload else request.form.getlist(ids_key)
+    if not isinstance(raw_ids, list) or not raw_ids:
+        return jsonify({"error": f"{ids_key} must be a non-empty list"}), 400
+    if len(raw_ids) > MAX_BULK_BOOKS:
+        return jsonify({"error": f"at most {MAX_BULK_BOOKS} books per request"}), 400
+    
+    ids, invalid = parse_book_ids(raw_ids)
+    now = datetime.utcnow()
+    result = apply_bulk_action(books_collection, holds_collection, action, ids, now, waitlist_collection)
+    changed_ids = [item["_id"] for item in result["changed"]]
+    if action == "borrow":
+        open_loans(loans_collection, result["changed"], now)
+    elif action == "return":
+        close_loans(loans_collection, changed_ids, now)
+        invalidate_books(*{hold["book_id"] for hold in result["changed"]})
+    else:
+        close_loans(loans_collection, changed_ids, now, field="book_id")
+        invalidate_books(*changed_ids)
+    changed = []
+    for item in result["changed"]:
+        entry = {"id": str(item["_id"])}
+        if action == "delete":
+            search_index.remove(item["_id"])
+            genre_catalog.record_change(old_genre=item.get("genre", "Unknown"))
+        else:
+            entry["book_id"] = str(item["book_id"])
+            if action == "borrow":
+                entry["timing_info"] = calculate_borrowing_info(item.get("borrowed_at"))
+        changed.append(entry)
+    return jsonify({
+        "action": action,
+        "changed": changed,
+        "skipped": [str(item_id) for item_id in result["skipped"]],
+        "invalid": invalid
+    })
+
+# Record that a student paid the late fees of the books they returned
+@app.route("/admin/loans/settle/<student_id>", methods=["POST"])
+def settle_late_fees(student_id):
+    if "user" not in session or not session["user"].get("is_admin", False):
+        flash("You must be an admin to access this page", "danger")
+        return redirect(url_for("login"))
+    
+    if settle_fees(loans_collection, student_id, datetime.utcnow()):
+        flash(f"Late fees of {student_id} marked as paid.", "success")
+    else:
+        flash(f"{student_id} has no late fees to pay for returned books.", "info")
+    return redirect(url_for("admin_dashboard", tab="active-books", show="balances"))
+
 @app.route("/admin/add_book", methods=["GET", "POST"])
 def add_book():
-    print("Accessing /admin/add_book route")
     if "user" not in session or not session["user"].get("is_admin", False):
         flash("You must be an admin to access this page", "danger")
         return redirect(url_for("login"))
     
     # Fetch all unique genres
-    genres = sorted(list(set(book.get("genre", "Unknown") for book in books_collection.find())))
+    genres = genre_catalog.genres()
     
     if request.method == "POST":
         title = request.form["title"].strip()
         author = request.form["author"].strip()
         genre = request.form["genre"].strip()
+        copies = parse_copies(request.form.get("copies"))
         if not title or not author or not genre:
             flash("Title, Author, and Genre are required", "danger")
             return render_template("add_book.html", genres=genres)
-        books_collection.insert_one({
-            "title": title,
-            "author": author,
-            "genre": genre,
-            "status": "available"
-        })
+        if copies is None:
+            flash("Copies must be a positive whole number", "danger")
+            return render_template("add_book.html", genres=genres)
+        book = new_title(title, author, genre, copies)
+        books_collection.insert_one(book)
+        catalog_version.bump()
+        search_index.add(book)
+        genre_catalog.record_change(new_genre=genre)
         flash("Book added successfully!", "success")
         return redirect(url_for("admin_dashboard", tab="manage-books"))
     
     return render_template("add_book.html", genres=genres)
 
+@app.route("/admin/books/import", methods=["GET", "POST"])
+def import_books_upload():
+    if "user" not in session or not session["user"].get("is_admin", False):
+        flash("You must be an admin to access this page", "danger")
+        return redirect(url_for("login"))
+    
+    if request.method == "POST":
+        upload = request.files.get("file")
+        if not upload or not upload.filename:
+            flash("Choose a CSV or JSON Lines file to import", "danger")
+            return render_template("import_books.html")
+        fmt = request.form.get("format") or format_from_filename(upload.filename)
+        if fmt not in FORMATS:
+            flash("Unsupported file format", "danger")
+            return render_template("import_books.html")
+        
+        # The upload is parsed as it is read and written in batches; re-uploading
+        # a file after a failure skips the books that were already imported
+        stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+        report = import_books(books_collection, read_records(stream, fmt),
+                              on_progress=lambda progress: logger.info("Import of %s: %d rows read, %d books added",
+                                                                       upload.filename, progress.position, progress.inserted))
+        catalog_version.bump()
+        search_index.invalidate()
+        genre_catalog.invalidate()
+        flash(f"Imported {report.inserted} book(s) from {report.position} row(s): "
+              f"{report.duplicates} duplicate(s) and {report.invalid} invalid row(s) skipped.",
+              "success" if report.inserted or not report.invalid else "danger")
+        return render_template("import_books.html", errors=report.errors)
+    
+    return render_template("import_books.html")
+
+@app.route("/admin/books/export")
+def export_books_download():
+    if "user" not in session or not session["user"].get("is_admin", False):
+        flash("You must be an admin to access this page", "danger")
+        return redirect(url_for("login"))
+    
+    fmt = request.args.get("format", "csv")
+    if fmt not in FORMATS:
+        fmt = "csv"
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return Response(stream_with_context(export_books(books_collection, fmt)), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=books.{fmt}"})
+
 @app.route("/admin/edit_book/<book_id>", methods=["GET", "POST"])
 def edit_book(book_id):
-    print(f"Accessing /admin/edit_book/{book_id} route")
     if "user" not in session or not session["user"].get("is_admin", False):
         flash("You must be an admin to access this page", "danger")
         return redirect(url_for("login"))
@@ -672,19 +1120,36 @@ def edit_book(book_id):
         return redirect(url_for("admin_dashboard", tab="manage-books"))
     
     # Fetch all unique genres
-    genres = sorted(list(set(book.get("genre", "Unknown") for book in books_collection.find())))
+    genres = genre_catalog.genres()
     
     if request.method == "POST":
+        require_booking_indexes()
         title = request.form["title"].strip()
         author = request.form["author"].strip()
         genre = request.form["genre"].strip()
+        copies = parse_copies(request.form.get("copies"), default=book.get("total_copies", 1))
         if not title or not author or not genre:
             flash("Title, Author, and Genre are required", "danger")
             return render_template("edit_book.html", book=book, genres=genres)
+        if copies is None:
+            flash("Copies must be a positive whole number", "danger")
+            return render_template("edit_book.html", book=book, genres=genres)
+        # Both counters move by the difference, and only while enough copies
+        # are on the shelf to remove
+        if not set_total_copies(books_collection, book, copies):
+            out = book.get("total_copies", 1) - book.get("available_copies", 0)
+            flash(f"{out} copies of this book are reserved or borrowed; it needs at least that many.", "danger")
+            return render_template("edit_book.html", book=book, genres=genres)
+        if copies > book.get("total_copies", 1):
+            # New copies go to the students waiting first
+            fill_from_waitlist(books_collection, holds_collection, waitlist_collection, book["_id"])
         books_collection.update_one(
             {"_id": ObjectId(book_id)},
             {"$set": {"title": title, "author": author, "genre": genre}}
         )
+        search_index.update({"_id": ObjectId(book_id), "title": title, "author": author, "genre": genre})
+        invalidate_books(book["_id"])
+        genre_catalog.record_change(old_genre=book.get("genre", "Unknown"), new_genre=genre)
         flash("Book updated successfully!", "success")
         return redirect(url_for("admin_dashboard", tab="manage-books"))
     
@@ -692,121 +1157,156 @@ def edit_book(book_id):
 
 @app.route("/admin/delete_book/<book_id>", methods=["POST"])
 def delete_book(book_id):
-    print(f"Accessing /admin/delete_book/{book_id} route")
     if "user" not in session or not session["user"].get("is_admin", False):
         flash("You must be an admin to access this page", "danger")
         return redirect(url_for("login"))
     
-    books_collection.delete_one({"_id": ObjectId(book_id)})
+    deleted = books_collection.find_one_and_delete({"_id": ObjectId(book_id)}, projection={"genre": 1})
+    if deleted:
+        # The title's copies and waitlist go with it
+        holds_collection.delete_many(title_holds_query([deleted["_id"]]))
+        waitlist_collection.delete_many(titles_waitlist_query([deleted["_id"]]))
+        close_loans(loans_collection, [deleted["_id"]], datetime.utcnow(), field="book_id")
+        search_index.remove(deleted["_id"])
+        invalidate_books(deleted["_id"])
+        genre_catalog.record_change(old_genre=deleted.get("genre", "Unknown"))
     flash("Book deleted successfully!", "success")
     return redirect(url_for("admin_dashboard", tab="manage-books"))
 
 @app.route("/admin/cancel_conference_reservation/<room_id>/<reserved_by>", methods=["POST"])
 def admin_cancel_conference_reservation(room_id, reserved_by):
-    print(f"Accessing /admin/cancel_conference_reservation/{room_id}/{reserved_by} route")
     if "user" not in session or not session["user"].get("is_admin", False):
         flash("You must be an admin to access this page", "danger")
         return redirect(url_for("login"))
     
     # Find the room
-    room = conference_rooms_collection.find_one({"_id": ObjectId(room_id)})
+    room = conference_rooms_collection.find_one({"_id": ObjectId(room_id)}, {"room_name": 1})
     if not room:
         flash("Conference room not found", "danger")
         return redirect(url_for("admin_dashboard", tab="conference-rooms"))
     
-    # Find and remove the reservation by the specified student
-    updated_reservations = [
-        res for res in room["reservations"]
-        if res["reserved_by"] != reserved_by
-    ]
-    
-    conference_rooms_collection.update_one(
-        {"_id": ObjectId(room_id)},
-        {"$set": {"reservations": updated_reservations}}
-    )
+    # Remove the reservation by the specified student
+    cancel_reservations(conference_reservations_collection, room["_id"], reserved_by)
+    invalidate_room_status()
     
     flash(f"Successfully cancelled reservation for {room['room_name']} by {reserved_by}.", "success")
     return redirect(url_for("admin_dashboard", tab="conference-rooms"))
 
 @app.route("/admin/add_conference_reservation/<room_id>", methods=["GET", "POST"])
 def add_conference_reservation(room_id):
-    print(f"Accessing /admin/add_conference_reservation/{room_id} route")
     if "user" not in session or not session["user"].get("is_admin", False):
         flash("You must be an admin to access this page", "danger")
         return redirect(url_for("login"))
     
-    room = conference_rooms_collection.find_one({"_id": ObjectId(room_id)})
+    room = conference_rooms_collection.find_one({"_id": ObjectId(room_id)}, {"room_name": 1})
     if not room:
         flash("Conference room not found", "danger")
         return redirect(url_for("admin_dashboard", tab="conference-rooms"))
     
     # Fetch all students for the dropdown
-    students = list(users_collection.find({"is_admin": False}))
+    students = get_students()
+    
+    # Free windows for the selected day (tomorrow by default) guide the admin
+    selected_date_str = request.values.get("reservation_date") or (datetime.utcnow() + timedelta(days=1)).strftime("%Y-%m-%d")
+    
+    def render_form():
+        try:
+            selected_date = datetime.strptime(selected_date_str, "%Y-%m-%d").date()
+        except ValueError:
+            return render_template("add_conference_reservation.html", room=room, students=students,
+                                   slot_minutes=ROOM_SLOT_MINUTES, slot_granularity=SLOT_GRANULARITY_MINUTES, selected_date=selected_date_str, free_windows=[])
+        schedule = DaySchedule.from_reservations(
+            selected_date, get_room_day_reservations(conference_reservations_collection, room["_id"], selected_date_str))
+        free_windows = [
+            f"{format_clock(start)} - {format_clock(end)}"
+            for start, end in schedule.free_windows(timedelta(minutes=1))
+        ]
+        return render_template("add_conference_reservation.html", room=room, students=students,
+                               slot_minutes=ROOM_SLOT_MINUTES, slot_granularity=SLOT_GRANULARITY_MINUTES, selected_date=selected_date_str, free_windows=free_windows)
     
     if request.method == "POST":
+        require_booking_indexes()
         student_id = request.form.get("student_id")
         reservation_date_str = request.form.get("reservation_date")
         start_time_str = request.form.get("start_time")
+        duration_str = request.form.get("duration_minutes") or str(ROOM_SLOT_MINUTES)
         
         if not student_id or not reservation_date_str or not start_time_str:
             flash("All fields are required", "danger")
-            return render_template("add_conference_reservation.html", room=room, students=students)
+            return render_form()
         
         # Validate the student
-        student = users_collection.find_one({"IDNumber": student_id, "is_admin": False})
-        if not student:
+        student = get_user(student_id)
+        if not student or student.get("is_admin", False):
             flash("Invalid student ID", "danger")
-            return render_template("add_conference_reservation.html", room=room, students=students)
+            return render_form()
         
-        # Check if the student already has a reservation
-        if not can_student_reserve_conference_room(student_id):
-            flash(f"Student {student_id} already has a conference room reservation.", "danger")
-            return render_template("add_conference_reservation.html", room=room, students=students)
-        
-        # Parse the date and time
+        # Parse the date, time and duration
         try:
             reservation_date = datetime.strptime(reservation_date_str, "%Y-%m-%d").date()
             start_time = datetime.strptime(f"{reservation_date_str} {start_time_str}", "%Y-%m-%d %H:%M")
-            end_time = start_time + timedelta(hours=1, minutes=30)
+            duration_minutes = int(duration_str)
+            if duration_minutes <= 0:
+                raise ValueError("duration must be positive")
+            end_time = start_time + timedelta(minutes=duration_minutes)
         except ValueError:
-            flash("Invalid date or time format", "danger")
-            return render_template("add_conference_reservation.html", room=room, students=students)
-        
-        # Check if the time slot is available
-        reservations = [res for res in room["reservations"] if res["date"] == reservation_date_str]
-        for res in reservations:
-            res_start = res["start_time"]
-            res_end = res["end_time"]
-            if (start_time < res_end and end_time > res_start):
-                flash("This time slot is already reserved", "danger")
-                return render_template("add_conference_reservation.html", room=room, students=students)
+            flash("Invalid date, time or duration", "danger")
+            return render_form()
+        if not is_on_slot_grid(start_time) or duration_minutes % SLOT_GRANULARITY_MINUTES:
+            flash(f"Start time and duration must be multiples of {SLOT_GRANULARITY_MINUTES} minutes", "danger")
+            return render_form()
         
-        # Check if the time is between 8:00 AM and 6:00 PM
-        start_of_day = datetime.combine(reservation_date, datetime.min.time()) + timedelta(hours=8)
-        end_of_day = datetime.combine(reservation_date, datetime.min.time()) + timedelta(hours=18)
-        if start_time < start_of_day or end_time > end_of_day:
-            flash("Reservations must be between 8:00 AM and 6:00 PM", "danger")
-            return render_template("add_conference_reservation.html", room=room, students=students)
+        # Check that the time is within opening hours and the slot is free
+        schedule = DaySchedule.from_reservations(
+            reservation_date, get_room_day_reservations(conference_reservations_collection, room["_id"], reservation_date_str))
+        if schedule.overlaps(start_time, end_time):
+            flash("This time slot is already reserved", "danger")
+            return render_form()
+        if not schedule.is_free(start_time, end_time):
+            open_time, close_time = opening_hours(reservation_date)
+            flash(f"Reservations must be between {format_clock(open_time)} and {format_clock(close_time)}", "danger")
+            return render_form()
         
-        # Create the reservation
-        reservation = {
-            "reserved_by": student_id,
-            "date": reservation_date_str,
-            "start_time": start_time,
-            "end_time": end_time
-        }
-        
-        # Add the reservation to the room
-        conference_rooms_collection.update_one(
-            {"_id": ObjectId(room_id)},
-            {"$push": {"reservations": reservation}}
-        )
+        # Create the reservation; the unique indexes reject a concurrent booking
+        # of the same time or a second reservation for the student
+        outcome = book_room_slot(conference_reservations_collection, room["_id"], student_id,
+                                 reservation_date_str, start_time, end_time)
+        if outcome == ALREADY_HOLDING:
+            flash(f"Student {student_id} already has a conference room reservation.", "danger")
+            return render_form()
+        if outcome == UNAVAILABLE:
+            flash("This time slot is already reserved", "danger")
+            return render_form()
         
-        flash(f"Successfully reserved {room['room_name']} for {student_id} on {reservation_date_str} from {start_time.strftime('%I:%M %p').lstrip('0')} to {end_time.strftime('%I:%M %p').lstrip('0')}.", "success")
+        invalidate_room_status()
+        flash(f"Successfully reserved {room['room_name']} for {student_id} on {reservation_date_str} from {format_clock(start_time)} to {format_clock(end_time)}.", "success")
         return redirect(url_for("admin_dashboard", tab="conference-rooms"))
     
-    return render_template("add_conference_reservation.html", room=room, students=students)
+    return render_form()
+
+@app.route("/admin/metrics/expiry")
+def expiry_metrics():
+    if "user" not in session or not session["user"].get("is_admin", False):
+        return jsonify({"error": "admin access required"}), 403
+    metrics = expiry_scheduler.metrics()
+    if metrics["last_sweep_at"]:
+        metrics["last_sweep_at"] = metrics["last_sweep_at"].isoformat() + "Z"
+    metrics["interval_seconds"] = expiry_scheduler.interval
+    return jsonify(metrics)
+
+@app.route("/admin/metrics/booking")
+def booking_metrics():
+    if "user" not in session or not session["user"].get("is_admin", False):
+        return jsonify({"error": "admin access required"}), 403
+    return jsonify({**booking_counters.snapshot(), **waitlist_counters.snapshot()})
+
+# Liveness/readiness probe: pings MongoDB (cached for HEALTH_CHECK_TTL seconds)
+@app.route("/healthz")
+def healthz():
+    if mongo.check_health():
+        return jsonify({"status": "ok"})
+    return jsonify({"status": "unavailable"}), 503
 
 if __name__ == "__main__":
-    print("Starting Flask app...")
-    app.run(debug=True)
\ No newline at end of file
+    logger.info("Starting Flask app...")
+    create_app().run(debug=True)
\ No newline at end of file
@@ -0,0 +1,30 @@
+import os
+import threading
+
+# A long-lived asyncio event loop running in a background thread of the worker
+# process. Request threads hand it coroutines and wait for the result, so the
+# coroutine's independent MongoDB round trips overlap while async clients keep
+# one connection pool for the whole process. The loop is started on first use,
+# i.e. in the worker process after any fork. asyncio itself is only imported
+# then, as it is slow to import and unused in the default sync view mode.
+class EventLoopThread:
+    def __init__(self, name="async-loop"):
+        self.name = name
+        self._loop = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                import asyncio
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                threading.Thread(target=self._loop.run_forever, name=self.name, daemon=True).start()
+            return self._loop
+
+    # Run a coroutine on the loop and block the calling thread until it finishes
+    def run(self, coroutine, timeout=None):
+        import asyncio
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
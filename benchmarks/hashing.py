@@ -0,0 +1,91 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from credentials import CredentialService, PASSWORD_HASH_METHOD
+
+# Hashing latency of each method, then login-style verification throughput
+# with concurrent request threads, hashing in the request threads (workers=0)
+# versus in the process pool. A "probe" thread measures how long a cheap
+# request waits for the GIL while the logins run, i.e. how much a login burst
+# slows everything else down on the same worker.
+def measure_latency(method, samples):
+    service = CredentialService(method=method, workers=0)
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        service.hash("benchmark")
+        timings.append(time.perf_counter() - started)
+    return {"method": method, "median_ms": statistics.median(timings) * 1000, "max_ms": max(timings) * 1000}
+
+def measure_throughput(method, workers, logins, concurrency):
+    service = CredentialService(method=method, workers=workers, max_pending=max(concurrency, 1), timeout=60)
+    stored_hash = CredentialService(method=method, workers=0).hash("benchmark")
+    if workers:
+        service.verify(stored_hash, "benchmark")  # Start the pool before timing
+    stop = threading.Event()
+    probe_delays = []
+
+    def probe():
+        while not stop.is_set():
+            started = time.perf_counter()
+            time.sleep(0.005)
+            probe_delays.append(time.perf_counter() - started - 0.005)
+
+    probe_thread = threading.Thread(target=probe, daemon=True)
+    probe_thread.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: service.verify(stored_hash, "benchmark"), range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    probe_thread.join()
+    service.shutdown()
+    assert all(results)
+    return {
+        "method": method,
+        "pool_workers": workers,
+        "logins_per_second": logins / elapsed,
+        "probe_delay_p50_ms": statistics.median(probe_delays) * 1000 if probe_delays else 0.0,
+        "probe_delay_max_ms": max(probe_delays) * 1000 if probe_delays else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark password hashing and login verification")
+    parser.add_argument("--methods", nargs="+",
+                        default=[PASSWORD_HASH_METHOD, "scrypt:16384:8:1", "pbkdf2:sha256:600000"])
+    parser.add_argument("--samples", type=int, default=10, help="hashes timed per method")
+    parser.add_argument("--logins", type=int, default=64, help="verifications per throughput run")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent request threads")
+    parser.add_argument("--workers", type=int, default=min(os.cpu_count() or 1, 4), help="pool processes")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = {"config": vars(args), "latency": [], "throughput": []}
+    print(f"{'method':<26}{'median ms':>12}{'max ms':>10}")
+    for method in dict.fromkeys(args.methods):
+        row = measure_latency(method, args.samples)
+        results["latency"].append(row)
+        print(f"{method:<26}{row['median_ms']:>12.1f}{row['max_ms']:>10.1f}")
+
+    print(f"\n{'method':<26}{'pool':>6}{'logins/s':>10}{'probe p50 ms':>14}{'probe max ms':>14}")
+    for method in dict.fromkeys(args.methods):
+        for workers in (0, args.workers):
+            row = measure_throughput(method, workers, args.logins, args.concurrency)
+            results["throughput"].append(row)
+            print(f"{method:<26}{workers:>6}{row['logins_per_second']:>10.1f}"
+                  f"{row['probe_delay_p50_ms']:>14.2f}{row['probe_delay_max_ms']:>14.2f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import argparse
+import http.client
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Methods that each send one command to MongoDB
+COUNTED_METHODS = [
+    "find", "find_one", "insert_one", "insert_many", "update_one", "update_many", "delete_one",
+    "delete_many", "aggregate", "bulk_write", "count_documents", "distinct", "find_one_and_delete",
+    "find_one_and_update", "create_index"
+]
+
+# Counts MongoDB operations issued by the app
+class OperationCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def inc(self):
+        with self._lock:
+            self.count += 1
+
+    # pymongo command listener interface, used against a real mongod
+    def started(self, event):
+        if event.command_name not in ("isMaster", "hello", "ping", "endSessions", "getMore"):
+            self.inc()
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+# Point the app at either a real mongod (counting commands with a listener) or
+# an in-memory mongomock stand-in (counting collection method calls)
+def install_backend(mongo_uri, counter):
+    import pymongo
+    from pymongo import monitoring
+
+    if mongo_uri:
+        os.environ["MONGO_URI"] = mongo_uri
+        monitoring.register(counter)
+        return pymongo.MongoClient(mongo_uri)
+
+    # mongomock modifies the projection dicts it is given, which breaks the
+    # app's shared module-level projections under concurrency, so pass copies
+    import mongomock
+    client = mongomock.MongoClient()
+    for name in COUNTED_METHODS:
+        original = getattr(mongomock.collection.Collection, name)
+
+        def counted(self, *args, _original=original, **kwargs):
+            counter.inc()
+            args = [dict(arg) if isinstance(arg, dict) else arg for arg in args]
+            kwargs = {key: dict(value) if isinstance(value, dict) else value for key, value in kwargs.items()}
+            return _original(self, *args, **kwargs)
+        setattr(mongomock.collection.Collection, name, counted)
+    os.environ["MONGO_URI"] = "mongodb://benchmark"
+    pymongo.MongoClient = lambda *args, **kwargs: client
+    return client
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def summarize(name, latencies, elapsed, operations):
+    count = len(latencies)
+    return {
+        "route": name,
+        "requests": count,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "throughput_rps": count / elapsed if elapsed else 0.0,
+        "mongo_ops_per_request": operations / count if count else 0.0
+    }
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    print(f"{'route':<36}{'reqs':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'ops/req':>9}")
+    for row in rows:
+        print(f"{row['route']:<36}{row['requests']:>7}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+              f"{row['p99_ms']:>10.2f}{row['throughput_rps']:>10.1f}{row['mongo_ops_per_request']:>9.1f}")
+
+# The routes under test: (name, method, path builder, admin?)
+def build_scenarios(ids, tomorrow, password):
+    return [
+        ("GET /dashboard", "GET", lambda i: "/dashboard", False),
+        ("GET /dashboard?search=", "GET", lambda i: "/dashboard?search=river", False),
+        ("GET /api/books/suggest", "GET", lambda i: "/api/books/suggest?q=river", False),
+        ("GET /api/books/search", "GET", lambda i: "/api/books/search?q=river&fields=title,author", False),
+        ("GET /admin/dashboard", "GET", lambda i: "/admin/dashboard", True),
+        ("POST /login", "POST",
+         lambda i: "/login?" + urlencode({"IDNumber": ids["student_ids"][i % len(ids["student_ids"])],
+                                          "password": password}), False),
+        ("POST /reserve/<book_id>", "POST",
+         lambda i: f"/reserve/{ids['book_ids'][i % len(ids['book_ids'])]}", False),
+        ("POST /reserve_conference_room/<id>", "POST",
+         lambda i: f"/reserve_conference_room/{ids['room_ids'][i % len(ids['room_ids'])]}?" +
+         urlencode({"reservation_date": tomorrow}), False)
+    ]
+
+# Phase 1: drive each route sequentially through the Flask test client
+def run_test_client(app, scenarios, students, requests, counter, password):
+    rows = []
+    clients = {}
+    for name, method, path, admin in scenarios:
+        user = "admin" if admin else students[0]
+        if user not in clients:
+            client = app.test_client()
+            client.post("/login", data={"IDNumber": user, "password": password})
+            clients[user] = client
+        client = clients[user]
+        latencies = []
+        ops_before = counter.count
+        started = time.perf_counter()
+        for i in range(requests):
+            url = path(i)
+            request_started = time.perf_counter()
+            if method == "GET":
+                client.get(url)
+            else:
+                url, _, query = url.partition("?")
+                client.post(url, data=dict(pair.split("=", 1) for pair in query.split("&") if pair))
+            latencies.append(time.perf_counter() - request_started)
+        rows.append(summarize(name, latencies, time.perf_counter() - started, counter.count - ops_before))
+    return rows
+
+def login_cookie(port, user, password):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    connection.request("POST", "/login", body=urlencode({"IDNumber": user, "password": password}),
+                       headers={"Content-Type": "application/x-www-form-urlencoded"})
+    response = connection.getresponse()
+    response.read()
+    cookie = response.getheader("Set-Cookie", "").split(";", 1)[0]
+    connection.close()
+    return cookie
+
+# Phase 2: concurrent HTTP load against a threaded server
+def run_http_load(app, scenarios, students, requests, concurrency, counter, password):
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    port = server.server_port
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    rows = []
+    try:
+        cookies = {user: login_cookie(port, user, password) for user in ["admin"] + students[:concurrency]}
+        for name, method, path, admin in scenarios:
+            latencies = []
+            lock = threading.Lock()
+
+            def worker(worker_index):
+                user = "admin" if admin else students[worker_index % min(concurrency, len(students))]
+                connection = http.client.HTTPConnection("127.0.0.1", port)
+                for i in range(worker_index, requests, concurrency):
+                    url = path(i)
+                    headers = {"Cookie": cookies[user]}
+                    body = None
+                    if method == "POST":
+                        url, _, body = url.partition("?")
+                        headers["Content-Type"] = "application/x-www-form-urlencoded"
+                    request_started = time.perf_counter()
+                    connection.request(method, url, body=body, headers=headers)
+                    connection.getresponse().read()
+                    with lock:
+                        latencies.append(time.perf_counter() - request_started)
+                connection.close()
+
+            ops_before = counter.count
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(worker, range(concurrency)))
+            rows.append(summarize(name, latencies, time.perf_counter() - started, counter.count - ops_before))
+    finally:
+        server.shutdown()
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the library app's hot routes")
+    parser.add_argument("--books", type=int, default=2000)
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--rooms", type=int, default=4)
+    parser.add_argument("--reservations-per-room", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=200, help="requests per route and phase")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mongo-uri", help="benchmark against this mongod instead of mongomock "
+                                           "(its 'library' database is overwritten)")
+    parser.add_argument("--view-mode", choices=["sync", "async"], default="sync",
+                        help="how /dashboard loads its data (sets VIEW_MODE)")
+    parser.add_argument("--skip-http", action="store_true", help="only run the test client phase")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    if args.view_mode == "async" and not args.mongo_uri:
+        parser.error("--view-mode async needs --mongo-uri (mongomock has no async client)")
+
+    os.environ.setdefault("EXPIRY_SCHEDULER", "off")
+    os.environ["VIEW_MODE"] = args.view_mode
+    counter = OperationCounter()
+    client = install_backend(args.mongo_uri, counter)
+
+    # Create the indexes first so they exist before the data is loaded
+    import app as library_app
+    app = library_app.create_app()
+    library_app.ensure_indexes()
+
+    from seed import BENCHMARK_PASSWORD, seed
+    ids = seed(client.library, books=args.books, students=args.students, rooms=args.rooms,
+               reservations_per_room=args.reservations_per_room)
+    from datetime import datetime, timedelta
+    tomorrow = (datetime.utcnow() + timedelta(days=1)).strftime("%Y-%m-%d")
+    scenarios = build_scenarios(ids, tomorrow, BENCHMARK_PASSWORD)
+
+    print(f"Seeded {args.books} books, {args.students} students, {args.rooms} rooms "
+          f"({'mongod at ' + args.mongo_uri if args.mongo_uri else 'mongomock'}, {args.view_mode} views)")
+    results = {"config": vars(args)}
+    results["test_client"] = run_test_client(app, scenarios, ids["student_ids"], args.requests,
+                                             counter, BENCHMARK_PASSWORD)
+    print_table("Flask test client (sequential)", results["test_client"])
+    if not args.skip_http:
+        results["http"] = run_http_load(app, scenarios, ids["student_ids"], args.requests,
+                                        args.concurrency, counter, BENCHMARK_PASSWORD)
+        print_table(f"HTTP load ({args.concurrency} concurrent clients)", results["http"])
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
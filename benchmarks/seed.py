@@ -0,0 +1,89 @@
+import random
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from credentials import CredentialService
+from inventory import new_hold, new_title
+from loans import backfill_loans
+from reservations import slot_keys_for
+
+GENRES = ["Fiction", "Science", "History", "Mathematics", "Philosophy", "Poetry", "Biography", "Engineering"]
+WORDS = ["river", "shadow", "garden", "empire", "signal", "harvest", "winter", "machine", "letters",
+         "island", "theory", "silence", "atlas", "orbit", "meridian", "lantern", "harbor", "quantum"]
+NAMES = ["Santos", "Reyes", "Cruz", "Bautista", "Garcia", "Mendoza", "Torres", "Flores", "Ramos", "Navarro"]
+
+BENCHMARK_PASSWORD = "benchmark"
+
+# Fill a library database with synthetic titles (one to three copies each),
+# students and conference room bookings. Returns the IDs the load generator needs.
+def seed(db, books=1000, students=100, rooms=4, reservations_per_room=5, active_fraction=0.2, seed_value=42):
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    for name in ("users", "books", "book_holds", "book_waitlist", "conference_rooms", "conference_reservations",
+                 "loans"):
+        db[name].delete_many({})
+
+    # Hashed with the configured method, so logins do not trigger a rehash
+    password = CredentialService(workers=0).hash(BENCHMARK_PASSWORD)
+    student_ids = [f"2024-{i:05d}" for i in range(students)]
+    db.users.insert_many(
+        [{"IDNumber": "admin", "password": password, "is_admin": True}] +
+        [{"IDNumber": student_id, "password": password, "is_admin": False} for student_id in student_ids]
+    )
+
+    holders = iter(rng.sample(student_ids, min(students, int(books * active_fraction))))
+    book_docs = []
+    for i in range(books):
+        book_docs.append(new_title(" ".join(rng.sample(WORDS, 3)).title() + f" {i}",
+                                   f"{rng.choice(NAMES)}, {rng.choice(WORDS).title()}",
+                                   rng.choice(GENRES), rng.randint(1, 3)))
+    book_ids = db.books.insert_many(book_docs).inserted_ids
+
+    # One copy of some titles reserved or borrowed, by distinct students
+    holds = []
+    for book in book_docs:
+        holder = next(holders, None) if rng.random() < active_fraction else None
+        if not holder:
+            continue
+        hold = new_hold(book, holder, now - timedelta(hours=rng.uniform(0, 47)))
+        if rng.random() >= 0.5:
+            hold.update({"status": "borrowed", "reserved_at": now - timedelta(days=10),
+                         "borrowed_at": now - timedelta(days=rng.uniform(0, 10))})
+        holds.append(hold)
+        book["available_copies"] -= 1
+    if holds:
+        db.book_holds.insert_many(holds)
+        db.books.bulk_write([UpdateOne({"_id": book["_id"]}, {"$set": {"available_copies": book["available_copies"]}})
+                             for book in book_docs if book["available_copies"] < book["total_copies"]])
+    backfill_loans(db.loans, db.book_holds, now)
+
+    room_ids = db.conference_rooms.insert_many(
+        [{"room_name": f"Conference Room {i + 1}"} for i in range(rooms)]
+    ).inserted_ids
+
+    # Bookings for tomorrow, back to back from opening time, by distinct students
+    tomorrow = (now + timedelta(days=1)).date()
+    opening = datetime.combine(tomorrow, datetime.min.time()) + timedelta(hours=8)
+    bookers = iter(rng.sample(student_ids, min(students, rooms * reservations_per_room)))
+    reservations = []
+    for room_id in room_ids:
+        start = opening
+        for _ in range(reservations_per_room):
+            student_id = next(bookers, None)
+            if not student_id or start + timedelta(minutes=90) > opening + timedelta(hours=10):
+                break
+            reservations.append({
+                "room_id": room_id,
+                "reserved_by": student_id,
+                "date": tomorrow.strftime("%Y-%m-%d"),
+                "start_time": start,
+                "end_time": start + timedelta(minutes=90),
+                "active_holder": student_id,
+                "slot_keys": slot_keys_for(room_id, start, start + timedelta(minutes=90))
+            })
+            start += timedelta(minutes=90)
+    if reservations:
+        db.conference_reservations.insert_many(reservations)
+
+    return {"student_ids": student_ids, "book_ids": book_ids, "room_ids": room_ids}
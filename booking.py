@@ -0,0 +1,123 @@
+import os
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+from expiry import book_reservation_threshold
+from inventory import (claim_copy, fill_from_waitlist, new_hold, release_copies, release_lapsed_holds,
+                       student_holds_query, student_title_hold_query, TITLE_FIELDS)
+from metrics import CounterSet
+from reservations import (create_reservation, get_room_day_reservations, release_finished_reservations,
+                          student_has_active_reservation)
+from scheduling import DaySchedule
+from waitlist import join_waitlist
+
+# Outcomes of a booking attempt
+RESERVED = "reserved"
+ALREADY_HOLDING = "already_holding"
+UNAVAILABLE = "unavailable"
+QUEUED = "queued"
+ALREADY_QUEUED = "already_queued"
+
+# How many times a booking is retried after losing a race before giving up
+MAX_BOOKING_ATTEMPTS = int(os.getenv("MAX_BOOKING_ATTEMPTS", "3"))
+
+# Conflict and retry counters for the booking paths
+booking_counters = CounterSet()
+
+# Helper function to reserve a copy of a title: one conditional $inc takes a
+# copy (only while one is available) and inserting the hold records who has
+# it. The unique student_id index on book_holds rejects the insert if the
+# student already holds another book, in which case the copy is put back.
+def reserve_book_atomically(books_collection, holds_collection, book_id, student_id, now=None,
+                            waitlist_collection=None):
+    now = now or datetime.utcnow()
+    threshold = book_reservation_threshold(now)
+    for attempt in range(MAX_BOOKING_ATTEMPTS):
+        if attempt:
+            booking_counters.inc("book_reserve_retries_total")
+        book = claim_copy(books_collection, book_id)
+        if book is None:
+            # Lapsed reservations keep their copies until the expiry sweep
+            # releases them; release this title's and try again
+            if release_lapsed_holds(books_collection, holds_collection, threshold, waitlist_collection,
+                                    book_id=book_id):
+                continue
+            booking_counters.inc("book_reserve_unavailable_total")
+            return UNAVAILABLE
+        try:
+            holds_collection.insert_one(new_hold(book, student_id, now))
+        except DuplicateKeyError:
+            release_copies(books_collection, {book_id: 1})
+            booking_counters.inc("book_reserve_conflicts_total")
+            # The student's own lapsed reservation may still hold the key until
+            # the expiry sweep runs; release it and try again
+            if release_lapsed_holds(books_collection, holds_collection, threshold, waitlist_collection,
+                                    student_id=student_id):
+                continue
+            return ALREADY_HOLDING
+        booking_counters.inc("book_reservations_total")
+        return RESERVED
+    return ALREADY_HOLDING
+
+# Helper function to put a student on the waitlist of a title with no copy
+# available. Returns (outcome, waitlist entry): QUEUED, ALREADY_QUEUED (the
+# entry is theirs, possibly for another title), ALREADY_HOLDING, UNAVAILABLE
+# (no such title) or RESERVED, when a copy came back while they joined.
+def join_book_waitlist(books_collection, holds_collection, waitlist_collection, book_id, student_id, now=None):
+    now = now or datetime.utcnow()
+    if holds_collection.find_one(student_holds_query(student_id, book_reservation_threshold(now)), {"_id": 1}):
+        return ALREADY_HOLDING, None
+    book = books_collection.find_one({"_id": book_id}, TITLE_FIELDS)
+    if not book:
+        return UNAVAILABLE, None
+    entry, joined = join_waitlist(waitlist_collection, book, student_id, now)
+    if not joined:
+        return ALREADY_QUEUED, entry
+    # A copy put back just before the student joined was counted in rather
+    # than handed to them; pass it down the queue now
+    if fill_from_waitlist(books_collection, holds_collection, waitlist_collection, book_id):
+        if holds_collection.find_one(student_title_hold_query(student_id, book_id), {"_id": 1}):
+            booking_counters.inc("book_reservations_total")
+            return RESERVED, None
+    return QUEUED, entry
+
+# Helper function to book a room for [start_time, end_time) with a single
+# insert guarded by the unique active_holder and slot_keys indexes
+def book_room_slot(reservations_collection, room_id, student_id, date_str, start_time, end_time, now=None):
+    now = now or datetime.utcnow()
+    for attempt in range(MAX_BOOKING_ATTEMPTS):
+        if attempt:
+            booking_counters.inc("room_reserve_retries_total")
+        try:
+            create_reservation(reservations_collection, room_id, student_id, date_str, start_time, end_time)
+            booking_counters.inc("room_reservations_total")
+            return RESERVED
+        except DuplicateKeyError:
+            booking_counters.inc("room_reserve_conflicts_total")
+            if student_has_active_reservation(reservations_collection, student_id, now):
+                return ALREADY_HOLDING
+            # A finished booking not yet swept still holds the student's key
+            if release_finished_reservations(reservations_collection, student_id, now):
+                continue
+            return UNAVAILABLE
+    return UNAVAILABLE
+
+# Helper function to book the next free slot of `duration` in a room. If another
+# request takes the slot first, the schedule is re-read and the next slot tried.
+def book_next_room_slot(reservations_collection, room_id, student_id, reservation_date, duration, now=None):
+    now = now or datetime.utcnow()
+    date_str = reservation_date.strftime("%Y-%m-%d")
+    for attempt in range(MAX_BOOKING_ATTEMPTS):
+        if attempt:
+            booking_counters.inc("room_reserve_retries_total")
+        schedule = DaySchedule.from_reservations(
+            reservation_date, get_room_day_reservations(reservations_collection, room_id, date_str))
+        start_time = schedule.next_free_slot(duration, not_before=now)
+        if not start_time:
+            return UNAVAILABLE, None
+        outcome = book_room_slot(reservations_collection, room_id, student_id, date_str,
+                                 start_time, start_time + duration, now)
+        if outcome != UNAVAILABLE:
+            return outcome, start_time
+    return UNAVAILABLE, None
@@ -0,0 +1,74 @@
+import os
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo import DeleteOne, UpdateOne
+
+from inventory import books_by_id_query, return_holds, title_holds_query
+from waitlist import titles_waitlist_query
+
+# Changes the admin can apply to many books at once: borrowing and returning
+# copies (by hold ID, see inventory.py) and deleting titles (by book ID). Each
+# one is a single bulk_write; the per-item filters keep the same guards as the
+# one-item routes (only reserved copies can be borrowed, only borrowed ones
+# returned).
+BULK_ACTIONS = ("borrow", "return", "delete")
+MAX_BULK_BOOKS = int(os.getenv("MAX_BULK_BOOKS", "500"))
+
+# Helper function to get the filter and update that mark a reserved copy
+# borrowed, tagged with the bulk request's `batch` token when given
+def borrow_change(hold_id, now, batch=None):
+    change = {"status": "borrowed", "borrowed_at": now}
+    if batch is not None:
+        change["borrow_batch"] = batch
+    return {"_id": hold_id, "status": "reserved"}, {"$set": change}
+
+# Helper function to split submitted book or hold IDs into ObjectIds (deduplicated, in
+# order) and the values that are not valid IDs
+def parse_book_ids(values):
+    book_ids = []
+    invalid = []
+    for value in values:
+        try:
+            book_id = ObjectId(value)
+        except (InvalidId, TypeError):
+            invalid.append(value)
+            continue
+        if book_id not in book_ids:
+            book_ids.append(book_id)
+    return book_ids, invalid
+
+# Apply one action to many holds (borrow, return) or titles (delete). Returns
+# {"changed": [hold docs after the change, or deleted holds / titles],
+# "skipped": [ids left unchanged]}.
+def apply_bulk_action(books_collection, holds_collection, action, ids, now, waitlist_collection=None):
+    if action not in BULK_ACTIONS:
+        raise ValueError(f"Unknown bulk action: {action}")
+    if not ids:
+        return {"changed": [], "skipped": []}
+
+    if action == "delete":
+        found = list(books_collection.find(books_by_id_query(ids), {"genre": 1}))
+        if found:
+            result = books_collection.bulk_write([DeleteOne({"_id": book["_id"]}) for book in found], ordered=False)
+            if result.deleted_count < len(found):
+                # Some were deleted concurrently by another request
+                remaining = {book["_id"] for book in books_collection.find({"_id": {"$in": [b["_id"] for b in found]}}, {"_id": 1})}
+                found = [book for book in found if book["_id"] not in remaining]
+            # The copies (and the waitlist) of a deleted title go with it
+            holds_collection.delete_many(title_holds_query(book["_id"] for book in found))
+            if waitlist_collection is not None:
+                waitlist_collection.delete_many(titles_waitlist_query(book["_id"] for book in found))
+        changed = found
+    elif action == "return":
+        changed = return_holds(books_collection, holds_collection, ids, waitlist_collection)
+    else:
+        # A token unique to this request marks the holds it changed, so one
+        # read afterwards finds exactly those (another request borrowing in
+        # the same millisecond gets a different token)
+        batch = ObjectId()
+        holds_collection.bulk_write([UpdateOne(*borrow_change(hold_id, now, batch)) for hold_id in ids],
+                                    ordered=False)
+        changed = list(holds_collection.find({"_id": {"$in": ids}, "borrow_batch": batch}))
+    changed_ids = {item["_id"] for item in changed}
+    return {"changed": changed, "skipped": [item_id for item_id in ids if item_id not in changed_ids]}
@@ -0,0 +1,211 @@
+import copy
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import bson
+
+logger = logging.getLogger(__name__)
+
+# Shared cache settings (see README). CACHE_URL is `memory` (a per-process LRU),
+# a redis:// URL (shared by every worker; needs the redis package) or `off`.
+CACHE_URL = os.getenv("CACHE_URL", "memory")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
+
+# Helper function to get the namespace of a key ("book:<id>" -> "book"), the
+# label the hit and miss counters are kept under
+def key_namespace(key):
+    return key.split(":", 1)[0]
+
+# Base class of the cache backends. Keys are strings, values anything BSON can
+# hold inside a document (dicts, lists, ObjectIds, datetimes...). Callers get
+# their own copy of a cached value, so they may modify it. A backend error is
+# logged and treated as a miss: the cache must never take the site down.
+class Cache:
+    def __init__(self, default_ttl=CACHE_TTL):
+        self.default_ttl = default_ttl
+        self._stats_lock = threading.Lock()
+        self._hits = {}
+        self._misses = {}
+        self.errors = 0
+
+    def _record(self, key, hit):
+        counts = self._hits if hit else self._misses
+        namespace = key_namespace(key)
+        with self._stats_lock:
+            counts[namespace] = counts.get(namespace, 0) + 1
+
+    def _failed(self, operation, e):
+        with self._stats_lock:
+            self.errors += 1
+        logger.warning("Cache %s failed: %s", operation, e)
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    # Return {key: value} for the keys that are cached
+    def get_many(self, keys):
+        try:
+            found = self._get_many(keys)
+        except Exception as e:
+            self._failed("read", e)
+            found = {}
+        for key in keys:
+            self._record(key, key in found)
+        return found
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, values, ttl=None):
+        if not values:
+            return
+        try:
+            self._set_many(values, self.default_ttl if ttl is None else ttl)
+        except Exception as e:
+            self._failed("write", e)
+
+    def delete(self, *keys):
+        if not keys:
+            return
+        try:
+            self._delete(keys)
+        except Exception as e:
+            self._failed("delete", e)
+
+    # Return the cached value, or load, cache and return it on a miss
+    def get_or_load(self, key, loader, ttl=None):
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    def _get_many(self, keys):
+        return {}
+
+    def _set_many(self, values, ttl):
+        pass
+
+    def _delete(self, keys):
+        pass
+
+    def clear(self):
+        pass
+
+    def size(self):
+        return None
+
+    # Metrics in the format expected by Instrumentation.register_collector
+    def collect(self):
+        with self._stats_lock:
+            namespaces = sorted(set(self._hits) | set(self._misses))
+            metrics = [
+                ("library_cache_hits_total", "counter", "Cache lookups answered from the cache.",
+                 {(("namespace", name),): self._hits.get(name, 0) for name in namespaces}),
+                ("library_cache_misses_total", "counter", "Cache lookups that had to load from MongoDB.",
+                 {(("namespace", name),): self._misses.get(name, 0) for name in namespaces}),
+                ("library_cache_errors_total", "counter", "Cache backend errors (treated as misses).", self.errors)
+            ]
+        size = self.size()
+        if size is not None:
+            metrics.append(("library_cache_entries", "gauge", "Entries held by the in-process cache.", size))
+        return metrics
+
+# CACHE_URL=off: every lookup is a miss
+class NullCache(Cache):
+    pass
+
+# Per-process LRU cache with a TTL per entry. Workers do not see each other's
+# invalidations, so entries in it are stale for at most their TTL after a change
+# made by another process.
+class MemoryCache(Cache):
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, default_ttl=CACHE_TTL):
+        super().__init__(default_ttl)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def _get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                expires_at, value = entry
+                if expires_at <= now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = value
+        return {key: copy.deepcopy(value) for key, value in found.items()}
+
+    def _set_many(self, values, ttl):
+        expires_at = time.monotonic() + ttl
+        values = {key: copy.deepcopy(value) for key, value in values.items()}
+        with self._lock:
+            for key, value in values.items():
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+# Cache shared by every worker process in Redis (or anything speaking its
+# protocol, such as fakeredis in tests). Values are stored BSON encoded.
+class RedisCache(Cache):
+    def __init__(self, client, prefix="library:", default_ttl=CACHE_TTL):
+        super().__init__(default_ttl)
+        self.client = client
+        self.prefix = prefix
+
+    def _get_many(self, keys):
+        values = self.client.mget([self.prefix + key for key in keys])
+        return {key: bson.decode(value)["v"] for key, value in zip(keys, values) if value is not None}
+
+    def _set_many(self, values, ttl):
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in values.items():
+            pipeline.set(self.prefix + key, bson.encode({"v": value}), px=max(int(ttl * 1000), 1))
+        pipeline.execute()
+
+    def _delete(self, keys):
+        self.client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+# Helper function to get the cache key of a book's list fields
+def book_cache_key(book_id):
+    return f"book:{book_id}"
+
+# Helper function to create the cache configured by CACHE_URL
+def create_cache(url=CACHE_URL):
+    if url in ("", "off", "none"):
+        return NullCache()
+    if url == "memory":
+        return MemoryCache()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        import redis
+        return RedisCache(redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1))
+    raise ValueError(f"Unsupported CACHE_URL: {url}")
@@ -0,0 +1,165 @@
+import csv
+import io
+import json
+import os
+from collections import namedtuple
+
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+from inventory import new_title, parse_copies
+
+# Books are imported and exported as CSV (with a header row) or JSON Lines, one
+# title per row: title, author, genre and optionally copies (1 if left out).
+# Imports stream the input, so a catalog of any size is read one batch at a time.
+BOOK_FIELDS = ("title", "author", "genre")
+EXPORT_FIELDS = ("_id", "title", "author", "genre", "total_copies", "available_copies")
+FORMATS = ("csv", "jsonl")
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "500"))
+
+# At most this many row errors are kept in an import report
+MAX_REPORTED_ERRORS = 50
+
+ImportReport = namedtuple("ImportReport", ["position", "inserted", "duplicates", "invalid", "errors"])
+
+# Helper function to create the index used to find duplicate books
+def ensure_catalog_indexes(books_collection):
+    books_collection.create_index([("title", ASCENDING), ("author", ASCENDING)], name="title_author")
+
+# Helper function to build the query for the books with the same title and
+# author as any of `books`
+def duplicates_query(books):
+    return {"$or": [{"title": book["title"], "author": book["author"]} for book in books]}
+
+# Helper function to guess the format of a file from its name
+def format_from_filename(filename, default="csv"):
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    if extension == ".csv":
+        return "csv"
+    return default
+
+# Helper function to read records lazily from a text stream. Yields
+# (row number, dict) or (row number, None) for rows that cannot be parsed.
+def read_records(stream, fmt):
+    if fmt == "csv":
+        for row_number, row in enumerate(csv.DictReader(stream), start=1):
+            yield row_number, row
+    elif fmt == "jsonl":
+        row_number = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield row_number, record if isinstance(record, dict) else None
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+# Helper function to validate a record the way the add book form does.
+# Returns (book, None) or (None, error message).
+def validate_book(record):
+    if record is None:
+        return None, "Could not parse row"
+    record = {str(key).strip().lower(): value for key, value in record.items() if key}
+    values = {field: str(record.get(field) or "").strip() for field in BOOK_FIELDS}
+    if not all(values.values()):
+        return None, "Title, Author, and Genre are required"
+    # total_copies is the column exports write
+    copies = parse_copies(record.get("copies", record.get("total_copies")))
+    if copies is None:
+        return None, "Copies must be a positive whole number"
+    return new_title(values["title"], values["author"], values["genre"], copies), None
+
+# Import books from (row number, record) pairs, skipping the first `start_at`
+# rows (to resume an interrupted import). Rows are validated, de-duplicated on
+# title + author (within the input and against the catalog) and inserted with
+# one insert_many per batch. on_progress is called with an ImportReport after
+# every batch; its position is the number of rows consumed so far, so an import
+# resumed from there neither skips nor repeats a batch (and re-importing rows
+# that made it in is harmless, as they are reported as duplicates).
+def import_books(books_collection, records, batch_size=IMPORT_BATCH_SIZE, start_at=0, on_progress=None):
+    position = start_at
+    inserted = duplicates = invalid = 0
+    errors = []
+    seen = set()
+    batch = []
+
+    def report():
+        return ImportReport(position, inserted, duplicates, invalid, list(errors))
+
+    def flush():
+        nonlocal inserted, duplicates
+        if not batch:
+            return
+        existing = {
+            (book["title"], book["author"])
+            for book in books_collection.find(duplicates_query(batch), {"title": 1, "author": 1})
+        }
+        new_books = [book for book in batch if (book["title"], book["author"]) not in existing]
+        duplicates += len(batch) - len(new_books)
+        if new_books:
+            try:
+                inserted += len(books_collection.insert_many(new_books, ordered=False).inserted_ids)
+            except BulkWriteError as e:
+                inserted += e.details.get("nInserted", 0)
+                for error in e.details.get("writeErrors", [])[:MAX_REPORTED_ERRORS - len(errors)]:
+                    errors.append(f"Write error: {error.get('errmsg')}")
+        batch.clear()
+        if on_progress:
+            on_progress(report())
+
+    for row_number, record in records:
+        if row_number <= start_at:
+            continue
+        book, error = validate_book(record)
+        if error:
+            invalid += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(f"Row {row_number}: {error}")
+        else:
+            key = (book["title"], book["author"])
+            if key in seen:
+                duplicates += 1
+            else:
+                seen.add(key)
+                batch.append(book)
+        position = row_number
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return report()
+
+# Helper function to turn a book document into an export row
+def export_row(book):
+    return {field: str(book[field]) if field == "_id" else book.get(field, "") for field in EXPORT_FIELDS}
+
+# Stream the books collection as CSV or JSON Lines text chunks of
+# EXPORT_CHUNK_SIZE books. Only one chunk is held in memory at a time.
+def export_books(books_collection, fmt, chunk_size=EXPORT_CHUNK_SIZE):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS) if fmt == "csv" else None
+    if writer:
+        writer.writeheader()
+    rows = 0
+    cursor = books_collection.find({}, {field: 1 for field in EXPORT_FIELDS}).sort("_id", ASCENDING).batch_size(chunk_size)
+    for book in cursor:
+        row = export_row(book)
+        if writer:
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(row) + "\n")
+        rows += 1
+        if rows % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
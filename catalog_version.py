@@ -0,0 +1,61 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+from pymongo import ReturnDocument
+
+# Seconds a worker trusts the catalog version it read last before reading it
+# again, i.e. how long a change made by another worker process can go unseen
+CATALOG_VERSION_TTL = float(os.getenv("CATALOG_VERSION_TTL", "2"))
+
+# Version counter of the book catalog (titles, authors, genres and statuses),
+# kept in the counters collection so every worker process sees the same one.
+# Routes that change books bump it; cached fragments and ETags of catalog
+# pages include it, so they go stale as soon as the catalog changes.
+class CatalogVersion:
+    def __init__(self, counters_collection, ttl=None):
+        self.counters_collection = counters_collection
+        self.ttl = ttl if ttl is not None else CATALOG_VERSION_TTL
+        self._lock = threading.Lock()
+        self._current = None
+        self._loaded_at = None
+        self.bumps = 0
+
+    # Return (version, time of the last change); (0, None) for a catalog that never changed
+    def current(self):
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return self._current
+        counter = self.counters_collection.find_one({"_id": "catalog"})
+        current = (counter["version"], counter["updated_at"]) if counter else (0, None)
+        with self._lock:
+            self._current = current
+            self._loaded_at = time.monotonic()
+        return current
+
+    # Record a change to the catalog; returns the new (version, time of the change)
+    def bump(self):
+        now = datetime.utcnow()
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        counter = self.counters_collection.find_one_and_update(
+            {"_id": "catalog"},
+            {"$inc": {"version": 1}, "$set": {"updated_at": now}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        current = (counter["version"], counter["updated_at"])
+        with self._lock:
+            self._current = current
+            self._loaded_at = time.monotonic()
+            self.bumps += 1
+        return current
+
+    # Metrics in the format expected by Instrumentation.register_collector
+    def collect(self):
+        with self._lock:
+            version = self._current[0] if self._current else 0
+            return [
+                ("library_catalog_version", "gauge", "Catalog version last seen by this worker.", version),
+                ("library_catalog_bumps_total", "counter", "Catalog changes made by this worker.", self.bumps)
+            ]
@@ -0,0 +1,65 @@
+import gzip
+import os
+
+from flask import request
+
+# Response compression settings (see README). Text responses of at least
+# COMPRESS_MIN_SIZE bytes are sent brotli compressed to clients that accept
+# it (when the brotli package is installed), otherwise gzip compressed.
+COMPRESSION = os.getenv("COMPRESSION", "on").lower() != "off"
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "500"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "6"))
+
+COMPRESSIBLE_MIMETYPES = {"text/html", "text/css", "text/plain", "text/csv", "application/json",
+                          "application/javascript", "text/javascript", "application/x-ndjson"}
+
+_brotli = None
+
+# Helper function to import brotli on first use (None when it is not installed)
+def get_brotli():
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = False
+    return _brotli or None
+
+# Helper function to pick the encoding for a request's Accept-Encoding
+# header: brotli if accepted and available, then gzip, else None
+def choose_encoding(accept_encodings):
+    if accept_encodings.quality("br") > 0 and get_brotli():
+        return "br"
+    if accept_encodings.quality("gzip") > 0:
+        return "gzip"
+    return None
+
+# Helper function to compress bytes with the given encoding
+def compress(data, encoding, level=COMPRESS_LEVEL):
+    if encoding == "br":
+        # brotli qualities go from 0 to 11; map the gzip level onto them
+        return get_brotli().compress(data, quality=min(11, max(0, level - 1)))
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+# after_request hook compressing buffered text responses. Streamed responses
+# (exports) and responses that are already encoded are left alone.
+def compress_response(response):
+    if not COMPRESSION or response.direct_passthrough or response.is_streamed:
+        return response
+    if response.status_code < 200 or response.status_code >= 300 or response.status_code == 204:
+        return response
+    if "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+    if response.content_length is not None and response.content_length < COMPRESS_MIN_SIZE:
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if not encoding:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,38 @@
+from flask import Response, request
+from werkzeug.http import is_resource_modified
+
+# Conditional GET support. Responses are validated with weak ETags, since the
+# same page may be sent gzip or brotli compressed (see compression.py), and
+# marked private, no-cache: browsers keep them but ask again every time, which
+# costs a 304 with no body when nothing changed.
+
+# Helper function to set the validators (and caching policy) of a response
+def set_validators(response, etag, last_modified=None):
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# Helper function to answer a conditional GET before doing any work: returns a
+# 304 response if the client's copy (If-None-Match / If-Modified-Since) is
+# current, else None
+def not_modified(etag, last_modified=None):
+    if request.method not in ("GET", "HEAD"):
+        return None
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return set_validators(Response(status=304), etag, last_modified)
+
+# after_request hook giving HTML pages an ETag computed from the rendered page,
+# so a browser revalidating an unchanged page gets a 304 instead of the page
+def add_page_etag(response):
+    if request.method != "GET" or response.status_code != 200 or response.mimetype != "text/html":
+        return response
+    if response.direct_passthrough or response.is_streamed or "ETag" in response.headers:
+        return response
+    response.add_etag(weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
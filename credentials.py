@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+# Password hashing settings (see README). PASSWORD_HASH_METHOD is a werkzeug
+# method string such as "scrypt:32768:8:1" (werkzeug's default) or
+# "pbkdf2:sha256:600000". Hashing runs in a pool of PASSWORD_HASH_WORKERS
+# processes per worker (0 hashes in the request thread); at most
+# PASSWORD_HASH_MAX_PENDING hashes queue for it before requests are turned away.
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(os.cpu_count() or 1, 4))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(4 * max(PASSWORD_HASH_WORKERS, 1))))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+
+# Raised when the hashing pool is too busy to take another password in time
+class CredentialServiceBusy(Exception):
+    pass
+
+# Helper function to get the method and parameters a hash was made with
+# ("scrypt:32768:8:1$salt$hash" -> "scrypt:32768:8:1")
+def hash_method_of(stored_hash):
+    return stored_hash.split("$", 1)[0]
+
+# Hashes and verifies passwords off the request thread, in a process pool of
+# the current worker process (created on first use, and again after a fork).
+# Hashes made with other parameters than the configured ones still verify,
+# and verify_and_rehash returns a new hash for them so they are upgraded (or
+# downgraded) as users log in.
+class CredentialService:
+    def __init__(self, method=PASSWORD_HASH_METHOD, workers=PASSWORD_HASH_WORKERS,
+                 max_pending=PASSWORD_HASH_MAX_PENDING, timeout=PASSWORD_HASH_TIMEOUT):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._method_prefix = None
+        self._metrics = {"hash": [0, 0.0], "verify": [0, 0.0]}
+        self._rehashes = 0
+        self._rejections = 0
+
+    @property
+    def pool(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                # Forking a threaded server is unsafe, so start fresh interpreters
+                start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(start_method))
+                self._pid = os.getpid()
+            return self._pool
+
+    def _run(self, operation, function, *args):
+        started = time.perf_counter()
+        if self.workers <= 0:
+            result = function(*args)
+        else:
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._rejections += 1
+                raise CredentialServiceBusy("Too many passwords waiting to be hashed")
+            from concurrent.futures import TimeoutError as FutureTimeoutError
+            from concurrent.futures.process import BrokenProcessPool
+            pool = self.pool
+            try:
+                try:
+                    future = pool.submit(function, *args)
+                except BaseException:
+                    self._slots.release()
+                    raise
+                # The slot stays taken until the pool is done with the
+                # password, even if this request stops waiting for it
+                future.add_done_callback(lambda _: self._slots.release())
+                result = future.result(self.timeout)
+            except FutureTimeoutError:  # Only the builtin TimeoutError from Python 3.11
+                future.cancel()  # Still queued: drop it (and free the slot) now
+                raise CredentialServiceBusy("Timed out waiting for the password to be hashed")
+            except BrokenProcessPool as e:
+                # A pool process died; start a new pool for the next request
+                logger.error("Password hashing pool failed: %s", e)
+                with self._lock:
+                    if self._pool is pool:
+                        self._pool = None
+                raise
+        with self._lock:
+            self._metrics[operation][0] += 1
+            self._metrics[operation][1] += time.perf_counter() - started
+        return result
+
+    def hash(self, password):
+        return self._run("hash", generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        return self._run("verify", check_password_hash, stored_hash, password)
+
+    # Whether a stored hash was made with other parameters than the configured ones
+    def needs_rehash(self, stored_hash):
+        if self._method_prefix is None:
+            # werkzeug fills in defaults ("scrypt" -> "scrypt:32768:8:1"), so
+            # compare against a hash it actually produced (in the pool, like
+            # any other hash)
+            self._method_prefix = hash_method_of(self.hash(""))
+        return hash_method_of(stored_hash) != self._method_prefix
+
+    # Verify a password; returns (valid, new hash to store or None)
+    def verify_and_rehash(self, stored_hash, password):
+        if not self.verify(stored_hash, password):
+            return False, None
+        if not self.needs_rehash(stored_hash):
+            return True, None
+        with self._lock:
+            self._rehashes += 1
+        return True, self.hash(password)
+
+    # Metrics in the format expected by Instrumentation.register_collector
+    def collect(self):
+        with self._lock:
+            return [
+                ("library_password_operations_total", "counter", "Passwords hashed or verified.",
+                 {(("operation", operation),): count for operation, (count, _) in self._metrics.items()}),
+                ("library_password_seconds_total", "counter", "Time spent hashing or verifying, including queueing.",
+                 {(("operation", operation),): seconds for operation, (_, seconds) in self._metrics.items()}),
+                ("library_password_rehashes_total", "counter", "Hashes replaced after a change of parameters.",
+                 self._rehashes),
+                ("library_password_pool_rejections_total", "counter", "Requests turned away by a full hashing pool.",
+                 self._rejections)
+            ]
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.shutdown()
+            self._pool = None
@@ -0,0 +1,165 @@
+import logging
+import os
+import threading
+import time
+
+from pymongo import MongoClient, monitoring
+
+logger = logging.getLogger(__name__)
+
+# Connection pool and consistency settings (see README)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "")
+MONGO_DATABASE = os.getenv("MONGO_DATABASE", "library")
+
+# Seconds a successful health check ping is trusted before pinging again
+HEALTH_CHECK_TTL = float(os.getenv("HEALTH_CHECK_TTL", "10"))
+
+# Helper function to build the MongoClient keyword arguments from the settings
+def client_options():
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "readPreference": MONGO_READ_PREFERENCE
+    }
+    if MONGO_WRITE_CONCERN:
+        options["w"] = int(MONGO_WRITE_CONCERN) if MONGO_WRITE_CONCERN.isdigit() else MONGO_WRITE_CONCERN
+    return options
+
+# Connection pool listener tracking how busy the pool is: connections open and
+# checked out, and how long requests waited to check one out
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.open_connections = 0
+        self.checked_out = 0
+        self.checkouts_total = 0
+        self.checkout_wait_seconds_total = 0.0
+        self.checkout_wait_seconds_max = 0.0
+        self.checkout_failures = {}
+        self.pool_clears_total = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears_total += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self._local.started = None
+        with self._lock:
+            self.checkout_failures[event.reason] = self.checkout_failures.get(event.reason, 0) + 1
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        waited = time.perf_counter() - started if started is not None else 0.0
+        with self._lock:
+            self.checked_out += 1
+            self.checkouts_total += 1
+            self.checkout_wait_seconds_total += waited
+            self.checkout_wait_seconds_max = max(self.checkout_wait_seconds_max, waited)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    # Metrics in the format expected by Instrumentation.register_collector
+    def collect(self, max_pool_size=MONGO_MAX_POOL_SIZE):
+        with self._lock:
+            return [
+                ("library_mongo_pool_open_connections", "gauge", "Connections open in the pool.", self.open_connections),
+                ("library_mongo_pool_checked_out", "gauge", "Connections currently checked out.", self.checked_out),
+                ("library_mongo_pool_saturation", "gauge", "Checked out connections as a fraction of maxPoolSize.",
+                 self.checked_out / max_pool_size if max_pool_size else 0),
+                ("library_mongo_pool_checkouts_total", "counter", "Connection checkouts.", self.checkouts_total),
+                ("library_mongo_pool_checkout_wait_seconds_total", "counter", "Time spent waiting to check out a connection.",
+                 self.checkout_wait_seconds_total),
+                ("library_mongo_pool_checkout_wait_seconds_max", "gauge", "Longest wait to check out a connection.",
+                 self.checkout_wait_seconds_max),
+                ("library_mongo_pool_checkout_failures_total", "counter", "Failed connection checkouts by reason.",
+                 {(("reason", reason),): count for reason, count in sorted(self.checkout_failures.items())}),
+                ("library_mongo_pool_clears_total", "counter", "Times the pool was cleared after an error.",
+                 self.pool_clears_total)
+            ]
+
+# The MongoDB client of the current process. It is created on first use and
+# again in a forked child, so pre-forking servers never share a client (or its
+# sockets) between workers, and startup does not wait on a network round trip.
+class MongoConnection:
+    def __init__(self, uri=None, database=MONGO_DATABASE, event_listeners=(), **options):
+        self.uri = uri
+        self.database = database
+        self.event_listeners = list(event_listeners)
+        self.options = {**client_options(), **options}
+        self.pool_metrics = PoolMetricsListener()
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._healthy_until = 0.0
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                if not self.uri:
+                    raise RuntimeError("MONGO_URI is not set")
+                self.pool_metrics = PoolMetricsListener()
+                self._client = MongoClient(self.uri, event_listeners=self.event_listeners + [self.pool_metrics],
+                                           **self.options)
+                self._pid = os.getpid()
+                self._healthy_until = 0.0
+            return self._client
+
+    @property
+    def db(self):
+        return self.client[self.database]
+
+    # Ping the server, at most once every HEALTH_CHECK_TTL seconds while healthy
+    def check_health(self):
+        if time.monotonic() < self._healthy_until:
+            return True
+        try:
+            self.client.admin.command("ping")
+        except Exception as e:
+            logger.warning("MongoDB health check failed: %s", e)
+            return False
+        self._healthy_until = time.monotonic() + HEALTH_CHECK_TTL
+        return True
+
+    def collect_metrics(self):
+        return self.pool_metrics.collect(self.options.get("maxPoolSize", MONGO_MAX_POOL_SIZE))
+
+    def close(self):
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
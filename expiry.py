@@ -0,0 +1,157 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from inventory import release_lapsed_holds
+from loans import accrue_late_fees
+from reservations import finished_reservations_query
+
+logger = logging.getLogger(__name__)
+
+# Book reservations are held for 48 hours before they lapse
+BOOK_RESERVATION_HOURS = 48
+
+# Helper function to get the cutoff before which a book reservation has expired
+def book_reservation_threshold(now=None):
+    now = now or datetime.utcnow()
+    return now - timedelta(hours=BOOK_RESERVATION_HOURS)
+
+# Helper function to release every expired book reservation, handing the
+# copies to the titles' waitlists and counting the rest back in with one bulk
+# write; returns the holds released
+def sweep_expired_book_reservations(books_collection, holds_collection, now=None, waitlist_collection=None):
+    return release_lapsed_holds(books_collection, holds_collection, book_reservation_threshold(now),
+                                waitlist_collection)
+
+# Helper function to delete every finished conference room reservation in one write
+def sweep_expired_conference_reservations(reservations_collection, now=None):
+    now = now or datetime.utcnow()
+    result = reservations_collection.delete_many(finished_reservations_query(now))
+    return result.deleted_count
+
+# Background scheduler that sweeps expired reservations (and brings the late
+# fees of overdue loans up to date) on a fixed interval so request handlers
+# never have to write while serving a page. on_books_expired is called with
+# the ids of the titles whose reservations were released.
+class ExpiryScheduler:
+    def __init__(self, books_collection, holds_collection, reservations_collection, interval=None,
+                 loans_collection=None, on_books_expired=None, waitlist_collection=None):
+        self.books_collection = books_collection
+        self.holds_collection = holds_collection
+        self.reservations_collection = reservations_collection
+        self.loans_collection = loans_collection
+        self.waitlist_collection = waitlist_collection
+        self.on_books_expired = on_books_expired
+        self.interval = interval or float(os.getenv("EXPIRY_SWEEP_INTERVAL", "60"))
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._metrics = {
+            "sweeps_total": 0,
+            "sweep_errors_total": 0,
+            "sweep_duration_seconds_total": 0.0,
+            "last_sweep_duration_seconds": 0.0,
+            "last_sweep_at": None,
+            "last_books_expired": 0,
+            "last_room_reservations_expired": 0,
+            "last_loans_accrued": 0,
+            "books_expired_total": 0,
+            "room_reservations_expired_total": 0,
+            "loans_accrued_total": 0
+        }
+
+    def sweep(self, now=None):
+        now = now or datetime.utcnow()
+        started = time.perf_counter()
+        try:
+            released = sweep_expired_book_reservations(self.books_collection, self.holds_collection, now,
+                                                       self.waitlist_collection)
+            books_expired = len(released)
+            reservations_expired = sweep_expired_conference_reservations(self.reservations_collection, now)
+            loans_accrued = accrue_late_fees(self.loans_collection, now) if self.loans_collection is not None else 0
+            if released and self.on_books_expired:
+                # Released books show up as available again
+                self.on_books_expired({hold["book_id"] for hold in released})
+        except Exception as e:
+            with self._lock:
+                self._metrics["sweep_errors_total"] += 1
+            logger.error("Expiry sweep failed: %s", e)
+            return None
+        duration = time.perf_counter() - started
+        with self._lock:
+            self._metrics["sweeps_total"] += 1
+            self._metrics["sweep_duration_seconds_total"] += duration
+            self._metrics["last_sweep_duration_seconds"] = duration
+            self._metrics["last_sweep_at"] = now
+            self._metrics["last_books_expired"] = books_expired
+            self._metrics["last_room_reservations_expired"] = reservations_expired
+            self._metrics["books_expired_total"] += books_expired
+            self._metrics["room_reservations_expired_total"] += reservations_expired
+            self._metrics["last_loans_accrued"] = loans_accrued
+            self._metrics["loans_accrued_total"] += loans_accrued
+        if books_expired or reservations_expired:
+            logger.info("Expiry sweep released %d book(s) and %d room reservation(s) in %.3fs",
+                        books_expired, reservations_expired, duration)
+        return {"books_expired": books_expired, "room_reservations_expired": reservations_expired,
+                "loans_accrued": loans_accrued, "duration": duration}
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._metrics)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.sweep()
+            self._stop_event.wait(self.interval)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="expiry-scheduler", daemon=True)
+        self._thread.start()
+        logger.info("Expiry scheduler started (every %gs)", self.interval)
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+# Standalone worker: run the sweeps in their own process so web workers can be
+# started with EXPIRY_SCHEDULER=off
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    from cache import book_cache_key, create_cache
+    from catalog_version import CatalogVersion
+    from db import MongoConnection
+    from instrumentation import configure_logging
+
+    configure_logging()
+    load_dotenv()
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        logger.critical("MONGO_URI not found in .env file")
+        exit(1)
+    db = MongoConnection(mongo_uri).db
+    cache = create_cache()
+    catalog_version = CatalogVersion(db.counters)
+
+    # Same as invalidate_books in app.py (the cache is only shared with the
+    # web workers when it is Redis)
+    def invalidate_books(book_ids):
+        cache.delete(*[book_cache_key(book_id) for book_id in book_ids])
+        catalog_version.bump()
+
+    scheduler = ExpiryScheduler(db.books, db.book_holds, db.conference_reservations, loans_collection=db.loans,
+                                on_books_expired=invalidate_books, waitlist_collection=db.book_waitlist)
+    logger.info("Expiry worker running (every %gs)", scheduler.interval)
+    try:
+        while True:
+            scheduler.sweep()
+            time.sleep(scheduler.interval)
+    except KeyboardInterrupt:
+        logger.info("Expiry worker stopped")
@@ -0,0 +1,29 @@
+from functools import lru_cache
+
+# Display formatting shared by the templates. The same handful of slot times is
+# formatted over and over, so the results are memoized.
+
+# Helper function to format a time as e.g. "9:30 AM"
+@lru_cache(maxsize=4096)
+def format_clock(value):
+    return value.strftime("%I:%M %p").lstrip("0")
+
+# Helper function to format a date as e.g. "March 05, 2025"
+@lru_cache(maxsize=1024)
+def format_long_date(value):
+    return value.strftime("%B %d, %Y")
+
+# Helper function to format the time left until `deadline`, e.g. "2 days, 3
+# hours, 15 minutes", or "Overdue" once it has passed
+def format_remaining(deadline, now):
+    remaining_time = deadline - now
+    if remaining_time.total_seconds() <= 0:
+        return "Overdue"
+    hours, remainder = divmod(remaining_time.seconds, 3600)
+    return f"{remaining_time.days} days, {hours} hours, {remainder // 60} minutes"
+
+# Register the helpers as Jinja filters (`|clock`, `|long_date`, `|remaining(now)`)
+def register_template_filters(app):
+    app.add_template_filter(format_clock, "clock")
+    app.add_template_filter(format_long_date, "long_date")
+    app.add_template_filter(format_remaining, "remaining")
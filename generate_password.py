@@ -1,9 +1,60 @@
-from werkzeug.security import generate_password_hash
+import argparse
+import getpass
+import os
+import sys
 
-# Set your desired password
-new_password = "123456"  # Replace with your desired password
+from dotenv import load_dotenv
 
-# Generate the hashed password
-hashed_password = generate_password_hash(new_password)
-print(f"New password: {new_password}")
-print(f"Hashed password: {hashed_password}")
\ No newline at end of file
+from credentials import CredentialService, PASSWORD_HASH_METHOD, hash_method_of
+
+# Hash a password with the configured method (PASSWORD_HASH_METHOD), check a
+# password against a stored hash, or set a user's password in the database:
+#
+#   python generate_password.py                      # prompts for the password
+#   python generate_password.py --method pbkdf2:sha256:600000
+#   python generate_password.py --check 'scrypt:32768:8:1$...'
+#   python generate_password.py --user admin         # stores the new hash
+def main():
+    parser = argparse.ArgumentParser(description="Hash and check library account passwords")
+    parser.add_argument("password", nargs="?", help="default: prompt for it")
+    parser.add_argument("--method", default=PASSWORD_HASH_METHOD, help="werkzeug hash method and parameters")
+    parser.add_argument("--check", metavar="HASH", help="verify the password against this hash instead")
+    parser.add_argument("--user", metavar="IDNUMBER", help="store the hash as this user's password (needs MONGO_URI)")
+    args = parser.parse_args()
+
+    password = args.password
+    if password is None:
+        password = getpass.getpass("Password: ")
+        if not args.check and getpass.getpass("Confirm password: ") != password:
+            sys.exit("Passwords do not match")
+    if not password:
+        sys.exit("The password must not be empty")
+
+    credentials = CredentialService(method=args.method, workers=0)
+    if args.check:
+        valid, new_hash = credentials.verify_and_rehash(args.check, password)
+        print(f"Method: {hash_method_of(args.check)}")
+        print("Password matches" if valid else "Password does not match")
+        if new_hash:
+            print(f"Rehashed with {args.method}: {new_hash}")
+        sys.exit(0 if valid else 1)
+
+    hashed_password = credentials.hash(password)
+    if not args.user:
+        print(f"Hashed password: {hashed_password}")
+        return
+
+    from db import MongoConnection
+
+    load_dotenv()
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        sys.exit("MONGO_URI not found in .env file")
+    result = MongoConnection(mongo_uri).db.users.update_one({"IDNumber": args.user},
+                                                            {"$set": {"password": hashed_password}})
+    if not result.matched_count:
+        sys.exit(f"No user with IDNumber {args.user}")
+    print(f"Password updated for {args.user}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import os
+import threading
+import time
+
+# Helper function to build the query for the books of a genre (every book
+# when no genre is selected)
+def genre_query(genre):
+    return {"genre": genre} if genre else {}
+
+# Per-process cache of genre -> number of books, backed by a $group aggregation
+# over the genre index. The add/edit/delete book routes adjust the counts in
+# place; the cache is also reloaded after GENRE_CACHE_TTL seconds so that
+# changes made by other worker processes show up.
+class GenreCatalog:
+    def __init__(self, books_collection, ttl=None):
+        self.books_collection = books_collection
+        self.ttl = ttl if ttl is not None else float(os.getenv("GENRE_CACHE_TTL", "300"))
+        self._lock = threading.Lock()
+        self._counts = None
+        self._loaded_at = None
+
+    def _load(self):
+        counts = {}
+        for row in self.books_collection.aggregate([
+            {"$group": {"_id": "$genre", "count": {"$sum": 1}}}
+        ]):
+            genre = row["_id"] or "Unknown"
+            counts[genre] = counts.get(genre, 0) + row["count"]
+        return counts
+
+    # Return a copy of the genre -> book count mapping
+    def counts(self):
+        with self._lock:
+            expired = self._loaded_at is None or (self.ttl and time.monotonic() - self._loaded_at > self.ttl)
+            if not expired:
+                return dict(self._counts)
+        counts = self._load()
+        with self._lock:
+            self._counts = counts
+            self._loaded_at = time.monotonic()
+            return dict(counts)
+
+    # Return the sorted genre names for the dropdowns
+    def genres(self):
+        return sorted(self.counts())
+
+    def invalidate(self):
+        with self._lock:
+            self._counts = None
+            self._loaded_at = None
+
+    def _adjust(self, genre, delta):
+        genre = genre or "Unknown"
+        count = self._counts.get(genre, 0) + delta
+        if count > 0:
+            self._counts[genre] = count
+        else:
+            self._counts.pop(genre, None)
+
+    # Keep the cached counts current after a book was added, edited or deleted
+    def record_change(self, old_genre=None, new_genre=None):
+        with self._lock:
+            if self._counts is None:
+                return
+            if old_genre is not None:
+                self._adjust(old_genre, -1)
+            if new_genre is not None:
+                self._adjust(new_genre, 1)
@@ -0,0 +1,273 @@
+import logging
+import os
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING
+from pymongo.errors import ConnectionFailure
+
+from bulk_actions import borrow_change
+from catalog_io import duplicates_query, ensure_catalog_indexes
+from expiry import book_reservation_threshold
+from genres import genre_query
+from inventory import (available_copy_query, books_by_id_query, borrowed_holds_query, ensure_hold_indexes,
+                       lapsed_holds_query, reservation_query, reserved_holds_query, student_holds_query,
+                       student_title_hold_query, title_holds_query)
+from loans import (ensure_loan_indexes, fee_balances_pipeline, open_loans_query, overdue_loans_query,
+                   stale_fees_query, unpaid_returned_fees_query, unreturned_loans_query)
+from pagination import DEFAULT_PAGE_SIZE, encode_sort_cursor, keyset_query, sorted_keyset_query
+from reservations import (active_reservation_query, ensure_reservation_indexes, finished_reservations_query,
+                          room_day_query, room_reservation_query)
+from room_status import room_reservations_pipeline
+from waitlist import ensure_waitlist_indexes, student_waitlist_query, title_waitlist_query, titles_waitlist_query
+
+logger = logging.getLogger(__name__)
+
+# A query shape is flagged when it examines more than this many index keys
+# per document returned (and more than MIN_KEYS_EXAMINED keys in all, so small
+# collections do not trip it)
+MAX_KEYS_PER_RESULT = int(os.getenv("MAX_KEYS_PER_RESULT", "10"))
+MIN_KEYS_EXAMINED = int(os.getenv("MIN_KEYS_EXAMINED", "1000"))
+
+# Helper function to create the users indexes: ID numbers are unique (login,
+# register and the reservation form look users up by them), the reservation
+# form lists students' ID numbers and the students tab pages through them in
+# _id order
+def ensure_user_indexes(users_collection):
+    users_collection.create_index("IDNumber", name="IDNumber_unique", unique=True)
+    users_collection.create_index([("is_admin", ASCENDING), ("IDNumber", ASCENDING)], name="is_admin_IDNumber")
+    users_collection.create_index([("is_admin", ASCENDING), ("_id", ASCENDING)], name="is_admin_id")
+
+# Helper function to build the query for a user by ID number
+def user_query(id_number):
+    return {"IDNumber": id_number}
+
+# Helper function to build the query for the students (users who are not admins)
+def students_query():
+    return {"is_admin": False}
+
+# Helper function to create the books index for genre filters: pages of a
+# genre in _id order, genre counts and the genre list
+def ensure_genre_indexes(books_collection):
+    books_collection.create_index([("genre", ASCENDING), ("_id", ASCENDING)], name="genre_id")
+
+# Every index the app relies on: (name, collection, function creating them).
+# create_index does nothing for an index that already exists, so applying
+# them again on every deploy (or worker start) is safe.
+REQUIRED_INDEXES = [
+    ("user", "users", ensure_user_indexes),
+    ("genre", "books", ensure_genre_indexes),
+    ("book hold", "book_holds", ensure_hold_indexes),
+    ("waitlist", "book_waitlist", ensure_waitlist_indexes),
+    ("catalog", "books", ensure_catalog_indexes),
+    ("conference reservation", "conference_reservations", ensure_reservation_indexes),
+    ("loan", "loans", ensure_loan_indexes)
+]
+
+# The unique indexes booking cannot run safely without: (collection, index
+# name). They are what rejects a second hold, waitlist place or room booking
+# per student and overlapping room bookings.
+BOOKING_INDEXES = [
+    ("book_holds", "student_id_unique"),
+    ("book_waitlist", "book_id_seq"),
+    ("book_waitlist", "student_id_unique"),
+    ("conference_reservations", "active_holder_unique"),
+    ("conference_reservations", "slot_keys_unique")
+]
+
+# Create the required indexes. An index that cannot be created (e.g. a unique
+# index over existing duplicates) is logged and skipped; returns their names.
+# Once MongoDB turns out to be unreachable the rest are not tried (each would
+# wait out the server selection timeout again) and count as failed.
+def ensure_indexes(db):
+    failed = []
+    for position, (name, collection, create) in enumerate(REQUIRED_INDEXES):
+        try:
+            create(db[collection])
+        except ConnectionFailure as e:
+            logger.warning("Could not create indexes, MongoDB is unreachable: %s", e)
+            return failed + [entry[0] for entry in REQUIRED_INDEXES[position:]]
+        except Exception as e:
+            logger.warning("Could not create %s indexes: %s", name, e)
+            failed.append(name)
+    return failed
+
+# Helper function to list the booking indexes (of BOOKING_INDEXES) that do not
+# exist, as "collection.index" names
+def missing_booking_indexes(db):
+    existing = {}
+    missing = []
+    for collection, index in BOOKING_INDEXES:
+        if collection not in existing:
+            existing[collection] = db[collection].index_information()
+        if index not in existing[collection]:
+            missing.append(f"{collection}.{index}")
+    return missing
+
+# Helper function to build an explainable find command
+def find_command(collection, query, sort=None, limit=None):
+    command = {"find": collection, "filter": query}
+    if sort:
+        command["sort"] = sort
+    if limit:
+        command["limit"] = limit
+    return command
+
+# Every query shape the app runs, with sample values: (description, command).
+# The filters come from the same builders the app calls. Updates and deletes
+# are explained as finds with the same filter, which the planner treats the
+# same way. Reads of a whole collection on purpose (the search index build,
+# genre counts, exports, the room list) and one-off migrations are not listed.
+def query_shapes(now=None):
+    now = now or datetime.utcnow()
+    threshold = book_reservation_threshold(now)
+    book_id = ObjectId()
+    room_id = ObjectId()
+    student_id = "2024-00000"
+    tomorrow = (now + timedelta(days=1)).strftime("%Y-%m-%d")
+    limit = DEFAULT_PAGE_SIZE + 1
+
+    # Helper function to build the command for the page after `book_id`
+    def next_page(collection, query):
+        page_query, direction = keyset_query(query, after=str(book_id))
+        return find_command(collection, page_query, sort={"_id": direction}, limit=limit)
+
+    # Helper function to build the command for the page after a document
+    # ordered by `field`, then _id
+    def next_sorted_page(collection, query, field, order, value):
+        cursor = encode_sort_cursor({"_id": book_id, field: value}, field)
+        page_query, direction = sorted_keyset_query(query, field, order, after=cursor)
+        return find_command(collection, page_query, sort={field: direction, "_id": direction}, limit=limit)
+
+    return [
+        ("login / register: user by ID number", find_command("users", user_query(student_id), limit=1)),
+        ("reservation form: students", find_command("users", students_query())),
+        ("students tab page", next_page("users", students_query())),
+        ("catalog page", next_page("books", genre_query(None))),
+        ("catalog page by genre", next_page("books", genre_query("Fiction"))),
+        ("books by id (search results, bulk actions)", find_command("books", books_by_id_query([book_id]))),
+        ("student's books", find_command("book_holds", student_holds_query(student_id, threshold))),
+        ("student's hold of a title", find_command("book_holds", student_title_hold_query(student_id, book_id))),
+        ("reserved books tab page", next_page("book_holds", reserved_holds_query(threshold))),
+        ("reserve book: take a copy", find_command("books", available_copy_query(book_id))),
+        ("release a title's lapsed holds", find_command("book_holds", lapsed_holds_query(threshold, book_id=book_id))),
+        ("release a student's lapsed hold", find_command("book_holds", lapsed_holds_query(threshold,
+                                                                                          student_id=student_id))),
+        ("cancel book reservation", find_command("book_holds", reservation_query(book_id, student_id))),
+        ("mark borrowed", find_command("book_holds", borrow_change(book_id, now)[0])),
+        ("mark returned", find_command("book_holds", borrowed_holds_query([book_id]))),
+        ("delete a title's holds", find_command("book_holds", title_holds_query([book_id]))),
+        ("expiry sweep: lapsed book reservations", find_command("book_holds", lapsed_holds_query(threshold))),
+        ("student's waitlist entry", find_command("book_waitlist", student_waitlist_query(student_id), limit=1)),
+        ("join waitlist: last place", find_command("book_waitlist", title_waitlist_query(book_id),
+                                                   sort={"seq": -1}, limit=1)),
+        ("waitlist position", {"count": "book_waitlist", "query": title_waitlist_query(book_id, before_seq=10)}),
+        ("waitlist head", find_command("book_waitlist", title_waitlist_query(book_id, after_seq=10),
+                                       sort={"seq": 1}, limit=1)),
+        ("titles with a waitlist", {"distinct": "book_waitlist", "key": "book_id",
+                                    "query": titles_waitlist_query([book_id])}),
+        ("leave waitlist", find_command("book_waitlist", student_waitlist_query(student_id, book_id))),
+        ("delete a title's waitlist", find_command("book_waitlist", titles_waitlist_query([book_id]))),
+        ("import: duplicate check", find_command("books", duplicates_query([
+            {"title": "Title", "author": "Author"}, {"title": "Other", "author": "Author"}]))),
+        ("room status", {"aggregate": "conference_reservations", "pipeline": room_reservations_pipeline(now),
+                         "cursor": {}}),
+        ("student's active room reservation", find_command("conference_reservations",
+                                                           active_reservation_query(student_id, now), limit=1)),
+        ("room day schedule", find_command("conference_reservations", room_day_query(room_id, tomorrow),
+                                           sort={"start_time": 1})),
+        ("cancel room reservation", find_command("conference_reservations", room_reservation_query(room_id,
+                                                                                                   student_id))),
+        ("release a student's finished reservations", find_command("conference_reservations",
+                                                                   finished_reservations_query(now, student_id))),
+        ("expiry sweep: finished room reservations", find_command("conference_reservations",
+                                                                  finished_reservations_query(now))),
+        ("loans page by due date", next_sorted_page("loans", open_loans_query(), "due_at", 1, now)),
+        ("overdue loans page by fee", next_sorted_page("loans", overdue_loans_query(now), "fee", -1, 50)),
+        ("expiry sweep: accrue late fees", find_command("loans", stale_fees_query(now))),
+        ("close loans", find_command("loans", unreturned_loans_query([book_id]))),
+        ("close a title's loans", find_command("loans", unreturned_loans_query([book_id], field="book_id"))),
+        # Only the match: sorting the per-student totals after the $group is
+        # meant to happen in memory
+        ("late fee balances", {"aggregate": "loans", "pipeline": fee_balances_pipeline()[:1], "cursor": {}}),
+        ("settle a student's fees", find_command("loans", unpaid_returned_fees_query(student_id)))
+    ]
+
+# Helper function to list the stages of the winning plan(s) in an explain
+# result, e.g. ["FETCH", "IXSCAN status_reserved_by"]. Rejected plans are
+# skipped; aggregations and sharded clusters nest the winning plans deeper.
+def winning_plan_stages(explain):
+    stages = []
+
+    def walk_plan(plan):
+        if isinstance(plan, dict):
+            if "stage" in plan:
+                stages.append(f"{plan['stage']} {plan['indexName']}" if plan.get("indexName") else plan["stage"])
+            for key, value in plan.items():
+                if key not in ("stage", "rejectedPlans"):
+                    walk_plan(value)
+        elif isinstance(plan, list):
+            for item in plan:
+                walk_plan(item)
+
+    def find_winning_plans(node):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key == "winningPlan":
+                    # Slot based engine plans keep the stage tree under queryPlan
+                    walk_plan(value.get("queryPlan", value) if isinstance(value, dict) else value)
+                elif key != "rejectedPlans":
+                    find_winning_plans(value)
+        elif isinstance(node, list):
+            for item in node:
+                find_winning_plans(item)
+
+    find_winning_plans(explain)
+    return stages
+
+# Helper function to find the execution statistics in an explain result:
+# (index keys examined, documents returned), summed over the shards or
+# pipeline stages reporting them
+def execution_totals(explain):
+    keys_examined = 0
+    returned = 0
+
+    def walk(node):
+        nonlocal keys_examined, returned
+        if isinstance(node, dict):
+            stats = node.get("executionStats")
+            if isinstance(stats, dict) and "totalKeysExamined" in stats:
+                keys_examined += stats["totalKeysExamined"]
+                returned += stats.get("nReturned", 0)
+                return
+            for value in node.values():
+                walk(value)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(explain)
+    return keys_examined, returned
+
+# Helper function to list what is wrong with a query plan: a collection scan,
+# an in-memory sort, or many more index keys examined than documents returned
+def plan_problems(stages, keys_examined, returned):
+    problems = []
+    if "COLLSCAN" in stages:
+        problems.append("COLLSCAN")
+    if any(stage.upper() == "SORT" for stage in stages):
+        problems.append("SORT")
+    if keys_examined > MIN_KEYS_EXAMINED and keys_examined > MAX_KEYS_PER_RESULT * max(returned, 1):
+        problems.append(f"{keys_examined} keys for {returned} results")
+    return problems
+
+# Explain (and run) every query shape. Returns [(description, collection,
+# winning plan stages, problems)]; see plan_problems.
+def verify_query_plans(db, now=None):
+    results = []
+    for description, command in query_shapes(now):
+        collection = command.get("find") or command.get("aggregate") or command.get("count") or command.get("distinct")
+        explain = db.command("explain", command, verbosity="executionStats")
+        stages = winning_plan_stages(explain)
+        results.append((description, collection, stages, plan_problems(stages, *execution_totals(explain))))
+    return results
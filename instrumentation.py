@@ -0,0 +1,261 @@
+import atexit
+import contextvars
+import cProfile
+import hmac
+import io
+import logging
+import logging.handlers
+import os
+import pstats
+import queue
+import sys
+import threading
+import time
+
+from flask import Response, g, request, session, before_render_template, template_rendered
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# /metrics is served to logged-in admins, and to scrapers sending
+# "Authorization: Bearer <METRICS_TOKEN>" when METRICS_TOKEN is set
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Upper bounds (seconds) of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_log_listener = None
+
+# Send log records through a queue to a background thread, so request threads
+# never block on writing to stdout. Safe to call more than once.
+def configure_logging(level=None):
+    global _log_listener
+    if _log_listener:
+        return
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    _log_listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+    # The listener thread does not survive a fork; pre-forked workers need their own
+    os.register_at_fork(after_in_child=_log_listener.start)
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+# Per-request measurements, kept in a thread-local while the request runs
+class RequestStats:
+    __slots__ = ("started", "mongo_commands", "mongo_documents", "render_seconds", "render_started")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.mongo_commands = 0
+        self.mongo_documents = 0
+        self.render_seconds = 0.0
+        self.render_started = None
+
+_local = threading.local()
+
+# Stats of the request a coroutine on the shared event loop is running for
+# (also seen by asyncio.to_thread workers, which copy the context)
+_task_stats = contextvars.ContextVar("request_stats", default=None)
+
+def _current_stats():
+    return _task_stats.get() or getattr(_local, "stats", None)
+
+# Helper function to wrap a coroutine so that the MongoDB commands it runs on
+# another thread's event loop count towards the calling request
+def with_request_stats(coroutine):
+    stats = _current_stats()
+    async def run():
+        _task_stats.set(stats)
+        return await coroutine
+    return run()
+
+# Helper function to count the documents in a command reply
+def _documents_in_reply(reply):
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    if "n" in reply and isinstance(reply["n"], int):
+        return reply["n"]
+    return 0
+
+# PyMongo command listener attributing every command (and the documents it
+# returned) to the request running on the same thread, or on whose behalf the
+# current event loop task runs
+class MongoCommandListener(monitoring.CommandListener):
+    def started(self, event):
+        stats = _current_stats()
+        if stats is not None:
+            stats.mongo_commands += 1
+
+    def succeeded(self, event):
+        stats = _current_stats()
+        if stats is not None and event.command_name in ("find", "getMore", "aggregate", "count", "distinct"):
+            stats.mongo_documents += _documents_in_reply(event.reply)
+
+    def failed(self, event):
+        pass
+
+# Collects per-route request metrics and renders them, together with any
+# registered collectors, in the Prometheus text exposition format
+class Instrumentation:
+    def __init__(self):
+        self.command_listener = MongoCommandListener()
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._collectors = []
+        self.profiling_enabled = os.getenv("PROFILING_ENABLED", "0").lower() in ("1", "true", "yes")
+
+    # Register a callable returning [(metric name, type, help, value or {labels tuple: value})]
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.add_url_rule("/metrics", "metrics", self.metrics_view)
+
+    def _before_request(self):
+        _local.stats = RequestStats()
+        # Profiles expose code paths and timings, so only metrics readers get them
+        mode = None
+        if self.profiling_enabled and request.args.get("profile") and self.may_read_metrics():
+            mode = request.args.get("profile")
+        if mode == "pyinstrument":
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                logger.warning("pyinstrument is not installed; falling back to cProfile")
+            else:
+                g.pyinstrument_profiler = Profiler()
+                g.pyinstrument_profiler.start()
+                return
+        if mode:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    def _before_render(self, sender, template, context, **extra):
+        stats = _current_stats()
+        if stats is not None:
+            stats.render_started = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        stats = _current_stats()
+        if stats is not None and stats.render_started is not None:
+            stats.render_seconds += time.perf_counter() - stats.render_started
+            stats.render_started = None
+
+    def _after_request(self, response):
+        stats = _current_stats()
+        if stats is None:
+            return response
+        duration = time.perf_counter() - stats.started
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        self._record(route, request.method, response.status_code, duration, stats)
+        logger.debug("%s %s %s %.1fms mongo=%d docs=%d render=%.1fms", request.method, request.path,
+                     response.status_code, duration * 1000, stats.mongo_commands, stats.mongo_documents,
+                     stats.render_seconds * 1000)
+        pyinstrument_profiler = g.pop("pyinstrument_profiler", None)
+        if pyinstrument_profiler:
+            pyinstrument_profiler.stop()
+            return Response(pyinstrument_profiler.output_html(), mimetype="text/html")
+        profiler = g.pop("profiler", None)
+        if profiler:
+            profiler.disable()
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(50)
+            return Response(output.getvalue(), mimetype="text/plain")
+        return response
+
+    def _teardown_request(self, exc):
+        _local.stats = None
+
+    def _record(self, route, method, status, duration, stats):
+        with self._lock:
+            entry = self._routes.get((route, method))
+            if entry is None:
+                entry = self._routes[(route, method)] = {
+                    "statuses": {},
+                    "duration_sum": 0.0,
+                    "buckets": [0] * len(DURATION_BUCKETS),
+                    "mongo_commands": 0,
+                    "mongo_documents": 0,
+                    "render_seconds": 0.0
+                }
+            entry["statuses"][status] = entry["statuses"].get(status, 0) + 1
+            entry["duration_sum"] += duration
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    entry["buckets"][i] += 1
+            entry["mongo_commands"] += stats.mongo_commands
+            entry["mongo_documents"] += stats.mongo_documents
+            entry["render_seconds"] += stats.render_seconds
+
+    def render_prometheus(self):
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def labels(**values):
+            return "{" + ",".join(f'{key}="{value}"' for key, value in values.items()) + "}"
+
+        with self._lock:
+            routes = {key: {**entry, "statuses": dict(entry["statuses"]), "buckets": list(entry["buckets"])}
+                      for key, entry in self._routes.items()}
+
+        header("library_http_requests_total", "counter", "HTTP requests by route, method and status.")
+        for (route, method), entry in sorted(routes.items()):
+            for status, count in sorted(entry["statuses"].items()):
+                lines.append(f"library_http_requests_total{labels(route=route, method=method, status=status)} {count}")
+        header("library_http_request_duration_seconds", "histogram", "Wall time per request.")
+        for (route, method), entry in sorted(routes.items()):
+            total = sum(entry["statuses"].values())
+            for bound, count in zip(DURATION_BUCKETS, entry["buckets"]):
+                lines.append(f"library_http_request_duration_seconds_bucket{labels(route=route, method=method, le=bound)} {count}")
+            lines.append(f"library_http_request_duration_seconds_bucket{labels(route=route, method=method, le='+Inf')} {total}")
+            lines.append(f"library_http_request_duration_seconds_sum{labels(route=route, method=method)} {entry['duration_sum']:.6f}")
+            lines.append(f"library_http_request_duration_seconds_count{labels(route=route, method=method)} {total}")
+        for name, key, help_text in (
+            ("library_mongo_commands_total", "mongo_commands", "MongoDB commands issued while serving the route."),
+            ("library_mongo_documents_returned_total", "mongo_documents", "Documents returned by MongoDB to the route."),
+            ("library_template_render_seconds_total", "render_seconds", "Time spent rendering templates for the route.")
+        ):
+            header(name, "counter", help_text)
+            for (route, method), entry in sorted(routes.items()):
+                lines.append(f"{name}{labels(route=route, method=method)} {entry[key]}")
+
+        for collector in self._collectors:
+            try:
+                metrics = collector()
+            except Exception as e:
+                logger.warning("Metrics collector failed: %s", e)
+                continue
+            for name, kind, help_text, value in metrics:
+                header(name, kind, help_text)
+                if isinstance(value, dict):
+                    for label_values, sample in value.items():
+                        lines.append(f"{name}{labels(**dict(label_values))} {sample}")
+                else:
+                    lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    # Helper function to check that the caller may read the metrics
+    def may_read_metrics(self):
+        if session.get("user", {}).get("is_admin", False):
+            return True
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        return bool(METRICS_TOKEN) and scheme.lower() == "bearer" and hmac.compare_digest(token, METRICS_TOKEN)
+
+    def metrics_view(self):
+        if not self.may_read_metrics():
+            return Response("Forbidden\n", status=403, mimetype="text/plain")
+        return Response(self.render_prometheus(), mimetype="text/plain; version=0.0.4")
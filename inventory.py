@@ -0,0 +1,278 @@
+from collections import Counter
+from datetime import datetime
+
+from pymongo import ASCENDING, DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from waitlist import claim_waitlist_entry, restore_waitlist_entry, titles_with_waiters, waitlist_counters
+
+# Book inventory. A `books` document is a title with copy counters:
+#   {title, author, genre, total_copies, available_copies}
+# and every copy that is out is a document in the book_holds collection:
+#   {book_id, student_id, status ("reserved" or "borrowed"), reserved_at,
+#    borrowed_at, title, author, genre}
+# Taking a copy is a conditional $inc of available_copies (it never goes below
+# zero), so whether a title can be reserved is a single field read, and list
+# views scale with the number of titles rather than copies. A hold is removed
+# before its copy is counted back in, so a title never shows more copies
+# available than it has on the shelf. A copy put back while students are on
+# the title's waitlist is not counted in at all: it becomes a reservation of
+# the first student in the queue who can take it, so nobody can take it in
+# between.
+
+# Fields of a title the book lists need
+TITLE_FIELDS = {"title": 1, "author": 1, "genre": 1, "total_copies": 1, "available_copies": 1}
+
+# Fields of the old one-document-per-copy schema, dropped by the migration
+LEGACY_COPY_FIELDS = ("status", "reserved_by", "reserved_at", "borrowed_at", "returned_at", "active_holder")
+
+# Helper function to create the book_holds indexes: one hold per student
+# (the unique index rejects a second reservation as part of the insert), the
+# holds of a title, reservations by age (lapsed ones are released) and
+# reservations in _id order (the reserved books tab)
+def ensure_hold_indexes(holds_collection):
+    holds_collection.create_index("student_id", name="student_id_unique", unique=True)
+    holds_collection.create_index([("book_id", ASCENDING), ("status", ASCENDING)], name="book_id_status")
+    holds_collection.create_index([("status", ASCENDING), ("reserved_at", ASCENDING)], name="status_reserved_at")
+    holds_collection.create_index([("status", ASCENDING), ("_id", ASCENDING)], name="status_id")
+
+# Helper function to build a new title document
+def new_title(title, author, genre, copies=1):
+    return {"title": title, "author": author, "genre": genre, "total_copies": copies, "available_copies": copies}
+
+# Helper function to read a number of copies from a form or import row; blank
+# means `default`, anything but a positive whole number gives None
+def parse_copies(value, default=1):
+    value = str(value if value is not None else "").strip()
+    if not value:
+        return default
+    try:
+        copies = int(value)
+    except ValueError:
+        return None
+    return copies if copies > 0 else None
+
+# Helper function to build the hold of a copy a student just reserved
+def new_hold(book, student_id, now):
+    return {
+        "book_id": book["_id"],
+        "student_id": student_id,
+        "status": "reserved",
+        "reserved_at": now,
+        "title": book.get("title"),
+        "author": book.get("author"),
+        "genre": book.get("genre", "Unknown")
+    }
+
+# Helper function to build the query for books by id
+def books_by_id_query(book_ids):
+    return {"_id": {"$in": list(book_ids)}}
+
+# Helper function to build the query for a title with a copy available
+def available_copy_query(book_id):
+    return {"_id": book_id, "available_copies": {"$gt": 0}}
+
+# Take one copy of a title; returns the title after the change, or None when
+# no copy is available
+def claim_copy(books_collection, book_id):
+    return books_collection.find_one_and_update(
+        available_copy_query(book_id),
+        {"$inc": {"available_copies": -1}},
+        projection=TITLE_FIELDS,
+        return_document=ReturnDocument.AFTER
+    )
+
+# Count copies back in, {book_id: copies}, with one bulk write
+def release_copies(books_collection, copies_by_book):
+    operations = [UpdateOne({"_id": book_id}, {"$inc": {"available_copies": copies}})
+                  for book_id, copies in copies_by_book.items() if copies]
+    if operations:
+        books_collection.bulk_write(operations, ordered=False)
+
+# Hand up to `copies` copies of a title to the students waiting for it, oldest
+# first, as reservations starting now. Returns the copies handed out.
+# Each entry is taken off the queue atomically before its hold is inserted,
+# so concurrent handoffs never pick the same student and no entry outlives
+# its student's reservation; if the insert fails the entry is put back in its
+# place. A student who holds another book by now cannot take a copy (the
+# unique student_id index of the holds rejects it); they keep their place and
+# the copy goes to the next student.
+def hand_to_waitlist(holds_collection, waitlist_collection, book_id, copies, now=None):
+    now = now or datetime.utcnow()
+    handed = 0
+    after_seq = None
+    while handed < copies:
+        entry = claim_waitlist_entry(waitlist_collection, book_id, after_seq)
+        if entry is None:
+            break
+        after_seq = entry["seq"]
+        book = {"_id": book_id, "title": entry.get("title"), "author": entry.get("author"), "genre": entry.get("genre")}
+        try:
+            holds_collection.insert_one(new_hold(book, entry["student_id"], now))
+        except DuplicateKeyError:
+            # A student who reserved this very title while waiting is done waiting
+            if not holds_collection.find_one(student_title_hold_query(entry["student_id"], book_id), {"_id": 1}):
+                restore_waitlist_entry(waitlist_collection, entry)
+                waitlist_counters.inc("book_waitlist_skipped_total")
+            continue
+        except Exception:
+            restore_waitlist_entry(waitlist_collection, entry)
+            raise
+        waitlist_counters.inc("book_waitlist_promotions_total")
+        handed += 1
+    return handed
+
+# Put copies back, {book_id: copies}: first to the waitlists of the titles
+# that have one (when waitlist_collection is given), the rest are counted back
+# in with one bulk write
+def put_back_copies(books_collection, holds_collection, waitlist_collection, copies_by_book):
+    copies_by_book = dict(copies_by_book)
+    if waitlist_collection is not None and copies_by_book:
+        for book_id in titles_with_waiters(waitlist_collection, copies_by_book):
+            copies_by_book[book_id] -= hand_to_waitlist(holds_collection, waitlist_collection, book_id,
+                                                        copies_by_book[book_id])
+    release_copies(books_collection, copies_by_book)
+
+# Hand copies counted as available to a title's waitlist, e.g. after copies
+# were added to it; returns the copies handed out
+def fill_from_waitlist(books_collection, holds_collection, waitlist_collection, book_id):
+    handed = 0
+    while titles_with_waiters(waitlist_collection, [book_id]) and claim_copy(books_collection, book_id):
+        if not hand_to_waitlist(holds_collection, waitlist_collection, book_id, 1):
+            release_copies(books_collection, {book_id: 1})
+            break
+        handed += 1
+    return handed
+
+# Delete holds (documents read beforehand) that still match `guard`, and put
+# their copies back unless release is False. Returns the holds deleted; holds
+# changed concurrently by another request are left alone.
+def delete_holds(books_collection, holds_collection, holds, guard=None, release=True, waitlist_collection=None):
+    if not holds:
+        return []
+    result = holds_collection.bulk_write([DeleteOne({"_id": hold["_id"], **(guard or {})}) for hold in holds],
+                                         ordered=False)
+    if result.deleted_count < len(holds):
+        remaining = {hold["_id"] for hold in holds_collection.find({"_id": {"$in": [h["_id"] for h in holds]}},
+                                                                    {"_id": 1})}
+        holds = [hold for hold in holds if hold["_id"] not in remaining]
+    if release:
+        put_back_copies(books_collection, holds_collection, waitlist_collection,
+                        Counter(hold["book_id"] for hold in holds))
+    return holds
+
+# Return borrowed copies; returns the holds that were closed
+def return_holds(books_collection, holds_collection, hold_ids, waitlist_collection=None):
+    holds = list(holds_collection.find(borrowed_holds_query(hold_ids)))
+    return delete_holds(books_collection, holds_collection, holds, {"status": "borrowed"},
+                        waitlist_collection=waitlist_collection)
+
+# Cancel a student's reservation of a title; returns whether there was one
+def cancel_hold(books_collection, holds_collection, book_id, student_id, waitlist_collection=None):
+    hold = holds_collection.find_one_and_delete(reservation_query(book_id, student_id))
+    if hold:
+        put_back_copies(books_collection, holds_collection, waitlist_collection, {book_id: 1})
+    return hold is not None
+
+# Release reservations made before `threshold` (optionally of one title or
+# one student); returns the holds released
+def release_lapsed_holds(books_collection, holds_collection, threshold, waitlist_collection=None, **filters):
+    holds = list(holds_collection.find(lapsed_holds_query(threshold, **filters), {"book_id": 1}))
+    return delete_holds(books_collection, holds_collection, holds, lapsed_holds_query(threshold),
+                        waitlist_collection=waitlist_collection)
+
+# Change the number of copies of a title. Fails (returns False) when more
+# copies are out than the new total.
+def set_total_copies(books_collection, book, total_copies):
+    delta = total_copies - book.get("total_copies", 1)
+    if not delta:
+        return True
+    result = books_collection.update_one(
+        {"_id": book["_id"], "total_copies": book.get("total_copies", 1), "available_copies": {"$gte": -delta}},
+        {"$inc": {"total_copies": delta, "available_copies": delta}}
+    )
+    return result.modified_count == 1
+
+# Helper function to build the query for the holds of a student (reservations
+# made after `threshold`, i.e. not lapsed, and borrowed books)
+def student_holds_query(student_id, threshold):
+    return {
+        "$or": [
+            {"student_id": student_id, "status": "reserved", "reserved_at": {"$gte": threshold}},
+            {"student_id": student_id, "status": "borrowed"}
+        ]
+    }
+
+# Helper function to build the query for the reservations made since
+# `threshold` (not lapsed), i.e. copies waiting to be picked up
+def reserved_holds_query(threshold):
+    return {"status": "reserved", "reserved_at": {"$gte": threshold}}
+
+# Helper function to build the query for the reservations made before
+# `threshold` (lapsed), optionally of one title (book_id=) or student (student_id=)
+def lapsed_holds_query(threshold, **filters):
+    return dict(filters, status="reserved", reserved_at={"$lt": threshold})
+
+# Helper function to build the query for a student's reservation of a title
+def reservation_query(book_id, student_id):
+    return {"book_id": book_id, "student_id": student_id, "status": "reserved"}
+
+# Helper function to build the query for a student's hold of a title, in any status
+def student_title_hold_query(student_id, book_id):
+    return {"student_id": student_id, "book_id": book_id}
+
+# Helper function to build the query for the given holds that are borrowed
+def borrowed_holds_query(hold_ids):
+    return {"_id": {"$in": list(hold_ids)}, "status": "borrowed"}
+
+# Helper function to build the query for every hold of the given titles
+def title_holds_query(book_ids):
+    return {"book_id": {"$in": list(book_ids)}}
+
+# Migration from one document per physical copy (each with its own status)
+# to titles with copy counters plus holds. Copies with the same title, author
+# and genre are merged into the first one; every reserved (not lapsed) or
+# borrowed copy becomes a hold with the copy's _id, so loans opened for a copy
+# keep pointing at their hold. Safe to run again. Returns (titles, copies, holds).
+def migrate_book_copies(books_collection, holds_collection, loans_collection, threshold):
+    groups = {}
+    for doc in books_collection.find({"total_copies": {"$exists": False}}).sort("_id", ASCENDING):
+        groups.setdefault((doc.get("title"), doc.get("author"), doc.get("genre", "Unknown")), []).append(doc)
+    copies_migrated = 0
+    holds_created = 0
+    for (title, author, genre), docs in groups.items():
+        existing = books_collection.find_one({"title": title, "author": author, "genre": genre,
+                                              "total_copies": {"$exists": True}}, {"_id": 1})
+        book_id = existing["_id"] if existing else docs[0]["_id"]
+        holds = [
+            {"_id": doc["_id"], "book_id": book_id, "student_id": doc["reserved_by"], "status": doc["status"],
+             "reserved_at": doc.get("reserved_at"), "borrowed_at": doc.get("borrowed_at"),
+             "title": title, "author": author, "genre": genre}
+            for doc in docs
+            if doc.get("reserved_by") and (doc.get("status") == "borrowed" or (
+                doc.get("status") == "reserved" and doc.get("reserved_at") and doc["reserved_at"] >= threshold))
+        ]
+        copies_out = 0
+        if holds:
+            try:
+                holds_created += len(holds_collection.insert_many(holds, ordered=False).inserted_ids)
+            except BulkWriteError as e:
+                # Holds created by an earlier, interrupted run, or rejected
+                # because the student already holds another copy
+                if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                    raise
+                holds_created += e.details["nInserted"]
+            # A copy whose hold was rejected is back on the shelf
+            copies_out = holds_collection.count_documents({"_id": {"$in": [hold["_id"] for hold in holds]}})
+        counters = {"total_copies": len(docs), "available_copies": len(docs) - copies_out}
+        if existing:
+            books_collection.update_one({"_id": book_id}, {"$inc": counters})
+        else:
+            books_collection.update_one({"_id": book_id}, {"$set": counters,
+                                                           "$unset": dict.fromkeys(LEGACY_COPY_FIELDS, "")})
+        copy_ids = [doc["_id"] for doc in docs]
+        loans_collection.update_many({"book_id": {"$in": copy_ids}, "hold_id": {"$exists": False}},
+                                     [{"$set": {"hold_id": "$book_id", "book_id": book_id}}])
+        books_collection.delete_many({"_id": {"$in": [copy_id for copy_id in copy_ids if copy_id != book_id]}})
+        copies_migrated += len(docs)
+    return len(groups), copies_migrated, holds_created
@@ -0,0 +1,237 @@
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger("library")
+
+# Production server settings (see README)
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("WEB_PORT", "8000"))
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", str(min(2 * (os.cpu_count() or 1) + 1, 8))))
+WEB_THREADS = int(os.getenv("WEB_THREADS", "4"))
+WEB_SERVER = os.getenv("WEB_SERVER", "auto")
+
+# Helper function to pick the best installed server: gunicorn (not available on
+# Windows), then waitress, then Flask's development server
+def default_server():
+    if sys.platform != "win32" and importlib.util.find_spec("gunicorn"):
+        return "gunicorn"
+    if importlib.util.find_spec("waitress"):
+        return "waitress"
+    return "dev"
+
+def serve(args):
+    started = time.perf_counter()
+    import app as library_app
+    application = library_app.create_app()
+    logger.info("App created in %.0f ms", (time.perf_counter() - started) * 1000)
+
+    server = default_server() if args.server == "auto" else args.server
+    # Live update streams each hold a thread; they get their own on top of
+    # the threads for pages
+    from live_updates import server_threads
+    threads = server_threads(args.threads, library_app.availability_feed.max_clients)
+    logger.info("Serving on %s:%d with %s (%d worker(s), %d thread(s) for pages, %d in all)", args.host, args.port,
+                server, args.workers if server == "gunicorn" else 1, args.threads, threads)
+    if server == "gunicorn":
+        from gunicorn.app.base import BaseApplication
+
+        # The app does no network I/O until its first request, so it is loaded
+        # once in the master; each worker opens its own MongoDB client
+        class GunicornServer(BaseApplication):
+            def load_config(self):
+                self.cfg.set("bind", f"{args.host}:{args.port}")
+                self.cfg.set("workers", args.workers)
+                self.cfg.set("threads", threads)
+                self.cfg.set("worker_class", "gthread")
+                self.cfg.set("timeout", 60)
+
+            def load(self):
+                return application
+
+        GunicornServer().run()
+    elif server == "waitress":
+        from waitress import serve as waitress_serve
+
+        waitress_serve(application, host=args.host, port=args.port, threads=threads)
+    else:
+        logger.warning("Using Flask's development server; install gunicorn or waitress for production")
+        application.run(host=args.host, port=args.port, threaded=True)
+
+def migrate(args):
+    import app as library_app
+    from loans import backfill_loans
+    from migrate_reservations import migrate as migrate_reservations
+
+    library_app.create_app()
+    migrate_reservations(library_app.mongo.db)
+    opened = backfill_loans(library_app.mongo.db.loans, library_app.mongo.db.book_holds)
+    if opened:
+        logger.info("Opened loans for %d copies borrowed before the loans ledger", opened)
+    library_app.ensure_indexes()
+
+# Apply the required indexes; with --verify, also explain every query shape the
+# app runs and fail if any of them scans a whole collection, sorts in memory
+# or examines far more index keys than it returns
+def indexes(args):
+    import app as library_app
+    from indexes import verify_query_plans
+
+    library_app.create_app()
+    failed = library_app.ensure_indexes()
+    if failed:
+        logger.error("Could not create the %s indexes", ", ".join(failed))
+    if not args.verify:
+        sys.exit(1 if failed else 0)
+    results = verify_query_plans(library_app.mongo.db)
+    for description, collection, stages, problems in results:
+        print(f"{', '.join(problems) or 'ok':<10}{collection:<26}{description:<46}{' > '.join(stages)}")
+    flagged = [description for description, _, _, problems in results if problems]
+    if flagged:
+        logger.error("%d of %d query shapes have inefficient plans", len(flagged), len(results))
+    sys.exit(1 if flagged or failed else 0)
+
+def seed(args):
+    if not args.yes:
+        sys.exit("seed deletes every user, book and reservation in the database; pass --yes to continue")
+    import app as library_app
+    from benchmarks.seed import BENCHMARK_PASSWORD, seed as seed_database
+
+    library_app.create_app()
+    library_app.ensure_indexes()
+    seed_database(library_app.mongo.db, books=args.books, students=args.students, rooms=args.rooms,
+                  reservations_per_room=args.reservations_per_room)
+    library_app.catalog_version.bump()
+    print(f"Seeded {args.books} books, {args.students} students and {args.rooms} rooms "
+          f"(every account's password is '{BENCHMARK_PASSWORD}')")
+
+# Import books from a CSV or JSON Lines file. Progress is saved to
+# <file>.progress after every batch, so --resume continues where a failed
+# import stopped.
+def import_catalog(args):
+    import app as library_app
+    from catalog_io import format_from_filename, import_books, read_records
+
+    library_app.create_app()
+    library_app.ensure_indexes()
+    progress_path = args.file + ".progress"
+    start_at = 0
+    if args.resume and os.path.exists(progress_path):
+        with open(progress_path) as f:
+            start_at = json.load(f)["position"]
+        logger.info("Resuming after row %d", start_at)
+
+    def save_progress(report):
+        with open(progress_path, "w") as f:
+            json.dump(report._asdict(), f)
+        logger.info("%d rows read: %d added, %d duplicates, %d invalid",
+                    report.position, report.inserted, report.duplicates, report.invalid)
+
+    fmt = args.format or format_from_filename(args.file)
+    with open(args.file, encoding="utf-8-sig", newline="") as f:
+        report = import_books(library_app.mongo.db.books, read_records(f, fmt), batch_size=args.batch_size,
+                              start_at=start_at, on_progress=save_progress)
+    if report.inserted:
+        library_app.catalog_version.bump()
+    for error in report.errors:
+        logger.warning("%s", error)
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    print(f"Imported {report.inserted} book(s); skipped {report.duplicates} duplicate(s) "
+          f"and {report.invalid} invalid row(s)")
+
+def export_catalog(args):
+    import app as library_app
+    from catalog_io import export_books
+
+    library_app.create_app()
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        for chunk in export_books(library_app.mongo.db.books, args.format):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+# Cold start: time `import app` + create_app() in fresh interpreters. No
+# MongoDB is needed, since nothing connects before the first request.
+def startup_time(args):
+    probe = ("import time; started = time.perf_counter(); import app; app.create_app(); "
+             "print(time.perf_counter() - started)")
+    env = dict(os.environ, EXPIRY_SCHEDULER="off", LOG_LEVEL="WARNING")
+    env.setdefault("MONGO_URI", "mongodb://localhost:27017")
+    app_times = []
+    process_times = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", probe], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout
+        process_times.append(time.perf_counter() - started)
+        app_times.append(float(output.strip().splitlines()[-1]))
+    for label, samples in (("import app + create_app()", app_times), ("whole process", process_times)):
+        print(f"{label:<28} median {statistics.median(samples) * 1000:7.1f} ms   "
+              f"min {min(samples) * 1000:7.1f} ms   max {max(samples) * 1000:7.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(prog="library", description="Library management system")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run the web app with a production server")
+    serve_parser.add_argument("--server", choices=["auto", "gunicorn", "waitress", "dev"], default=WEB_SERVER)
+    serve_parser.add_argument("--host", default=WEB_HOST)
+    serve_parser.add_argument("--port", type=int, default=WEB_PORT)
+    serve_parser.add_argument("--workers", type=int, default=WEB_WORKERS, help="worker processes (gunicorn)")
+    serve_parser.add_argument("--threads", type=int, default=WEB_THREADS, help="threads per worker")
+    serve_parser.set_defaults(handler=serve)
+
+    migrate_parser = commands.add_parser("migrate", help="migrate stored data and create the indexes")
+    migrate_parser.set_defaults(handler=migrate)
+
+    indexes_parser = commands.add_parser("indexes", help="create the indexes (and verify the query plans)")
+    indexes_parser.add_argument("--verify", action="store_true",
+                                help="explain every query shape and fail on collection scans, in-memory sorts "
+                                     "or too many keys examined")
+    indexes_parser.set_defaults(handler=indexes)
+
+    seed_parser = commands.add_parser("seed", help="replace the database contents with synthetic data")
+    seed_parser.add_argument("--yes", action="store_true", help="confirm that existing data is deleted")
+    seed_parser.add_argument("--books", type=int, default=1000)
+    seed_parser.add_argument("--students", type=int, default=100)
+    seed_parser.add_argument("--rooms", type=int, default=2)
+    seed_parser.add_argument("--reservations-per-room", type=int, default=5)
+    seed_parser.set_defaults(handler=seed)
+
+    import_parser = commands.add_parser("import", help="import books from a CSV or JSON Lines file")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--format", choices=["csv", "jsonl"], help="default: from the file extension")
+    import_parser.add_argument("--batch-size", type=int, default=int(os.getenv("IMPORT_BATCH_SIZE", "1000")))
+    import_parser.add_argument("--resume", action="store_true", help="continue an interrupted import")
+    import_parser.set_defaults(handler=import_catalog)
+
+    export_parser = commands.add_parser("export", help="export the catalog as CSV or JSON Lines")
+    export_parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    export_parser.add_argument("--output", help="file to write (default: stdout)")
+    export_parser.set_defaults(handler=export_catalog)
+
+    startup_parser = commands.add_parser("startup-time", help="measure cold start time")
+    startup_parser.add_argument("--runs", type=int, default=5)
+    startup_parser.set_defaults(handler=startup_time)
+
+    args = parser.parse_args()
+    from instrumentation import configure_logging
+
+    configure_logging()
+    try:
+        args.handler(args)
+    except RuntimeError as e:
+        logger.critical("%s", e)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
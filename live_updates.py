@@ -0,0 +1,233 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Live update settings (see README). Browsers subscribe to /events
+# (Server-Sent Events) when the student turns live updates on; every
+# subscriber gets a queue of at most LIVE_QUEUE_SIZE events. Each open stream
+# holds a server thread for as long as it lasts (an idle thread blocked on its
+# queue), so a worker process serves at most LIVE_MAX_CLIENTS streams and is
+# given that many threads on top of the ones for pages (see server_threads).
+# Streams send a comment every LIVE_HEARTBEAT_SECONDS and end after
+# LIVE_STREAM_SECONDS (the browser reconnects), so threads are handed back
+# regularly.
+LIVE_UPDATES = os.getenv("LIVE_UPDATES", "on").lower() != "off"
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "100"))
+LIVE_MAX_CLIENTS = int(os.getenv("LIVE_MAX_CLIENTS", "32")) if LIVE_UPDATES else 0
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+LIVE_STREAM_SECONDS = float(os.getenv("LIVE_STREAM_SECONDS", "300"))
+
+# Collections watched for availability changes
+WATCHED_COLLECTIONS = ("books", "conference_reservations")
+
+# Helper function to get the threads a worker process needs to serve pages
+# with `threads` threads while holding up to `streams` live update streams
+def server_threads(threads, streams=LIVE_MAX_CLIENTS):
+    return threads + max(streams, 0)
+
+# Raised when a worker already serves as many streams as it may
+class TooManySubscribers(Exception):
+    pass
+
+# Raised when change streams are not available (MongoDB is not a replica set)
+class LiveUpdatesUnavailable(Exception):
+    pass
+
+# Helper function to build the change stream pipeline: inserts, updates and
+# deletes of the watched collections, trimmed to the fields the deltas need
+def change_stream_pipeline():
+    return [
+        {"$match": {"ns.coll": {"$in": list(WATCHED_COLLECTIONS)},
+                    "operationType": {"$in": ["insert", "update", "replace", "delete"]}}},
+        {"$project": {"operationType": 1, "ns.coll": 1, "documentKey": 1, "fullDocument.available_copies": 1,
+                      "updateDescription.updatedFields.available_copies": 1}}
+    ]
+
+# Helper function to turn a books change event into a delta ({"type": "book",
+# "id", "available"}, or "deleted" for a removed title), or None when the
+# number of available copies did not change
+def book_delta(change):
+    book_id = str(change["documentKey"]["_id"])
+    if change["operationType"] == "delete":
+        return {"type": "book", "id": book_id, "deleted": True}
+    if change["operationType"] == "update":
+        available = change.get("updateDescription", {}).get("updatedFields", {}).get("available_copies")
+    else:
+        available = change.get("fullDocument", {}).get("available_copies")
+    return {"type": "book", "id": book_id, "available": available} if available is not None else None
+
+# Helper function to format an event for an SSE stream
+def format_event(event):
+    return f"data: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+# One connected browser: a bounded queue of events. A subscriber that falls
+# LIVE_QUEUE_SIZE events behind loses them and is told to reload instead.
+class Subscription:
+    def __init__(self, max_events=LIVE_QUEUE_SIZE):
+        self._events = queue.Queue(max_events)
+        self.lagged = 0
+
+    def put(self, event):
+        try:
+            self._events.put_nowait(event)
+        except queue.Full:
+            self.lagged += 1
+            with self._events.mutex:
+                self._events.queue.clear()
+            self._events.put_nowait({"type": "resync"})
+
+    # Wait for the next event (None after `timeout` seconds)
+    def get(self, timeout):
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+# Watches the books and conference reservations with one MongoDB change stream
+# per worker process (started with the first subscriber, and again after a
+# fork) and fans compact availability deltas out to the subscribers:
+#   {"type": "book", "id", "available"}  copies of a title available now
+#   {"type": "rooms", "rooms": [...]}  conference room status (see room_status_loader)
+# Room changes that arrive together (e.g. an expiry sweep) produce one event.
+# room_status_loader() is called on the watcher thread after room changes and
+# returns the rooms' compact status.
+class AvailabilityFeed:
+    def __init__(self, get_db, room_status_loader, max_clients=LIVE_MAX_CLIENTS, max_await_ms=1000):
+        self.get_db = get_db
+        self.room_status_loader = room_status_loader
+        self.max_clients = max_clients
+        self.max_await_ms = max_await_ms
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+        self._pid = None
+        self._stop_event = threading.Event()
+        self.unavailable = None
+        self._metrics = {"events_total": 0, "deltas_total": 0, "watch_errors_total": 0, "lagged_total": 0}
+
+    def subscribe(self):
+        if self.unavailable:
+            raise LiveUpdatesUnavailable(self.unavailable)
+        subscription = Subscription()
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                raise TooManySubscribers(f"{self.max_clients} live update streams already open")
+            self._subscribers.add(subscription)
+            self._ensure_watching()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+            self._metrics["lagged_total"] += subscription.lagged
+            subscription.lagged = 0
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._metrics["deltas_total"] += 1
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def _ensure_watching(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._stop_event.clear()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(target=self._run, name="live-updates", daemon=True)
+        self._thread.start()
+
+    def _watch(self, resume_token):
+        from pymongo.errors import OperationFailure
+
+        try:
+            stream = self.get_db().watch(change_stream_pipeline(), resume_after=resume_token,
+                                         max_await_time_ms=self.max_await_ms)
+        except OperationFailure as e:
+            # e.g. "The $changeStream stage is only supported on replica sets"
+            if e.code in (40573, 40324, 136):
+                self.unavailable = str(e)
+                logger.error("Live updates disabled, change streams are not available: %s", e)
+                self.publish({"type": "unavailable"})
+                return None
+            raise
+        with stream:
+            while not self._stop_event.is_set():
+                rooms_changed = False
+                batch = 0
+                change = stream.try_next()
+                while change is not None and batch < 500:
+                    batch += 1
+                    resume_token = stream.resume_token
+                    with self._lock:
+                        self._metrics["events_total"] += 1
+                    if change["ns"]["coll"] == "books":
+                        delta = book_delta(change)
+                        if delta:
+                            self.publish(delta)
+                    else:
+                        rooms_changed = True
+                    change = stream.try_next()
+                resume_token = stream.resume_token or resume_token
+                if rooms_changed:
+                    self.publish({"type": "rooms", "rooms": self.room_status_loader()})
+                with self._lock:
+                    if not self._subscribers:
+                        break  # Nobody is listening; start again with the next subscriber
+        return resume_token
+
+    def _run(self):
+        resume_token = None
+        failures = 0
+        while not self._stop_event.is_set():
+            try:
+                resume_token = self._watch(resume_token)
+                failures = 0
+            except Exception as e:
+                failures += 1
+                with self._lock:
+                    self._metrics["watch_errors_total"] += 1
+                logger.warning("Change stream failed (%s); reconnecting", e)
+                if failures > 1:
+                    resume_token = None  # The token itself may be the problem
+                self._stop_event.wait(min(30, 2 ** failures))
+                continue
+            with self._lock:
+                if self.unavailable or not self._subscribers:
+                    self._thread = None
+                    return
+
+    def stop(self):
+        self._stop_event.set()
+
+    # Stream the events of a new subscription as Server-Sent Events
+    def stream(self, subscription, heartbeat=LIVE_HEARTBEAT_SECONDS, duration=LIVE_STREAM_SECONDS):
+        try:
+            yield "retry: 5000\n\n"
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                event = subscription.get(timeout=min(heartbeat, max(deadline - time.monotonic(), 0.01)))
+                yield format_event(event) if event is not None else ": keep-alive\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+    # Metrics in the format expected by Instrumentation.register_collector
+    def collect(self):
+        with self._lock:
+            lagged = self._metrics["lagged_total"] + sum(subscription.lagged for subscription in self._subscribers)
+            return [
+                ("library_live_subscribers", "gauge", "Open live update streams.", len(self._subscribers)),
+                ("library_live_change_events_total", "counter", "Change stream events received.",
+                 self._metrics["events_total"]),
+                ("library_live_deltas_total", "counter", "Availability deltas sent to subscribers.",
+                 self._metrics["deltas_total"]),
+                ("library_live_watch_errors_total", "counter", "Change stream failures.",
+                 self._metrics["watch_errors_total"]),
+                ("library_live_lagged_total", "counter", "Times a subscriber fell behind and was told to reload.",
+                 lagged)
+            ]
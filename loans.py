@@ -0,0 +1,160 @@
+import os
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, UpdateOne
+
+# Loan settings (see README): books are lent for LOAN_DAYS days and every day
+# (or part of a day) past the due date costs LATE_FEE_PER_DAY pesos
+LOAN_DAYS = int(os.getenv("LOAN_DAYS", "7"))
+LATE_FEE_PER_DAY = int(os.getenv("LATE_FEE_PER_DAY", "25"))
+DAY_MS = 24 * 60 * 60 * 1000
+
+# Every borrowing is a document in the loans collection:
+#   {hold_id, book_id, title, author, student_id, borrowed_at, due_at,
+#    returned_at, overdue_days, fee, fee_accrued_at, fee_paid_at}
+# hold_id is the borrowed copy's hold (see inventory.py), book_id its title.
+# returned_at is None while the book is out. Late fees are worked out by
+# MongoDB for all the open loans at once (accrue_late_fees, run by the expiry
+# sweep) and once more when the book comes back, so listing, sorting and
+# totalling loans by due date or fee are plain indexed queries.
+
+# Helper function to create the loans indexes: open loans by due date (the
+# loans list, overdue queries and the fee accrual) or by fee, a copy's open
+# loan (returns), a title's open loans (deleting it) and unpaid fees by
+# student (balances)
+def ensure_loan_indexes(loans_collection):
+    loans_collection.create_index([("returned_at", ASCENDING), ("due_at", ASCENDING), ("_id", ASCENDING)],
+                                  name="open_due_at")
+    loans_collection.create_index([("returned_at", ASCENDING), ("fee", ASCENDING), ("_id", ASCENDING)],
+                                  name="open_fee")
+    loans_collection.create_index([("hold_id", ASCENDING), ("returned_at", ASCENDING)], name="hold_returned_at")
+    loans_collection.create_index([("book_id", ASCENDING), ("returned_at", ASCENDING)], name="book_returned_at")
+    loans_collection.create_index([("student_id", ASCENDING), ("fee_paid_at", ASCENDING)], name="student_unpaid")
+    loans_collection.create_index([("fee_paid_at", ASCENDING), ("fee", ASCENDING)], name="unpaid_fees")
+
+# Helper function to build the loan document for a copy just borrowed (its hold)
+def new_loan(hold, borrowed_at):
+    return {
+        "hold_id": hold["_id"],
+        "book_id": hold.get("book_id"),
+        "title": hold.get("title"),
+        "author": hold.get("author"),
+        "student_id": hold.get("student_id"),
+        "borrowed_at": borrowed_at,
+        "due_at": borrowed_at + timedelta(days=LOAN_DAYS),
+        "returned_at": None,
+        "overdue_days": 0,
+        "fee": 0,
+        "fee_accrued_at": None,
+        "fee_paid_at": None
+    }
+
+# Helper function to build the query for the loans still out
+def open_loans_query():
+    return {"returned_at": None}
+
+# Helper function to build the query for the loans past their due date
+def overdue_loans_query(now=None):
+    return {"returned_at": None, "due_at": {"$lt": now or datetime.utcnow()}}
+
+# Helper function to build the aggregation expression for the days (rounded
+# up) a loan is overdue at `until` (a date or an expression)
+def overdue_days_expression(until):
+    return {"$max": [0, {"$ceil": {"$divide": [{"$subtract": [until, "$due_at"]}, DAY_MS]}}]}
+
+# Helper function to build the update pipeline that sets overdue_days and fee
+# as of `until`
+def fee_pipeline(until, now, extra=None):
+    return [
+        {"$set": dict(extra or {}, overdue_days=overdue_days_expression(until), fee_accrued_at=now)},
+        {"$set": {"fee": {"$multiply": ["$overdue_days", LATE_FEE_PER_DAY]}}}
+    ]
+
+# Open a loan for each copy just borrowed (hold documents after the change)
+def open_loans(loans_collection, holds, now):
+    loans = [new_loan(hold, hold.get("borrowed_at") or now) for hold in holds]
+    if loans:
+        loans_collection.insert_many(loans)
+    return loans
+
+# Helper function to build the query for the open loans of the given holds
+# (or, with field="book_id", titles)
+def unreturned_loans_query(ids, field="hold_id"):
+    return {field: {"$in": list(ids)}, "returned_at": None}
+
+# Close the open loans of the given holds (or, with field="book_id", of every
+# copy of the given titles), settling their late fees in the same write
+def close_loans(loans_collection, ids, now, field="hold_id"):
+    if not ids:
+        return 0
+    result = loans_collection.update_many(unreturned_loans_query(ids, field), fee_pipeline(now, now, {"returned_at": now}))
+    return result.modified_count
+
+# Helper function to build the query for the overdue loans whose fee is
+# behind, i.e. that have gone into another overdue day since it was worked out
+def stale_fees_query(now=None):
+    now = now or datetime.utcnow()
+    return dict(overdue_loans_query(now), **{"$expr": {"$lt": ["$overdue_days", overdue_days_expression(now)]}})
+
+# Bring the fees of the overdue open loans up to date with one write; loans
+# whose overdue day count has not changed since the last run are left alone
+def accrue_late_fees(loans_collection, now=None):
+    now = now or datetime.utcnow()
+    result = loans_collection.update_many(stale_fees_query(now), fee_pipeline(now, now))
+    return result.modified_count
+
+# Count the overdue loans and total their late fees
+def overdue_summary(loans_collection, now=None):
+    summary = list(loans_collection.aggregate([
+        {"$match": overdue_loans_query(now)},
+        {"$group": {"_id": None, "count": {"$sum": 1}, "fees": {"$sum": "$fee"}}}
+    ]))
+    return {"count": summary[0]["count"], "fees": summary[0]["fees"]} if summary else {"count": 0, "fees": 0}
+
+# Helper function to build the pipeline totalling the unpaid fees per student
+def fee_balances_pipeline():
+    return [
+        {"$match": {"fee_paid_at": None, "fee": {"$gt": 0}}},
+        {"$group": {
+            "_id": "$student_id",
+            "owed": {"$sum": {"$cond": [{"$eq": [{"$ifNull": ["$returned_at", None]}, None]}, 0, "$fee"]}},
+            "accruing": {"$sum": {"$cond": [{"$eq": [{"$ifNull": ["$returned_at", None]}, None]}, "$fee", 0]}},
+            "loans": {"$sum": 1}
+        }},
+        {"$sort": {"owed": -1, "accruing": -1, "_id": 1}}
+    ]
+
+# Unpaid late fees per student, largest first: [{student_id, owed (returned
+# books), accruing (books still out), loans}]
+def fee_balances(loans_collection):
+    return [
+        {"student_id": balance["_id"], "owed": balance["owed"], "accruing": balance["accruing"],
+         "loans": balance["loans"]}
+        for balance in loans_collection.aggregate(fee_balances_pipeline())
+    ]
+
+# Helper function to build the query for a student's unpaid fees of returned books
+def unpaid_returned_fees_query(student_id):
+    return {"student_id": student_id, "fee_paid_at": None, "returned_at": {"$ne": None}, "fee": {"$gt": 0}}
+
+# Mark the fees of a student's returned books as paid; fees of books still
+# out keep accruing until they are returned
+def settle_fees(loans_collection, student_id, now):
+    result = loans_collection.update_many(unpaid_returned_fees_query(student_id), {"$set": {"fee_paid_at": now}})
+    return result.modified_count
+
+# Open loans for copies that were borrowed before the loans collection existed
+# (safe to run again: copies that already have an open loan are skipped)
+def backfill_loans(loans_collection, holds_collection, now=None):
+    now = now or datetime.utcnow()
+    operations = [
+        UpdateOne({"hold_id": hold["_id"], "returned_at": None},
+                  {"$setOnInsert": new_loan(hold, hold.get("borrowed_at") or now)}, upsert=True)
+        for hold in holds_collection.find({"status": "borrowed"}, {"book_id": 1, "title": 1, "author": 1,
+                                                                    "student_id": 1, "borrowed_at": 1})
+    ]
+    if not operations:
+        return 0
+    result = loans_collection.bulk_write(operations, ordered=False)
+    accrue_late_fees(loans_collection, now)
+    return result.upserted_count
@@ -0,0 +1,34 @@
+import os
+
+from dotenv import load_dotenv
+
+from expiry import book_reservation_threshold
+from inventory import ensure_hold_indexes, migrate_book_copies
+from reservations import backfill_reservation_keys, ensure_reservation_indexes, migrate_embedded_reservations
+
+# One-shot migration of conference room reservations from the embedded
+# `reservations` array on each room into the conference_reservations collection,
+# plus the booking keys (active_holder, slot_keys) the unique indexes rely on,
+# and of books from one document per copy to titles with copy counters
+def migrate(db):
+    rooms, reservations = migrate_embedded_reservations(db.conference_rooms, db.conference_reservations)
+    print(f"Migrated {reservations} reservation(s) from {rooms} room(s)")
+    backfilled = backfill_reservation_keys(db.conference_reservations)
+    print(f"Added booking keys to {backfilled} existing reservation(s)")
+    ensure_reservation_indexes(db.conference_reservations)
+    ensure_hold_indexes(db.book_holds)
+    titles, copies, holds = migrate_book_copies(db.books, db.book_holds, db.loans, book_reservation_threshold())
+    print(f"Merged {copies} book copies into {titles} title(s), {holds} of them reserved or borrowed")
+    if "active_holder_unique" in db.books.index_information():
+        # Holds are one per student in book_holds now
+        db.books.drop_index("active_holder_unique")
+
+if __name__ == "__main__":
+    from db import MongoConnection
+
+    load_dotenv()
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        print("MONGO_URI not found in .env file")
+        exit(1)
+    migrate(MongoConnection(mongo_uri).db)
@@ -0,0 +1,133 @@
+import base64
+import os
+from collections import namedtuple
+
+import bson
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+
+DEFAULT_PAGE_SIZE = int(os.getenv("PAGE_SIZE", "25"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "100"))
+
+# One page of results plus the cursors for the neighbouring pages (None when
+# there is no such page). Cursors are opaque strings passed back as the
+# `after` / `before` query parameters.
+Page = namedtuple("Page", ["items", "next_cursor", "prev_cursor", "page_size"])
+
+# Helper function to read a bounded page size from the request arguments
+def get_page_size(args, name="page_size", default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        page_size = int(args.get(name, default))
+    except (TypeError, ValueError):
+        page_size = default
+    return max(1, min(page_size, maximum))
+
+# Helper function to turn a cursor string back into an ObjectId (None if invalid)
+def parse_object_id_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        return ObjectId(cursor)
+    except (InvalidId, TypeError):
+        return None
+
+# Helper function to build the filter and sort direction for one keyset page
+def keyset_query(query, after=None, before=None):
+    after_id = parse_object_id_cursor(after)
+    before_id = parse_object_id_cursor(before)
+    if before_id:
+        return ({"$and": [query, {"_id": {"$lt": before_id}}]} if query else {"_id": {"$lt": before_id}}), -1
+    if after_id:
+        return ({"$and": [query, {"_id": {"$gt": after_id}}]} if query else {"_id": {"$gt": after_id}}), 1
+    return query, 1
+
+# Helper function to turn the page_size + 1 documents read for a keyset page
+# into the page and its neighbouring cursors. direction is -1 when paging
+# backwards; after_cursor is the parsed `after` cursor (None on the first page).
+def keyset_result(items, direction, after_cursor=None, page_size=DEFAULT_PAGE_SIZE,
+                  cursor_of=lambda item: str(item["_id"])):
+    if direction < 0:
+        has_prev = len(items) > page_size
+        items = list(reversed(items[:page_size]))
+        next_cursor = cursor_of(items[-1]) if items else None
+        prev_cursor = cursor_of(items[0]) if has_prev else None
+    else:
+        has_next = len(items) > page_size
+        items = items[:page_size]
+        next_cursor = cursor_of(items[-1]) if has_next else None
+        prev_cursor = cursor_of(items[0]) if after_cursor and items else None
+    return Page(items, next_cursor, prev_cursor, page_size)
+
+# Helper function to fetch one page of a query using keyset pagination on _id.
+# Only page_size + 1 documents are read, whatever the size of the collection.
+def keyset_page(collection, query, after=None, before=None, page_size=DEFAULT_PAGE_SIZE, projection=None):
+    page_query, direction = keyset_query(query, after, before)
+    items = list(collection.find(page_query, projection).sort("_id", direction).limit(page_size + 1))
+    return keyset_result(items, direction, parse_object_id_cursor(after), page_size)
+
+# Same as keyset_page, for an async (pymongo.AsyncMongoClient) collection
+async def keyset_page_async(collection, query, after=None, before=None, page_size=DEFAULT_PAGE_SIZE, projection=None):
+    page_query, direction = keyset_query(query, after, before)
+    items = await collection.find(page_query, projection).sort("_id", direction).limit(page_size + 1).to_list(None)
+    return keyset_result(items, direction, parse_object_id_cursor(after), page_size)
+
+# Keyset pagination ordered by another field, with _id breaking ties. The
+# cursor holds both values (BSON, base64 encoded), so pages stay stable while
+# the field changes for documents on other pages. The query is served by an
+# index on (field, _id) after any equality-matched fields.
+
+# Helper function to encode the cursor of a document ordered by `field`
+def encode_sort_cursor(item, field):
+    return base64.urlsafe_b64encode(bson.encode({"v": item.get(field), "id": item["_id"]})).decode().rstrip("=")
+
+# Helper function to turn a sort cursor back into (value, _id) (None if invalid)
+def parse_sort_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        decoded = bson.decode(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return decoded["v"], decoded["id"]
+    except Exception:
+        return None
+
+# Helper function to build the filter and sort direction for one page ordered
+# by `field` (order 1 ascending, -1 descending). The direction returned is the
+# order to read in; it is reversed when paging backwards.
+def sorted_keyset_query(query, field, order=1, after=None, before=None):
+    before_cursor = parse_sort_cursor(before)
+    cursor = before_cursor or parse_sort_cursor(after)
+    direction = -order if before_cursor else order
+    if not cursor:
+        return query, direction
+    value, last_id = cursor
+    operator = "$gt" if direction > 0 else "$lt"
+    bound = {"$or": [{field: {operator: value}}, {field: value, "_id": {operator: last_id}}]}
+    return ({"$and": [query, bound]} if query else bound), direction
+
+# Helper function to fetch one page of a query ordered by `field`, then _id
+def sorted_keyset_page(collection, query, field, order=1, after=None, before=None,
+                       page_size=DEFAULT_PAGE_SIZE, projection=None):
+    page_query, direction = sorted_keyset_query(query, field, order, after, before)
+    items = list(collection.find(page_query, projection).sort([(field, direction), ("_id", direction)])
+                 .limit(page_size + 1))
+    going_back = parse_sort_cursor(before) is not None
+    return keyset_result(items, -1 if going_back else 1, parse_sort_cursor(after), page_size,
+                         cursor_of=lambda item: encode_sort_cursor(item, field))
+
+# Helper function to page through an already ranked list of results, using
+# the position in the ranking as the cursor
+def ranked_page(results, after=None, before=None, page_size=DEFAULT_PAGE_SIZE):
+    def to_offset(cursor):
+        try:
+            return max(0, min(int(cursor), len(results)))
+        except (TypeError, ValueError):
+            return None
+    before_offset = to_offset(before)
+    if before_offset is not None:
+        start = max(0, before_offset - page_size)
+    else:
+        start = to_offset(after) or 0
+    end = min(start + page_size, len(results))
+    next_cursor = str(end) if end < len(results) else None
+    prev_cursor = str(start) if start > 0 else None
+    return Page(results[start:end], next_cursor, prev_cursor, page_size)
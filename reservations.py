@@ -0,0 +1,147 @@
+import os
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, UpdateOne
+
+# Conference room reservations live in their own collection, one document per
+# booking: {room_id, reserved_by, date, start_time, end_time}. Slot lookups,
+# per-student checks and cancellations are indexed point operations instead of
+# rewrites of an array embedded in the room document.
+#
+# Two unique partial indexes make booking race-free without transactions:
+#   - active_holder (the student's ID) allows one reservation per student;
+#   - slot_keys lists every SLOT_GRANULARITY_MINUTES cell of the room the
+#     booking covers, so two overlapping bookings can never both be inserted.
+SLOT_GRANULARITY_MINUTES = int(os.getenv("ROOM_SLOT_GRANULARITY_MINUTES", "5"))
+
+# Helper function to list the room time cells covered by [start_time, end_time)
+def slot_keys_for(room_id, start_time, end_time):
+    granularity = timedelta(minutes=SLOT_GRANULARITY_MINUTES)
+    midnight = start_time.replace(hour=0, minute=0, second=0, microsecond=0)
+    cell = midnight + ((start_time - midnight) // granularity) * granularity
+    keys = []
+    while cell < end_time:
+        keys.append(f"{room_id}|{cell.strftime('%Y-%m-%dT%H:%M')}")
+        cell += granularity
+    return keys
+
+# Helper function to check that a time lies on the slot grid
+def is_on_slot_grid(time):
+    return time.second == 0 and time.microsecond == 0 and time.minute % SLOT_GRANULARITY_MINUTES == 0
+
+# Helper function to create the indexes the reservation queries rely on
+def ensure_reservation_indexes(reservations_collection):
+    reservations_collection.create_index(
+        [("room_id", ASCENDING), ("date", ASCENDING), ("start_time", ASCENDING)],
+        name="room_date_start"
+    )
+    reservations_collection.create_index(
+        [("reserved_by", ASCENDING), ("end_time", ASCENDING)],
+        name="reserved_by_end_time"
+    )
+    reservations_collection.create_index([("end_time", ASCENDING)], name="end_time")
+    reservations_collection.create_index(
+        [("active_holder", ASCENDING)], name="active_holder_unique", unique=True,
+        partialFilterExpression={"active_holder": {"$exists": True}}
+    )
+    reservations_collection.create_index(
+        [("slot_keys", ASCENDING)], name="slot_keys_unique", unique=True,
+        partialFilterExpression={"slot_keys": {"$exists": True}}
+    )
+
+# Helper function to build the query for a room's reservations on one day
+def room_day_query(room_id, date_str):
+    return {"room_id": room_id, "date": date_str}
+
+# Helper function to build the query for a student's unfinished reservations
+def active_reservation_query(student_id, now):
+    return {"reserved_by": student_id, "end_time": {"$gt": now}}
+
+# Helper function to build the query for the finished reservations (optionally
+# only a student's)
+def finished_reservations_query(now, student_id=None):
+    query = {"end_time": {"$lte": now}}
+    return query if student_id is None else {"reserved_by": student_id, **query}
+
+# Helper function to build the query for a student's reservations of a room
+def room_reservation_query(room_id, reserved_by):
+    return {"room_id": room_id, "reserved_by": reserved_by}
+
+# Helper function to fetch a room's reservations for one day, ordered by start time
+def get_room_day_reservations(reservations_collection, room_id, date_str):
+    return list(reservations_collection.find(room_day_query(room_id, date_str)).sort("start_time", ASCENDING))
+
+# Helper function to check, with a single indexed lookup, whether a student
+# holds a reservation that has not finished yet
+def student_has_active_reservation(reservations_collection, student_id, now):
+    return reservations_collection.find_one(active_reservation_query(student_id, now), {"_id": 1}) is not None
+
+# Same as student_has_active_reservation, for an async collection
+async def student_has_active_reservation_async(reservations_collection, student_id, now):
+    return await reservations_collection.find_one(active_reservation_query(student_id, now), {"_id": 1}) is not None
+
+# Helper function to add a reservation document for a room. Raises
+# DuplicateKeyError if the student already holds a reservation or the time
+# overlaps another booking of the room.
+def create_reservation(reservations_collection, room_id, reserved_by, date_str, start_time, end_time):
+    reservation = {
+        "room_id": room_id,
+        "reserved_by": reserved_by,
+        "date": date_str,
+        "start_time": start_time,
+        "end_time": end_time,
+        "active_holder": reserved_by,
+        "slot_keys": slot_keys_for(room_id, start_time, end_time)
+    }
+    reservations_collection.insert_one(reservation)
+    return reservation
+
+# Helper function to delete a student's finished reservations that the expiry
+# sweep has not removed yet (they still hold the student's active_holder key)
+def release_finished_reservations(reservations_collection, student_id, now):
+    return reservations_collection.delete_many(finished_reservations_query(now, student_id)).deleted_count
+
+# Helper function to remove a student's reservations for a room
+def cancel_reservations(reservations_collection, room_id, reserved_by):
+    return reservations_collection.delete_many(room_reservation_query(room_id, reserved_by)).deleted_count
+
+# One-shot migration: copy every unfinished reservation embedded in a
+# conference room document into the reservations collection, then drop the
+# embedded array. Upserting on (room_id, reserved_by, start_time) makes it
+# safe to re-run.
+def migrate_embedded_reservations(conference_rooms_collection, reservations_collection):
+    now = datetime.utcnow()
+    rooms_migrated = 0
+    reservations_migrated = 0
+    for room in conference_rooms_collection.find({"reservations": {"$exists": True}}):
+        operations = []
+        for res in room.get("reservations") or []:
+            if res["end_time"] <= now:
+                continue  # Already finished; nothing to carry over
+            key = {"room_id": room["_id"], "reserved_by": res["reserved_by"], "start_time": res["start_time"]}
+            operations.append(UpdateOne(key, {"$setOnInsert": {
+                "date": res["date"],
+                "end_time": res["end_time"],
+                "active_holder": res["reserved_by"],
+                "slot_keys": slot_keys_for(room["_id"], res["start_time"], res["end_time"])
+            }}, upsert=True))
+        if operations:
+            reservations_collection.bulk_write(operations, ordered=False)
+        conference_rooms_collection.update_one({"_id": room["_id"]}, {"$unset": {"reservations": ""}})
+        rooms_migrated += 1
+        reservations_migrated += len(operations)
+    return rooms_migrated, reservations_migrated
+
+# Migration: add the active_holder and slot_keys fields to reservations that
+# were created before they existed
+def backfill_reservation_keys(reservations_collection):
+    operations = [
+        UpdateOne({"_id": res["_id"]}, {"$set": {
+            "active_holder": res["reserved_by"],
+            "slot_keys": slot_keys_for(res["room_id"], res["start_time"], res["end_time"])
+        }})
+        for res in reservations_collection.find({"slot_keys": {"$exists": False}})
+    ]
+    if operations:
+        reservations_collection.bulk_write(operations, ordered=False)
+    return len(operations)
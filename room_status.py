@@ -0,0 +1,77 @@
+from pymongo import ASCENDING
+
+# Conference room status for the dashboards. One aggregation returns every
+# room's unfinished reservations, grouped per room and sorted by start time;
+# only unfinished reservations are read, so the work per request does not grow
+# with the reservation history. The grouped snapshot does not depend on the
+# viewer, so it can be cached and split into the current occupant and the
+# upcoming bookings at render time.
+
+# Helper function to build the pipeline grouping the unfinished reservations
+def room_reservations_pipeline(now):
+    return [
+        {"$match": {"end_time": {"$gt": now}}},
+        # A room's bookings never overlap, so end time order is start time
+        # order, and the end_time index serves both the match and the sort
+        {"$sort": {"end_time": ASCENDING}},
+        {"$group": {
+            "_id": "$room_id",
+            "reservations": {"$push": {
+                "reserved_by": "$reserved_by",
+                "date": "$date",
+                "start_time": "$start_time",
+                "end_time": "$end_time"
+            }}
+        }}
+    ]
+
+# Helper function to combine the rooms with the pipeline's rows into
+# {room_id, room_name, reservations (unfinished, by start time)}, one per room
+def build_room_reservations(rooms, rows):
+    by_room = {row["_id"]: row["reservations"] for row in rows}
+    return [
+        {"room_id": str(room["_id"]), "room_name": room["room_name"], "reservations": by_room.get(room["_id"], [])}
+        for room in rooms
+    ]
+
+# Helper function to get every room's unfinished reservations
+def get_room_reservations(conference_rooms_collection, reservations_collection, now):
+    rows = list(reservations_collection.aggregate(room_reservations_pipeline(now)))
+    return build_room_reservations(conference_rooms_collection.find({}, {"room_name": 1}), rows)
+
+# Same as get_room_reservations, for async collections; both queries run concurrently
+async def get_room_reservations_async(conference_rooms_collection, reservations_collection, now):
+    import asyncio
+
+    async def fetch_rows():
+        cursor = await reservations_collection.aggregate(room_reservations_pipeline(now))
+        return await cursor.to_list(None)
+    rooms, rows = await asyncio.gather(
+        conference_rooms_collection.find({}, {"room_name": 1}).to_list(None),
+        fetch_rows()
+    )
+    return build_room_reservations(rooms, rows)
+
+# Helper function to turn the rooms' reservations into the status shown at
+# `now`: {room_id, room_name, current (the reservation in progress or None),
+# reservations (upcoming, by start time)}. With upcoming_date set, only that
+# day's upcoming reservations are listed (the student view).
+def room_statuses_at(room_reservations, now, upcoming_date=None):
+    statuses = []
+    for room in room_reservations:
+        current = None
+        upcoming = []
+        for res in room["reservations"]:
+            if res["end_time"] <= now:
+                continue
+            if res["start_time"] <= now:
+                current = res
+            elif not upcoming_date or res["date"] == upcoming_date:
+                upcoming.append(res)
+        statuses.append({
+            "room_id": room["room_id"],
+            "room_name": room["room_name"],
+            "current": current,
+            "reservations": upcoming
+        })
+    return statuses
@@ -0,0 +1,86 @@
+import os
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+# Opening hours and default slot length for conference rooms
+ROOM_OPEN_HOUR = float(os.getenv("ROOM_OPEN_HOUR", "8"))
+ROOM_CLOSE_HOUR = float(os.getenv("ROOM_CLOSE_HOUR", "18"))
+ROOM_SLOT_MINUTES = int(os.getenv("ROOM_SLOT_MINUTES", "90"))
+
+SLOT_DURATION = timedelta(minutes=ROOM_SLOT_MINUTES)
+
+# Helper function to get the opening and closing time of a room on a given day
+def opening_hours(day, open_hour=ROOM_OPEN_HOUR, close_hour=ROOM_CLOSE_HOUR):
+    midnight = datetime.combine(day, datetime.min.time())
+    return midnight + timedelta(hours=open_hour), midnight + timedelta(hours=close_hour)
+
+# Busy intervals of one room on one day, kept sorted and merged, with the free
+# gaps between them (within opening hours). The schedule is built from the
+# day's reservations for each request, so lookups are a bisect to the first
+# relevant gap and a scan from there over the (few) gaps of the day.
+class DaySchedule:
+    def __init__(self, day, intervals=(), open_hour=ROOM_OPEN_HOUR, close_hour=ROOM_CLOSE_HOUR):
+        self.day = day
+        self.open_time, self.close_time = opening_hours(day, open_hour, close_hour)
+        self._starts = []
+        self._ends = []
+        for start, end in sorted(intervals):
+            self._insert(start, end)
+
+    @classmethod
+    def from_reservations(cls, day, reservations, **kwargs):
+        return cls(day, [(res["start_time"], res["end_time"]) for res in reservations], **kwargs)
+
+    # Merge [start, end) into the sorted busy intervals
+    def _insert(self, start, end):
+        lo = bisect_left(self._ends, start)
+        hi = bisect_right(self._starts, end)
+        if lo < hi:
+            start = min(start, self._starts[lo])
+            end = max(end, self._ends[hi - 1])
+        self._starts[lo:hi] = [start]
+        self._ends[lo:hi] = [end]
+
+    # Free gaps (start, end) within opening hours, from the gap containing
+    # or following `not_before`
+    def _gaps(self, not_before=None):
+        cursor = self.open_time
+        i = 0
+        if not_before and not_before > cursor:
+            cursor = not_before
+            i = bisect_right(self._ends, cursor)
+            if i < len(self._starts) and self._starts[i] <= cursor:
+                cursor = self._ends[i]
+                i += 1
+        while cursor < self.close_time:
+            end = self._starts[i] if i < len(self._starts) else self.close_time
+            if end > cursor:
+                yield cursor, min(end, self.close_time)
+            if i >= len(self._starts):
+                return
+            cursor = max(cursor, self._ends[i])
+            i += 1
+
+    # Check whether [start, end) collides with a busy interval
+    def overlaps(self, start, end):
+        i = bisect_right(self._ends, start)
+        return i < len(self._starts) and self._starts[i] < end
+
+    # Check whether [start, end) is inside opening hours and free
+    def is_free(self, start, end):
+        return self.open_time <= start < end <= self.close_time and not self.overlaps(start, end)
+
+    # Earliest start time of a free window of `duration`, not before `not_before`
+    def next_free_slot(self, duration=SLOT_DURATION, not_before=None):
+        for start, end in self._gaps(not_before):
+            if end - start >= duration:
+                return start
+        return None
+
+    # All free windows (start, end) at least `duration` long, in order
+    def free_windows(self, duration=SLOT_DURATION, not_before=None):
+        return [(start, end) for start, end in self._gaps(not_before) if end - start >= duration]
+
+    # Record a new busy interval
+    def add(self, start, end):
+        self._insert(start, end)
@@ -0,0 +1,134 @@
+import os
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+# Relevance weight of a token match in each indexed field
+FIELD_WEIGHTS = {"title": 3.0, "author": 2.0, "genre": 1.0}
+
+# Extra weight when a query token matches a whole word rather than a prefix
+EXACT_MATCH_BONUS = 1.0
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Helper function to split text into lowercase search tokens
+def tokenize(text):
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+# In-process inverted index over the book catalog. Tokens are kept in a sorted
+# list so prefix lookups are a bisect plus a walk over the matching tokens,
+# and postings map each token to the books (and weights) that contain it.
+# The index is built lazily from MongoDB and kept current by the add/edit/
+# delete book routes; it is also rebuilt after SEARCH_INDEX_MAX_AGE seconds
+# so that changes made by other worker processes are picked up.
+class CatalogSearchIndex:
+    def __init__(self, books_collection, max_age=None):
+        self.books_collection = books_collection
+        self.max_age = max_age if max_age is not None else float(os.getenv("SEARCH_INDEX_MAX_AGE", "300"))
+        self._lock = threading.RLock()
+        self._docs = {}
+        self._postings = {}
+        self._tokens = []
+        self._built_at = None
+
+    def _ensure_built(self):
+        if self._built_at is None or (self.max_age and time.monotonic() - self._built_at > self.max_age):
+            self.rebuild()
+
+    def rebuild(self):
+        books = self.books_collection.find({}, {"title": 1, "author": 1, "genre": 1})
+        with self._lock:
+            self._docs = {}
+            self._postings = {}
+            self._tokens = []
+            for book in books:
+                self._add(book)
+            self._built_at = time.monotonic()
+
+    # Drop the index so it is rebuilt on the next search (after bulk changes)
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def _add(self, book):
+        doc = {
+            "_id": book["_id"],
+            "title": book.get("title", ""),
+            "author": book.get("author", ""),
+            "genre": book.get("genre", "Unknown")
+        }
+        self._docs[doc["_id"]] = doc
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(doc[field]):
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = {}
+                    insort(self._tokens, token)
+                postings[doc["_id"]] = postings.get(doc["_id"], 0.0) + weight
+
+    def _remove(self, book_id):
+        doc = self._docs.pop(book_id, None)
+        if not doc:
+            return
+        for field in FIELD_WEIGHTS:
+            for token in tokenize(doc[field]):
+                postings = self._postings.get(token)
+                if postings is None:
+                    continue
+                postings.pop(book_id, None)
+                if not postings:
+                    del self._postings[token]
+                    del self._tokens[bisect_left(self._tokens, token)]
+
+    # Index (or re-index) a book after it was inserted or edited
+    def add(self, book):
+        with self._lock:
+            if self._built_at is None:
+                return  # Picked up by the initial build
+            self._remove(book["_id"])
+            self._add(book)
+
+    update = add
+
+    # Drop a deleted book from the index
+    def remove(self, book_id):
+        with self._lock:
+            self._remove(book_id)
+
+    # Yield the indexed tokens starting with `prefix`, walking the sorted list
+    # in place from the first candidate (no copy of its tail)
+    def _prefix_matches(self, prefix):
+        tokens = self._tokens
+        i = bisect_left(tokens, prefix)
+        while i < len(tokens) and tokens[i].startswith(prefix):
+            yield tokens[i]
+            i += 1
+
+    # Return books matching every query token (as a word prefix), best first
+    def search(self, query, genre=None, limit=None):
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+        self._ensure_built()
+        with self._lock:
+            scores = None
+            for query_token in query_tokens:
+                token_scores = {}
+                for token in self._prefix_matches(query_token):
+                    bonus = EXACT_MATCH_BONUS if token == query_token else 0.0
+                    for book_id, weight in self._postings[token].items():
+                        token_scores[book_id] = max(token_scores.get(book_id, 0.0), weight + bonus)
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {book_id: score + token_scores[book_id] for book_id, score in scores.items() if book_id in token_scores}
+                if not scores:
+                    return []
+            results = [self._docs[book_id] for book_id in scores]
+            if genre:
+                results = [doc for doc in results if doc["genre"] == genre]
+            results.sort(key=lambda doc: (-scores[doc["_id"]], doc["title"].lower()))
+            if limit is not None:
+                results = results[:limit]
+            return [dict(doc) for doc in results]
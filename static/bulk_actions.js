@@ -0,0 +1,72 @@
+// Bulk borrow/return/delete on the admin dashboard. The IDs of the selected
+// rows (hold IDs for borrow and return, book IDs for delete; the table names
+// the key in data-bulk-table) are posted as JSON to /admin/books/bulk and the
+// table is updated from the reply, so the page is not reloaded.
+(function () {
+    var script = document.currentScript;
+    var bulkUrl = script.dataset.url;
+    var table = document.querySelector("[data-bulk-table]");
+    if (!table) {
+        return;
+    }
+
+    function selectedRows() {
+        return Array.prototype.filter.call(table.querySelectorAll("tr[data-id]"), function (row) {
+            return row.querySelector("[data-select-row]").checked;
+        });
+    }
+
+    function applyResult(result) {
+        result.changed.forEach(function (item) {
+            var row = table.querySelector('tr[data-id="' + item.id + '"]');
+            if (!row) {
+                return;
+            }
+            // Borrowed copies move to the Borrowed list; returned and deleted ones are gone
+            row.remove();
+        });
+        var skipped = result.skipped.length + result.invalid.length;
+        if (skipped) {
+            alert(result.changed.length + " book(s) updated; " + skipped + " could not be changed.");
+        }
+    }
+
+    table.querySelector("[data-select-all]").addEventListener("change", function (event) {
+        table.querySelectorAll("[data-select-row]").forEach(function (checkbox) {
+            checkbox.checked = event.target.checked;
+        });
+    });
+
+    document.querySelectorAll("[data-bulk-action]").forEach(function (button) {
+        button.addEventListener("click", function () {
+            var rows = selectedRows();
+            if (!rows.length) {
+                alert("Select at least one book.");
+                return;
+            }
+            if (button.dataset.confirm && !confirm(button.dataset.confirm)) {
+                return;
+            }
+            button.disabled = true;
+            var payload = {action: button.dataset.bulkAction};
+            payload[table.dataset.bulkTable] = rows.map(function (row) { return row.dataset.id; });
+            fetch(bulkUrl, {
+                method: "POST",
+                headers: {"Content-Type": "application/json"},
+                credentials: "same-origin",
+                body: JSON.stringify(payload)
+            }).then(function (response) {
+                return response.json().then(function (body) {
+                    if (!response.ok) {
+                        throw new Error(body.error || response.statusText);
+                    }
+                    return body;
+                });
+            }).then(applyResult).catch(function (error) {
+                alert("Bulk action failed: " + error.message);
+            }).finally(function () {
+                button.disabled = false;
+            });
+        });
+    });
+})();
@@ -0,0 +1,103 @@
+// Live availability on the student dashboard. Once the student turns live
+// updates on (remembered in localStorage), the page subscribes to /events
+// (Server-Sent Events) and updates book rows and conference room statuses as
+// they change, so students do not have to keep reloading the dashboard. Each
+// open stream holds a server thread, so nobody is subscribed by default.
+(function () {
+    var script = document.currentScript;
+    var toggle = document.querySelector("[data-live-toggle]");
+    if (!window.EventSource || !toggle) {
+        return;
+    }
+    var source = null;
+
+    // Reserve while a copy is available; otherwise the same form joins the waitlist
+    function reserveForm(url, available) {
+        var form = document.createElement("form");
+        form.action = url;
+        form.method = "POST";
+        form.style.display = "inline";
+        var button = document.createElement("button");
+        button.type = "submit";
+        button.className = available ? "btn btn-success btn-sm" : "btn btn-outline-secondary btn-sm";
+        button.textContent = available ? "Reserve" : "Join Waitlist";
+        form.appendChild(button);
+        return form;
+    }
+
+    function updateBook(event) {
+        var row = document.querySelector('tr[data-book-id="' + event.id + '"]');
+        if (!row) {
+            return;
+        }
+        if (event.deleted) {
+            row.remove();
+            return;
+        }
+        row.querySelector('[data-field="available"]').textContent = event.available;
+        row.querySelector('[data-field="actions"]').replaceChildren(
+            reserveForm(row.dataset.reserveUrl, event.available > 0));
+    }
+
+    function updateRooms(rooms) {
+        rooms.forEach(function (room) {
+            var card = document.querySelector('[data-room-id="' + room.room_id + '"]');
+            if (!card) {
+                return;
+            }
+            card.querySelector('[data-field="room-status"]').textContent = room.in_use_by
+                ? "Currently in use by " + room.in_use_by + " until " + room.until
+                : "Available";
+        });
+    }
+
+    function onMessage(message) {
+        var event = JSON.parse(message.data);
+        if (event.type === "book") {
+            updateBook(event);
+        } else if (event.type === "rooms") {
+            updateRooms(event.rooms);
+        } else if (event.type === "resync") {
+            // Too many changes were missed to apply them one by one
+            window.location.reload();
+        } else if (event.type === "unavailable") {
+            setLive(false);
+        }
+    }
+
+    function setLive(on) {
+        if (source) {
+            source.close();
+            source = null;
+        }
+        if (on) {
+            source = new EventSource(script.dataset.url);
+            source.onmessage = onMessage;
+            source.onerror = function () {
+                // Refused (e.g. the server is at its stream limit): offer to try again
+                if (source && source.readyState === EventSource.CLOSED) {
+                    source = null;
+                    toggle.textContent = "Turn on live updates";
+                }
+            };
+        }
+        try {
+            window.localStorage.setItem("liveUpdates", on ? "on" : "off");
+        } catch (e) {
+            // Storage disabled: the choice lasts until the page is left
+        }
+        toggle.textContent = on ? "Turn off live updates" : "Turn on live updates";
+    }
+
+    toggle.addEventListener("click", function () {
+        setLive(!source);
+    });
+    var stored = null;
+    try {
+        stored = window.localStorage.getItem("liveUpdates");
+    } catch (e) {
+        stored = null;
+    }
+    toggle.hidden = false;
+    setLive(stored === "on");
+})();
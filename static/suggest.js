@@ -0,0 +1,81 @@
+// Search suggestions on the student dashboard. While the student types, the
+// query is sent to /api/books/suggest (at most once per pause in typing) and
+// the suggestion bar is redrawn from the JSON reply, without reloading the page.
+(function () {
+    var script = document.currentScript;
+    var suggestUrl = script.dataset.url;
+    var dashboardUrl = script.dataset.dashboardUrl;
+    var input = document.querySelector("[data-suggest-input]");
+    var bar = document.querySelector("[data-suggestions]");
+    if (!input || !bar) {
+        return;
+    }
+    var list = bar.querySelector("[data-suggestion-list]");
+    var genreSelect = input.form.querySelector('select[name="genre"]');
+    var DEBOUNCE_MS = 200;
+    var timer = null;
+    var controller = null;
+    var lastQuery = null;
+
+    function suggestionForm(book) {
+        var form = document.createElement("form");
+        form.method = "GET";
+        form.action = dashboardUrl;
+        form.className = "me-2 mb-2";
+        var hidden = document.createElement("input");
+        hidden.type = "hidden";
+        hidden.name = "search";
+        hidden.value = book.title;
+        var button = document.createElement("button");
+        button.type = "submit";
+        button.className = "btn btn-outline-primary btn-sm";
+        button.textContent = book.title + " by " + book.author + " (" + (book.genre || "Unknown") + ")";
+        form.appendChild(hidden);
+        form.appendChild(button);
+        return form;
+    }
+
+    function render(suggestions) {
+        list.replaceChildren.apply(list, suggestions.map(suggestionForm));
+        bar.hidden = suggestions.length === 0;
+    }
+
+    function fetchSuggestions() {
+        var query = input.value.trim();
+        var genre = genreSelect ? genreSelect.value : "";
+        var key = query + "\n" + genre;
+        if (key === lastQuery) {
+            return;
+        }
+        lastQuery = key;
+        if (controller) {
+            controller.abort();  // A newer query replaces the one in flight
+        }
+        if (!query) {
+            render([]);
+            return;
+        }
+        controller = new AbortController();
+        var params = new URLSearchParams({q: query, genre: genre});
+        fetch(suggestUrl + "?" + params.toString(), {credentials: "same-origin", signal: controller.signal})
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.statusText);
+                }
+                return response.json();
+            })
+            .then(function (body) {
+                render(body.suggestions);
+            })
+            .catch(function (error) {
+                if (error.name !== "AbortError") {
+                    lastQuery = null;  // Try again on the next keystroke
+                }
+            });
+    }
+
+    input.addEventListener("input", function () {
+        clearTimeout(timer);
+        timer = setTimeout(fetchSuggestions, DEBOUNCE_MS);
+    });
+})();
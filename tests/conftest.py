@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# The tests run against in-memory stand-ins for MongoDB and Redis
+# (tests/requirements.txt); without them the tests are skipped
+mongomock = pytest.importorskip("mongomock")
+
+from indexes import ensure_indexes
+
+
+# A fresh in-memory database with the app's indexes
+@pytest.fixture
+def db():
+    database = mongomock.MongoClient().library
+    assert ensure_indexes(database) == []
+    return database
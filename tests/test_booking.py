@@ -0,0 +1,245 @@
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+from booking import (join_book_waitlist, reserve_book_atomically, ALREADY_HOLDING, ALREADY_QUEUED, QUEUED,
+                     RESERVED, UNAVAILABLE)
+from expiry import book_reservation_threshold
+from inventory import (cancel_hold, fill_from_waitlist, hand_to_waitlist, migrate_book_copies, new_title,
+                       release_lapsed_holds, return_holds, set_total_copies)
+from waitlist import waitlist_position
+
+
+# Helper function to add a title with `copies` copies; returns its _id
+def add_title(db, title="Dune", copies=1):
+    return db.books.insert_one(new_title(title, "Author", "SciFi", copies)).inserted_id
+
+
+# Every copy of every title is either on the shelf or held by one student
+def assert_copies_conserved(db):
+    for book in db.books.find():
+        out = db.book_holds.count_documents({"book_id": book["_id"]})
+        assert 0 <= book["available_copies"] <= book["total_copies"]
+        assert book["available_copies"] + out == book["total_copies"], book["title"]
+
+
+# Helper function to reserve a copy and mark it borrowed; returns the hold
+def borrow(db, book_id, student_id):
+    assert reserve_book_atomically(db.books, db.book_holds, book_id, student_id,
+                                   waitlist_collection=db.book_waitlist) == RESERVED
+    db.book_holds.update_one({"student_id": student_id}, {"$set": {"status": "borrowed"}})
+    return db.book_holds.find_one({"student_id": student_id})
+
+
+def test_reserve_takes_a_copy(db):
+    book_id = add_title(db, copies=2)
+    assert reserve_book_atomically(db.books, db.book_holds, book_id, "s1") == RESERVED
+    assert db.books.find_one({"_id": book_id})["available_copies"] == 1
+    assert_copies_conserved(db)
+
+
+def test_no_second_hold_per_student(db):
+    dune = add_title(db, "Dune", copies=2)
+    emma = add_title(db, "Emma")
+    assert reserve_book_atomically(db.books, db.book_holds, dune, "s1") == RESERVED
+    assert reserve_book_atomically(db.books, db.book_holds, dune, "s1") == ALREADY_HOLDING
+    assert reserve_book_atomically(db.books, db.book_holds, emma, "s1") == ALREADY_HOLDING
+    assert db.book_holds.count_documents({"student_id": "s1"}) == 1
+    assert_copies_conserved(db)
+
+
+def test_no_copy_beyond_the_last(db):
+    book_id = add_title(db, copies=2)
+    outcomes = [reserve_book_atomically(db.books, db.book_holds, book_id, f"s{i}") for i in range(4)]
+    assert outcomes == [RESERVED, RESERVED, UNAVAILABLE, UNAVAILABLE]
+    assert db.books.find_one({"_id": book_id})["available_copies"] == 0
+    assert_copies_conserved(db)
+
+
+def test_lapsed_reservation_is_released_for_another_student(db):
+    book_id = add_title(db)
+    lapsed = book_reservation_threshold() - timedelta(minutes=1)
+    assert reserve_book_atomically(db.books, db.book_holds, book_id, "s1", now=lapsed) == RESERVED
+    assert reserve_book_atomically(db.books, db.book_holds, book_id, "s2") == RESERVED
+    assert db.book_holds.find_one({"book_id": book_id})["student_id"] == "s2"
+    assert_copies_conserved(db)
+
+
+def test_cancel_and_return_put_copies_back(db):
+    book_id = add_title(db, copies=2)
+    reserve_book_atomically(db.books, db.book_holds, book_id, "s1")
+    hold = borrow(db, book_id, "s2")
+    assert cancel_hold(db.books, db.book_holds, book_id, "s1")
+    assert not cancel_hold(db.books, db.book_holds, book_id, "s1")
+    assert [h["_id"] for h in return_holds(db.books, db.book_holds, [hold["_id"]])] == [hold["_id"]]
+    assert return_holds(db.books, db.book_holds, [hold["_id"]]) == []
+    assert db.books.find_one({"_id": book_id})["available_copies"] == 2
+    assert_copies_conserved(db)
+
+
+def test_waitlist_in_joining_order(db):
+    book_id = add_title(db)
+    borrow(db, book_id, "s1")
+    for student_id in ("s2", "s3"):
+        outcome, entry = join_book_waitlist(db.books, db.book_holds, db.book_waitlist, book_id, student_id)
+        assert outcome == QUEUED
+    outcome, entry = join_book_waitlist(db.books, db.book_holds, db.book_waitlist, book_id, "s2")
+    assert outcome == ALREADY_QUEUED and entry["student_id"] == "s2"
+    assert [e["student_id"] for e in db.book_waitlist.find().sort("seq", 1)] == ["s2", "s3"]
+
+
+def test_holder_cannot_join_a_waitlist(db):
+    book_id = add_title(db)
+    borrow(db, book_id, "s1")
+    assert join_book_waitlist(db.books, db.book_holds, db.book_waitlist, book_id, "s1")[0] == ALREADY_HOLDING
+
+
+def test_returned_copy_goes_to_the_waitlist_head(db):
+    book_id = add_title(db)
+    hold = borrow(db, book_id, "s1")
+    join_book_waitlist(db.books, db.book_holds, db.book_waitlist, book_id, "s2")
+    join_book_waitlist(db.books, db.book_holds, db.book_waitlist, book_id, "s3")
+    return_holds(db.books, db.book_holds, [hold["_id"]], db.book_waitlist)
+    promoted = db.book_holds.find_one({"book_id": book_id})
+    assert promoted["student_id"] == "s2" and promoted["status"] == "reserved"
+    assert db.books.find_one({"_id": book_id})["available_copies"] == 0
+    assert [e["student_id"] for e in db.book_waitlist.find()] == ["s3"]
+    assert_copies_conserved(db)
+
+
+def test_cancelled_and_lapsed_copies_go_to_the_waitlist(db):
+    book_id = add_title(db)
+    reserve_book_atomically(db.books, db.book_holds, book_id, "s1")
+    join_book_waitlist(db.books, db.book_holds, db.book_waitlist, book_id, "s2")
+    join_book_waitlist(db.books, db.book_holds, db.book_waitlist, book_id, "s3")
+    cancel_hold(db.books, db.book_holds, book_id, "s1", db.book_waitlist)
+    assert db.book_holds.find_one({"book_id": book_id})["student_id"] == "s2"
+    later = datetime.utcnow() + timedelta(days=30)
+    release_lapsed_holds(db.books, db.book_holds, later, db.book_waitlist)
+    assert db.book_holds.find_one({"book_id": book_id})["student_id"] == "s3"
+    assert db.book_waitlist.count_documents({}) == 0
+    assert_copies_conserved(db)
+
+
+def test_waitlist_head_holding_another_book_does_not_take_the_copy(db):
+    dune = add_title(db, "Dune")
+    emma = add_title(db, "Emma")
+    hold = borrow(db, dune, "s1")
+    join_book_waitlist(db.books, db.book_holds, db.book_waitlist, dune, "s2")
+    join_book_waitlist(db.books, db.book_holds, db.book_waitlist, dune, "s3")
+    # s2 takes another book while waiting
+    db.book_waitlist.delete_one({"student_id": "s2"})
+    assert reserve_book_atomically(db.books, db.book_holds, emma, "s2") == RESERVED
+    db.book_waitlist.insert_one({"book_id": dune, "student_id": "s2", "seq": 0})
+    return_holds(db.books, db.book_holds, [hold["_id"]], db.book_waitlist)
+    assert db.book_holds.find_one({"book_id": dune})["student_id"] == "s3"
+    assert db.book_holds.count_documents({"student_id": "s2"}) == 1
+    # s2 keeps their place for the next copy
+    assert [e["student_id"] for e in db.book_waitlist.find()] == ["s2"]
+    assert_copies_conserved(db)
+
+
+def test_waiting_student_who_got_the_title_leaves_the_queue(db):
+    book_id = add_title(db)
+    hold = borrow(db, book_id, "s1")
+    join_book_waitlist(db.books, db.book_holds, db.book_waitlist, book_id, "s2")
+    join_book_waitlist(db.books, db.book_holds, db.book_waitlist, book_id, "s3")
+    # A copy added and taken by s2 directly before it reached the waitlist
+    assert set_total_copies(db.books, db.books.find_one({"_id": book_id}), 2)
+    assert reserve_book_atomically(db.books, db.book_holds, book_id, "s2") == RESERVED
+    return_holds(db.books, db.book_holds, [hold["_id"]], db.book_waitlist)
+    assert sorted(h["student_id"] for h in db.book_holds.find()) == ["s2", "s3"]
+    assert db.book_waitlist.count_documents({}) == 0
+    assert_copies_conserved(db)
+
+
+# A holds collection whose inserts fail as if the server went away
+class UnreachableHolds:
+    def __init__(self, holds_collection):
+        self.holds_collection = holds_collection
+
+    def insert_one(self, document):
+        raise AutoReconnect("connection lost")
+
+    def __getattr__(self, name):
+        return getattr(self.holds_collection, name)
+
+
+def test_failed_handoff_puts_the_entry_back(db):
+    book_id = add_title(db)
+    borrow(db, book_id, "s1")
+    join_book_waitlist(db.books, db.book_holds, db.book_waitlist, book_id, "s2")
+    join_book_waitlist(db.books, db.book_holds, db.book_waitlist, book_id, "s3")
+    queue = list(db.book_waitlist.find().sort("seq", 1))
+    with pytest.raises(AutoReconnect):
+        hand_to_waitlist(UnreachableHolds(db.book_holds), db.book_waitlist, book_id, 1)
+    assert list(db.book_waitlist.find().sort("seq", 1)) == queue
+    assert hand_to_waitlist(db.book_holds, db.book_waitlist, book_id, 1) == 1
+    assert db.book_holds.find_one({"book_id": book_id, "student_id": "s2"})
+    assert [e["student_id"] for e in db.book_waitlist.find()] == ["s3"]
+
+
+def test_place_in_line_is_counted_up_to_the_limit(db):
+    book_id = add_title(db)
+    borrow(db, book_id, "s1")
+    for student_id in ("s2", "s3", "s4", "s5"):
+        join_book_waitlist(db.books, db.book_holds, db.book_waitlist, book_id, student_id)
+    entries = list(db.book_waitlist.find().sort("seq", 1))
+    assert [waitlist_position(db.book_waitlist, entry, limit=2) for entry in entries] == [1, 2, 3, None]
+    assert waitlist_position(db.book_waitlist, entries[-1]) == 4
+
+
+def test_added_copies_go_to_the_waitlist(db):
+    book_id = add_title(db)
+    borrow(db, book_id, "s1")
+    join_book_waitlist(db.books, db.book_holds, db.book_waitlist, book_id, "s2")
+    book = db.books.find_one({"_id": book_id})
+    assert set_total_copies(db.books, book, 3)
+    assert fill_from_waitlist(db.books, db.book_holds, db.book_waitlist, book_id) == 1
+    assert db.book_holds.find_one({"student_id": "s2"})["book_id"] == book_id
+    assert db.books.find_one({"_id": book_id})["available_copies"] == 1
+    assert_copies_conserved(db)
+
+
+def test_total_cannot_drop_below_copies_out(db):
+    book_id = add_title(db, copies=2)
+    borrow(db, book_id, "s1")
+    borrow(db, book_id, "s2")
+    assert not set_total_copies(db.books, db.books.find_one({"_id": book_id}), 1)
+    assert_copies_conserved(db)
+
+
+@pytest.mark.parametrize("copies", [1, 3])
+def test_copies_conserved_through_a_busy_day(db, copies):
+    book_id = add_title(db, copies=copies)
+    students = [f"s{i}" for i in range(8)]
+    for student_id in students:
+        if reserve_book_atomically(db.books, db.book_holds, book_id, student_id,
+                                   waitlist_collection=db.book_waitlist) == UNAVAILABLE:
+            join_book_waitlist(db.books, db.book_holds, db.book_waitlist, book_id, student_id)
+        assert_copies_conserved(db)
+    for _ in range(len(students)):
+        hold = db.book_holds.find_one({"book_id": book_id})
+        if hold is None:
+            break
+        db.book_holds.update_one({"_id": hold["_id"]}, {"$set": {"status": "borrowed"}})
+        return_holds(db.books, db.book_holds, [hold["_id"]], db.book_waitlist)
+        assert_copies_conserved(db)
+    assert db.book_waitlist.count_documents({}) == 0
+    assert db.books.find_one({"_id": book_id})["available_copies"] == copies
+
+
+def test_migration_counts_copies_whose_hold_was_rejected_as_available(db):
+    now = datetime.utcnow()
+    legacy = {"title": "Dune", "author": "Author", "genre": "SciFi"}
+    db.books.insert_many([
+        dict(legacy, status="borrowed", reserved_by="s1", borrowed_at=now),
+        # A second copy for the same student: its hold breaks the one-hold rule
+        dict(legacy, status="reserved", reserved_by="s1", reserved_at=now),
+        dict(legacy, status="available")
+    ])
+    assert migrate_book_copies(db.books, db.book_holds, db.loans, book_reservation_threshold(now)) == (1, 3, 1)
+    book = db.books.find_one()
+    assert (book["total_copies"], book["available_copies"]) == (3, 2)
+    assert_copies_conserved(db)
@@ -0,0 +1,109 @@
+import time
+from datetime import datetime
+
+import pytest
+from bson.objectid import ObjectId
+
+from cache import MemoryCache, NullCache, RedisCache
+
+
+# Every backend but NullCache must behave the same way
+@pytest.fixture(params=["memory", "redis"])
+def cache(request):
+    if request.param == "memory":
+        return MemoryCache(max_entries=100, default_ttl=60)
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisCache(fakeredis.FakeRedis(), default_ttl=60)
+
+
+def test_round_trips_bson_values(cache):
+    value = {"_id": ObjectId(), "title": "Dune", "copies": [1, 2], "at": datetime(2024, 1, 2, 3, 4, 5)}
+    cache.set("book:1", value)
+    assert cache.get("book:1") == value
+
+
+def test_get_many_returns_only_cached_keys(cache):
+    cache.set_many({"book:1": {"n": 1}, "book:2": {"n": 2}})
+    assert cache.get_many(["book:1", "book:2", "book:3"]) == {"book:1": {"n": 1}, "book:2": {"n": 2}}
+
+
+def test_callers_get_their_own_copy(cache):
+    cache.set("book:1", {"tags": ["a"]})
+    cache.get("book:1")["tags"].append("b")
+    assert cache.get("book:1") == {"tags": ["a"]}
+
+
+def test_delete_removes_keys(cache):
+    cache.set_many({"book:1": 1, "book:2": 2})
+    cache.delete("book:1", "book:3")
+    assert cache.get_many(["book:1", "book:2"]) == {"book:2": 2}
+
+
+def test_entries_expire_after_their_ttl(cache):
+    cache.set("book:1", 1, ttl=0.05)
+    cache.set("book:2", 2, ttl=60)
+    time.sleep(0.1)
+    assert cache.get_many(["book:1", "book:2"]) == {"book:2": 2}
+
+
+def test_get_or_load_loads_once(cache):
+    calls = []
+
+    def load():
+        calls.append(1)
+        return {"n": 1}
+
+    assert cache.get_or_load("user:s1", load) == {"n": 1}
+    assert cache.get_or_load("user:s1", load) == {"n": 1}
+    assert len(calls) == 1
+
+
+def test_clear_empties_the_cache(cache):
+    cache.set_many({"book:1": 1, "room:2": 2})
+    cache.clear()
+    assert cache.get_many(["book:1", "room:2"]) == {}
+
+
+def test_hits_and_misses_are_counted_per_namespace(cache):
+    cache.set("book:1", 1)
+    cache.get_many(["book:1", "book:2", "user:s1"])
+    metrics = {name: value for name, _, _, value in cache.collect()}
+    assert metrics["library_cache_hits_total"] == {(("namespace", "book"),): 1, (("namespace", "user"),): 0}
+    assert metrics["library_cache_misses_total"] == {(("namespace", "book"),): 1, (("namespace", "user"),): 1}
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2)
+    cache.set("book:1", 1)
+    cache.set("book:2", 2)
+    cache.get("book:1")
+    cache.set("book:3", 3)
+    assert cache.get_many(["book:1", "book:2", "book:3"]) == {"book:1": 1, "book:3": 3}
+    assert cache.size() == 2
+
+
+def test_redis_cache_keeps_keys_under_its_prefix():
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    client.set("other", b"x")
+    cache = RedisCache(client, prefix="library:")
+    cache.set("book:1", 1)
+    cache.clear()
+    assert client.keys("*") == [b"other"]
+
+
+def test_backend_errors_are_misses():
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    cache = RedisCache(fakeredis.FakeRedis(server=server))
+    server.connected = False
+    cache.set("book:1", 1)
+    assert cache.get("book:1") is None
+    assert cache.get_or_load("book:1", lambda: 2) == 2
+    assert cache.errors == 4
+
+
+def test_null_cache_never_hits():
+    cache = NullCache()
+    cache.set("book:1", 1)
+    assert cache.get("book:1") is None
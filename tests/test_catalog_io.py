@@ -0,0 +1,52 @@
+import io
+
+from catalog_io import export_books, import_books, read_records
+
+CSV = """title,author,genre,copies
+Dune,Frank Herbert,Science Fiction,2
+Emma,Jane Austen,Romance,
+Dune,Frank Herbert,Science Fiction,1
+Ulysses,,Fiction,1
+Beloved,Toni Morrison,Fiction,zero
+Hamlet,William Shakespeare,Drama,3
+"""
+
+
+def records(text, fmt="csv"):
+    return read_records(io.StringIO(text), fmt)
+
+
+def test_import_validates_and_deduplicates(db):
+    db.books.insert_one({"title": "Hamlet", "author": "William Shakespeare", "genre": "Drama",
+                         "total_copies": 1, "available_copies": 1})
+    report = import_books(db.books, records(CSV), batch_size=2)
+    assert (report.position, report.inserted, report.duplicates, report.invalid) == (6, 2, 2, 2)
+    assert report.errors == ["Row 4: Title, Author, and Genre are required",
+                             "Row 5: Copies must be a positive whole number"]
+    dune = db.books.find_one({"title": "Dune"})
+    assert (dune["total_copies"], dune["available_copies"]) == (2, 2)
+    assert db.books.find_one({"title": "Emma"})["total_copies"] == 1
+    assert db.books.count_documents({"title": "Hamlet"}) == 1
+
+
+def test_import_resumes_from_the_reported_position(db):
+    progress = []
+    import_books(db.books, records(CSV), batch_size=1, on_progress=progress.append)
+    interrupted_at = progress[0].position
+    db.books.delete_many({})
+    db.books.insert_one({"title": "Dune", "author": "Frank Herbert", "genre": "Science Fiction",
+                         "total_copies": 2, "available_copies": 2})
+    report = import_books(db.books, records(CSV), batch_size=1, start_at=interrupted_at)
+    assert report.position == 6
+    assert sorted(book["title"] for book in db.books.find()) == ["Dune", "Emma", "Hamlet"]
+
+
+def test_jsonl_round_trip(db):
+    text = '{"title": "Dune", "author": "Frank Herbert", "genre": "Science Fiction", "copies": 3}\n\nnot json\n'
+    report = import_books(db.books, records(text, "jsonl"))
+    assert (report.inserted, report.invalid) == (1, 1)
+    exported = "".join(export_books(db.books, "jsonl", chunk_size=1))
+    db.books.delete_many({})
+    report = import_books(db.books, records(exported, "jsonl"))
+    assert report.inserted == 1
+    assert db.books.find_one()["total_copies"] == 3
@@ -0,0 +1,32 @@
+import gzip
+
+from flask import Flask
+
+from compression import compress_response, COMPRESS_MIN_SIZE
+
+PAGE = "<p>" + "Emma by Jane Austen. " * 100 + "</p>"
+
+
+def make_app():
+    app = Flask(__name__)
+    app.after_request(compress_response)
+    app.add_url_rule("/page", "page", lambda: PAGE)
+    app.add_url_rule("/small", "small", lambda: "<p>ok</p>")
+    app.add_url_rule("/missing", "missing", lambda: (PAGE, 404))
+    return app
+
+
+def test_pages_are_compressed_for_clients_that_accept_it():
+    client = make_app().test_client()
+    response = client.get("/page", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.data).decode() == PAGE
+
+
+def test_small_error_and_unaccepted_responses_are_left_alone():
+    client = make_app().test_client()
+    assert len(PAGE) >= COMPRESS_MIN_SIZE
+    assert "Content-Encoding" not in client.get("/page").headers
+    assert "Content-Encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "Content-Encoding" not in client.get("/missing", headers={"Accept-Encoding": "gzip"}).headers
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+from flask import Flask, Response
+
+from catalog_version import CatalogVersion
+from conditional import add_page_etag, not_modified, set_validators
+from expiry import ExpiryScheduler
+from inventory import new_hold, new_title
+
+
+def make_app():
+    app = Flask(__name__)
+    app.after_request(add_page_etag)
+    app.add_url_rule("/page", "page", lambda: "<p>Emma</p>")
+
+    def api():
+        unchanged = not_modified("v1")
+        if unchanged:
+            return unchanged
+        return set_validators(Response("{}", mimetype="application/json"), "v1")
+    app.add_url_rule("/api", "api", api)
+    return app
+
+
+def test_unchanged_page_revalidates_with_304():
+    client = make_app().test_client()
+    etag = client.get("/page").headers["ETag"]
+    assert etag.startswith("W/")
+    response = client.get("/page", headers={"If-None-Match": etag})
+    assert response.status_code == 304 and not response.data
+
+
+def test_not_modified_answers_before_the_work():
+    client = make_app().test_client()
+    response = client.get("/api")
+    assert response.headers["ETag"] == 'W/"v1"' and response.headers["Cache-Control"] == "private, no-cache"
+    assert client.get("/api", headers={"If-None-Match": 'W/"v1"'}).status_code == 304
+    assert client.get("/api", headers={"If-None-Match": 'W/"v0"'}).status_code == 200
+
+
+def test_catalog_version_is_shared_through_mongodb(db):
+    version = CatalogVersion(db.counters, ttl=60)
+    other_worker = CatalogVersion(db.counters, ttl=0)
+    assert version.current() == (0, None)
+    bumped = version.bump()
+    assert bumped[0] == 1 and version.current() == bumped
+    assert other_worker.current() == bumped
+    other_worker.bump()
+    # A worker trusts the version it read for `ttl` seconds
+    assert version.current() == bumped
+    version.ttl = 0
+    assert version.current()[0] == 2
+    assert dict((name, value) for name, _, _, value in version.collect())["library_catalog_bumps_total"] == 1
+
+
+def test_expiry_sweep_reports_the_released_titles(db):
+    now = datetime.utcnow()
+    emma, dune = db.books.insert_many([new_title("Emma", "Jane Austen", "Romance"),
+                                       new_title("Dune", "Frank Herbert", "Science Fiction")]).inserted_ids
+    db.books.update_many({}, {"$set": {"available_copies": 0}})
+    db.book_holds.insert_many([new_hold({"_id": emma}, "s1", now - timedelta(hours=50)),
+                               new_hold({"_id": dune}, "s2", now)])
+    expired = []
+    scheduler = ExpiryScheduler(db.books, db.book_holds, db.conference_reservations,
+                                on_books_expired=expired.append)
+    assert scheduler.sweep(now)["books_expired"] == 1
+    assert expired == [{emma}]
+    assert db.books.find_one({"_id": emma})["available_copies"] == 1
+    scheduler.sweep(now)
+    assert expired == [{emma}]
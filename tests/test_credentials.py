@@ -0,0 +1,67 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from credentials import CredentialService, CredentialServiceBusy
+
+
+# Helper function to build a service whose pool is a thread pool, so tests can
+# block its workers with an event
+def make_service(max_pending, timeout=0.2):
+    service = CredentialService(method="pbkdf2:sha256:1000", workers=1, max_pending=max_pending, timeout=timeout)
+    service._pool = ThreadPoolExecutor(1)
+    service._pid = os.getpid()
+    return service
+
+
+# Helper function to occupy the pool's only worker until `release` is set. The
+# caller stops waiting after the service timeout; the slot stays taken.
+def start_blocking_call(service, release):
+    def call():
+        try:
+            service._run("hash", release.wait, 5)
+        except CredentialServiceBusy:
+            pass
+    thread = threading.Thread(target=call)
+    thread.start()
+    return thread
+
+
+def test_full_queue_turns_requests_away():
+    service = make_service(max_pending=1)
+    release = threading.Event()
+    thread = start_blocking_call(service, release)
+    try:
+        with pytest.raises(CredentialServiceBusy):
+            service.hash("secret")
+    finally:
+        release.set()
+        thread.join()
+    assert dict((name, value) for name, _, _, value in service.collect())["library_password_pool_rejections_total"] == 1
+    assert service.hash("secret").startswith("pbkdf2:sha256:1000$")
+
+
+def test_timed_out_call_frees_its_slot():
+    service = make_service(max_pending=2)
+    release = threading.Event()
+    thread = start_blocking_call(service, release)
+    try:
+        # Queued behind the blocked worker until it times out and is cancelled
+        with pytest.raises(CredentialServiceBusy):
+            service.hash("secret")
+        assert service._slots.acquire(timeout=0)
+        service._slots.release()
+    finally:
+        release.set()
+        thread.join()
+
+
+def test_verify_and_rehash_upgrades_old_hashes():
+    service = CredentialService(method="pbkdf2:sha256:1000", workers=0)
+    old_hash = CredentialService(method="pbkdf2:sha256:2000", workers=0).hash("secret")
+    assert service.verify_and_rehash(old_hash, "wrong") == (False, None)
+    valid, new_hash = service.verify_and_rehash(old_hash, "secret")
+    assert valid and new_hash.startswith("pbkdf2:sha256:1000$")
+    assert service.verify_and_rehash(new_hash, "secret") == (True, None)
@@ -0,0 +1,48 @@
+from genres import GenreCatalog
+from inventory import new_title
+
+
+# Helper function to add one title per genre given
+def add_titles(db, *genres):
+    db.books.insert_many([new_title(f"Book {i}", "Author", genre) for i, genre in enumerate(genres)])
+
+
+def test_counts_titles_per_genre(db):
+    add_titles(db, "SciFi", "SciFi", "Romance")
+    db.books.insert_one({"title": "No genre", "author": "Author"})
+    catalog = GenreCatalog(db.books, ttl=0)
+    assert catalog.counts() == {"SciFi": 2, "Romance": 1, "Unknown": 1}
+    assert catalog.genres() == ["Romance", "SciFi", "Unknown"]
+
+
+def test_counts_are_cached_until_they_expire(db):
+    add_titles(db, "SciFi")
+    catalog = GenreCatalog(db.books, ttl=300)
+    assert catalog.counts() == {"SciFi": 1}
+    add_titles(db, "Romance")
+    assert catalog.counts() == {"SciFi": 1}
+    catalog.invalidate()
+    assert catalog.counts() == {"SciFi": 1, "Romance": 1}
+
+
+def test_record_change_adjusts_the_cached_counts(db):
+    add_titles(db, "SciFi", "Romance")
+    catalog = GenreCatalog(db.books, ttl=300)
+    catalog.counts()
+    catalog.record_change(new_genre="Poetry")
+    catalog.record_change(old_genre="Romance", new_genre="SciFi")
+    assert catalog.counts() == {"SciFi": 2, "Poetry": 1}
+
+
+def test_callers_get_a_copy(db):
+    add_titles(db, "SciFi")
+    catalog = GenreCatalog(db.books, ttl=300)
+    catalog.counts()["SciFi"] = 99
+    assert catalog.counts() == {"SciFi": 1}
+
+
+def test_record_change_before_the_first_load_is_ignored(db):
+    add_titles(db, "SciFi")
+    catalog = GenreCatalog(db.books, ttl=300)
+    catalog.record_change(new_genre="SciFi")
+    assert catalog.counts() == {"SciFi": 1}
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+
+from indexes import execution_totals, plan_problems, query_shapes, winning_plan_stages
+from reservations import create_reservation
+from room_status import get_room_reservations
+
+# Explain output of a sharded find (classic engine) and of an aggregation
+# whose winning plan runs in the slot based engine
+SHARDED_EXPLAIN = {
+    "queryPlanner": {"winningPlan": {"stage": "SHARD_MERGE", "shards": [
+        {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "status_id"}}},
+        {"winningPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}},
+         "rejectedPlans": [{"stage": "IXSCAN", "indexName": "unused"}]}
+    ]}},
+    "executionStats": {"executionStages": {"shards": [
+        {"executionStats": {"totalKeysExamined": 3000, "nReturned": 2}},
+        {"executionStats": {"totalKeysExamined": 0, "nReturned": 1}}
+    ]}}
+}
+SBE_EXPLAIN = {"stages": [{"$cursor": {"queryPlanner": {"winningPlan": {"queryPlan": {
+    "stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "end_time"}}}},
+    "executionStats": {"totalKeysExamined": 5, "nReturned": 5}}}]}
+
+
+def test_winning_plan_stages_skip_rejected_plans():
+    assert winning_plan_stages(SHARDED_EXPLAIN) == ["SHARD_MERGE", "FETCH", "IXSCAN status_id", "SORT", "COLLSCAN"]
+    assert winning_plan_stages(SBE_EXPLAIN) == ["FETCH", "IXSCAN end_time"]
+
+
+def test_execution_totals_add_up_shards():
+    assert execution_totals(SHARDED_EXPLAIN) == (3000, 3)
+    assert execution_totals(SBE_EXPLAIN) == (5, 5)
+
+
+def test_plan_problems():
+    assert plan_problems(["FETCH", "IXSCAN end_time"], 5, 5) == []
+    assert plan_problems(["SORT", "COLLSCAN"], 0, 1) == ["COLLSCAN", "SORT"]
+    assert plan_problems(["IXSCAN status_id"], 3000, 3) == ["3000 keys for 3 results"]
+    # Small collections are not flagged for the key ratio
+    assert plan_problems(["IXSCAN status_id"], 500, 0) == []
+
+
+def test_query_shapes_run(db):
+    for description, command in query_shapes():
+        if "find" in command and "$expr" not in command["filter"]:
+            assert list(db[command["find"]].find(command["filter"])) == [], description
+
+
+def test_room_status_lists_bookings_by_start_time(db):
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+    room_id = db.conference_rooms.insert_one({"room_name": "Room A"}).inserted_id
+    day = (now + timedelta(days=1)).replace(hour=8, minute=0)
+    for student_id, hours in (("s2", 3), ("s1", 1), ("s3", 5)):
+        start = day + timedelta(hours=hours)
+        create_reservation(db.conference_reservations, room_id, student_id, start.strftime("%Y-%m-%d"),
+                           start, start + timedelta(hours=1))
+    rooms = get_room_reservations(db.conference_rooms, db.conference_reservations, now)
+    assert [res["reserved_by"] for res in rooms[0]["reservations"]] == ["s1", "s2", "s3"]
+    assert ObjectId(rooms[0]["room_id"]) == room_id
@@ -0,0 +1,56 @@
+from flask import Flask
+
+from instrumentation import Instrumentation
+
+
+def make_app():
+    app = Flask(__name__)
+    app.secret_key = "test"
+    instrumentation = Instrumentation()
+    instrumentation.profiling_enabled = True
+    instrumentation.init_app(app)
+    app.add_url_rule("/", "index", lambda: "ok")
+    return app
+
+
+def test_profile_is_ignored_for_anonymous_callers():
+    client = make_app().test_client()
+    response = client.get("/?profile=cprofile")
+    assert response.get_data(as_text=True) == "ok"
+
+
+def test_profile_is_served_to_admins():
+    client = make_app().test_client()
+    with client.session_transaction() as session:
+        session["user"] = {"is_admin": True}
+    response = client.get("/?profile=cprofile")
+    assert "cumulative" in response.get_data(as_text=True)
+
+
+def test_metrics_require_an_admin():
+    client = make_app().test_client()
+    assert client.get("/metrics").status_code == 403
+    with client.session_transaction() as session:
+        session["user"] = {"is_admin": True}
+    assert client.get("/metrics").status_code == 200
+
+
+def test_event_loop_commands_count_towards_the_request():
+    from types import SimpleNamespace
+
+    from async_support import EventLoopThread
+    from instrumentation import RequestStats, _local, with_request_stats
+
+    instrumentation = Instrumentation()
+    event = SimpleNamespace(command_name="find", reply={"cursor": {"firstBatch": [{}, {}]}})
+
+    async def query():
+        instrumentation.command_listener.started(event)
+        instrumentation.command_listener.succeeded(event)
+
+    _local.stats = stats = RequestStats()
+    try:
+        EventLoopThread("test-loop").run(with_request_stats(query()), timeout=5)
+    finally:
+        _local.stats = None
+    assert (stats.mongo_commands, stats.mongo_documents) == (1, 2)
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from live_updates import AvailabilityFeed, TooManySubscribers, book_delta, server_threads
+
+
+# Helper function to build a feed that never starts watching MongoDB
+def make_feed(max_clients):
+    feed = AvailabilityFeed(lambda: None, lambda: [], max_clients=max_clients)
+    feed._ensure_watching = lambda: None
+    return feed
+
+
+def test_streams_get_threads_of_their_own():
+    assert server_threads(4, 32) == 36
+    assert server_threads(4, 0) == 4
+
+
+def test_subscribers_are_limited_per_worker():
+    feed = make_feed(max_clients=2)
+    first = feed.subscribe()
+    feed.subscribe()
+    with pytest.raises(TooManySubscribers):
+        feed.subscribe()
+    # A stream that ends frees its place
+    stream = feed.stream(first, heartbeat=0.01, duration=0.01)
+    assert list(stream)[0] == "retry: 5000\n\n"
+    feed.subscribe()
+
+
+def test_lagging_subscriber_is_told_to_resync():
+    feed = make_feed(max_clients=1)
+    subscription = feed.subscribe()
+    subscription._events.maxsize = 2
+    for available in range(3):
+        feed.publish({"type": "book", "id": "1", "available": available})
+    assert subscription.get(0) == {"type": "resync"} and subscription.get(0) is None
+
+
+def test_book_deltas():
+    update = {"operationType": "update", "documentKey": {"_id": 1},
+              "updateDescription": {"updatedFields": {"available_copies": 2}}}
+    assert book_delta(update) == {"type": "book", "id": "1", "available": 2}
+    assert book_delta({"operationType": "update", "documentKey": {"_id": 1},
+                       "updateDescription": {"updatedFields": {"title": "Emma"}}}) is None
+    assert book_delta({"operationType": "delete", "documentKey": {"_id": 1}}) == {
+        "type": "book", "id": "1", "deleted": True}
+
+
+def test_events_answer_503_when_the_worker_is_full(db, monkeypatch):
+    import app as library_app
+
+    monkeypatch.setenv("EXPIRY_SCHEDULER", "off")
+    monkeypatch.setattr(library_app.mongo, "_client", db.client)
+    monkeypatch.setattr(library_app.mongo, "_pid", os.getpid())
+    monkeypatch.setattr(library_app.mongo, "database", db.name)
+    monkeypatch.setattr(library_app, "availability_feed", make_feed(max_clients=0))
+    client = library_app.create_app("mongodb://localhost").test_client()
+    assert client.get("/events").status_code == 401
+    with client.session_transaction() as session:
+        session["user"] = {"IDNumber": "s1", "is_admin": False}
+    response = client.get("/events")
+    assert response.status_code == 503 and "already open" in response.get_json()["error"]
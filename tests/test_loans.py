@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+from loans import (accrue_late_fees, close_loans, fee_balances, new_loan, overdue_loans_query, settle_fees,
+                   LATE_FEE_PER_DAY, LOAN_DAYS)
+from pagination import sorted_keyset_page
+
+NOW = datetime(2026, 1, 10, 12)
+
+
+# Helper function to open a loan borrowed `days` days before NOW
+def lend(db, hold_id, days, student_id="s1"):
+    db.loans.insert_one(new_loan({"_id": hold_id, "book_id": hold_id, "student_id": student_id},
+                                 NOW - timedelta(days=days)))
+
+
+def test_fees_accrue_per_day_overdue(db):
+    lend(db, 1, LOAN_DAYS + 2)
+    lend(db, 2, 1)
+    assert accrue_late_fees(db.loans, NOW) == 1
+    loan = db.loans.find_one({"hold_id": 1})
+    assert loan["overdue_days"] == 2 and loan["fee"] == 2 * LATE_FEE_PER_DAY
+    assert db.loans.find_one({"hold_id": 2})["fee"] == 0
+
+
+def test_only_loans_with_a_new_overdue_day_are_updated(db):
+    lend(db, 1, LOAN_DAYS + 2)
+    accrue_late_fees(db.loans, NOW)
+    accrued_at = db.loans.find_one({"hold_id": 1})["fee_accrued_at"]
+    # Part of a day counts as a day, so the count moves on right after NOW...
+    assert accrue_late_fees(db.loans, NOW + timedelta(hours=1)) == 1
+    # ...and then stays put for the rest of that day
+    assert accrue_late_fees(db.loans, NOW + timedelta(hours=12)) == 0
+    assert accrue_late_fees(db.loans, NOW + timedelta(days=1)) == 0
+    loan = db.loans.find_one({"hold_id": 1})
+    assert loan["overdue_days"] == 3 and loan["fee_accrued_at"] > accrued_at
+
+
+def test_returned_loans_stop_accruing(db):
+    lend(db, 1, LOAN_DAYS + 2)
+    assert close_loans(db.loans, [1], NOW) == 1
+    assert accrue_late_fees(db.loans, NOW + timedelta(days=5)) == 0
+    assert db.loans.find_one({"hold_id": 1})["fee"] == 2 * LATE_FEE_PER_DAY
+
+
+def test_overdue_loans_page_by_fee(db):
+    for hold_id in range(1, 6):
+        lend(db, hold_id, LOAN_DAYS + hold_id % 3)
+    accrue_late_fees(db.loans, NOW)
+    fees = []
+    page = sorted_keyset_page(db.loans, overdue_loans_query(NOW), "fee", -1, page_size=2)
+    while True:
+        fees += [(loan["fee"], loan["hold_id"]) for loan in page.items]
+        if not page.next_cursor:
+            break
+        page = sorted_keyset_page(db.loans, overdue_loans_query(NOW), "fee", -1, after=page.next_cursor, page_size=2)
+    # Ties on the fee are broken by _id in the same direction (latest loan
+    # first); loan 3 is due right now, so not overdue yet
+    assert [hold_id for _, hold_id in fees] == [5, 2, 4, 1]
+    assert fees == sorted(fees, key=lambda fee: -fee[0])
+
+
+def test_balances_and_settling(db):
+    lend(db, 1, LOAN_DAYS + 2)
+    lend(db, 2, LOAN_DAYS + 1)
+    lend(db, 3, LOAN_DAYS + 1, student_id="s2")
+    accrue_late_fees(db.loans, NOW)
+    close_loans(db.loans, [1], NOW)
+    assert fee_balances(db.loans) == [
+        {"student_id": "s1", "owed": 2 * LATE_FEE_PER_DAY, "accruing": LATE_FEE_PER_DAY, "loans": 2},
+        {"student_id": "s2", "owed": 0, "accruing": LATE_FEE_PER_DAY, "loans": 1}
+    ]
+    # Only the fees of returned books are settled
+    assert settle_fees(db.loans, "s1", NOW) == 1
+    assert [balance["owed"] for balance in fee_balances(db.loans)] == [0, 0]
@@ -0,0 +1,61 @@
+import pytest
+
+from pagination import get_page_size, keyset_page, parse_object_id_cursor, ranked_page
+
+
+# A collection of ten numbered documents, in _id order
+@pytest.fixture
+def numbers(db):
+    db.numbers.insert_many([{"n": n, "even": n % 2 == 0} for n in range(1, 11)])
+    return db.numbers
+
+
+# Helper function to list the numbers on a page
+def ns(page):
+    return [item["n"] for item in page.items]
+
+
+def test_page_size_is_bounded():
+    assert get_page_size({"page_size": "10"}) == 10
+    assert get_page_size({"page_size": "0"}) == 1
+    assert get_page_size({"page_size": "100000"}, maximum=50) == 50
+    assert get_page_size({"page_size": "ten"}, default=7) == 7
+
+
+def test_invalid_cursors_start_from_the_first_page(numbers):
+    assert parse_object_id_cursor("not-an-id") is None
+    assert ns(keyset_page(numbers, {}, after="not-an-id", page_size=3)) == [1, 2, 3]
+
+
+def test_walks_forward_and_back(numbers):
+    first = keyset_page(numbers, {}, page_size=4)
+    assert ns(first) == [1, 2, 3, 4] and first.prev_cursor is None
+    second = keyset_page(numbers, {}, after=first.next_cursor, page_size=4)
+    assert ns(second) == [5, 6, 7, 8]
+    last = keyset_page(numbers, {}, after=second.next_cursor, page_size=4)
+    assert ns(last) == [9, 10] and last.next_cursor is None
+    back = keyset_page(numbers, {}, before=last.prev_cursor, page_size=4)
+    assert ns(back) == [5, 6, 7, 8]
+    assert ns(keyset_page(numbers, {}, before=back.prev_cursor, page_size=4)) == [1, 2, 3, 4]
+
+
+def test_filters_apply_on_every_page(numbers):
+    first = keyset_page(numbers, {"even": True}, page_size=3)
+    assert ns(first) == [2, 4, 6]
+    assert ns(keyset_page(numbers, {"even": True}, after=first.next_cursor, page_size=3)) == [8, 10]
+
+
+def test_pages_stay_stable_when_earlier_documents_are_deleted(numbers):
+    first = keyset_page(numbers, {}, page_size=3)
+    numbers.delete_many({"n": {"$in": [1, 2]}})
+    assert ns(keyset_page(numbers, {}, after=first.next_cursor, page_size=3)) == [4, 5, 6]
+
+
+def test_ranked_page_uses_offsets():
+    results = list(range(7))
+    page = ranked_page(results, page_size=3)
+    assert page.items == [0, 1, 2] and page.next_cursor == "3" and page.prev_cursor is None
+    page = ranked_page(results, after=page.next_cursor, page_size=3)
+    assert page.items == [3, 4, 5]
+    assert ranked_page(results, before=page.prev_cursor, page_size=3).items == [0, 1, 2]
+    assert ranked_page(results, after="junk", page_size=3).items == [0, 1, 2]
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+from reservations import (cancel_reservations, get_room_day_reservations, migrate_embedded_reservations,
+                          student_has_active_reservation)
+
+NOW = datetime.utcnow().replace(second=0, microsecond=0)
+TOMORROW = (NOW + timedelta(days=1)).replace(hour=0, minute=0)
+
+
+# Helper function to build an embedded reservation of the old schema
+def embedded(student_id, start_time, hours=1):
+    return {"reserved_by": student_id, "date": start_time.strftime("%Y-%m-%d"), "start_time": start_time,
+            "end_time": start_time + timedelta(hours=hours)}
+
+
+def add_room_with_reservations(db):
+    return db.conference_rooms.insert_one({"room_name": "Room A", "reservations": [
+        embedded("s1", TOMORROW + timedelta(hours=10)),
+        embedded("s2", TOMORROW + timedelta(hours=8)),
+        embedded("old", NOW - timedelta(days=2))
+    ]}).inserted_id
+
+
+def test_migration_moves_unfinished_reservations(db):
+    room_id = add_room_with_reservations(db)
+    assert migrate_embedded_reservations(db.conference_rooms, db.conference_reservations) == (1, 2)
+    assert "reservations" not in db.conference_rooms.find_one({"_id": room_id})
+    day = get_room_day_reservations(db.conference_reservations, room_id, TOMORROW.strftime("%Y-%m-%d"))
+    assert [res["reserved_by"] for res in day] == ["s2", "s1"]
+    assert all(res["active_holder"] == res["reserved_by"] and res["slot_keys"] for res in day)
+
+
+def test_migration_is_safe_to_run_again(db):
+    room_id = add_room_with_reservations(db)
+    migrate_embedded_reservations(db.conference_rooms, db.conference_reservations)
+    # A second run over a room that was only partly migrated adds no duplicates
+    db.conference_rooms.update_one({"_id": room_id}, {"$set": {"reservations": [
+        embedded("s1", TOMORROW + timedelta(hours=10))]}})
+    migrate_embedded_reservations(db.conference_rooms, db.conference_reservations)
+    assert db.conference_reservations.count_documents({}) == 2
+
+
+def test_active_reservation_lookup_and_cancel(db):
+    room_id = add_room_with_reservations(db)
+    migrate_embedded_reservations(db.conference_rooms, db.conference_reservations)
+    assert student_has_active_reservation(db.conference_reservations, "s1", NOW)
+    assert not student_has_active_reservation(db.conference_reservations, "old", NOW)
+    assert not student_has_active_reservation(db.conference_reservations, "s1", TOMORROW + timedelta(hours=12))
+    assert cancel_reservations(db.conference_reservations, room_id, "s1") == 1
+    assert not student_has_active_reservation(db.conference_reservations, "s1", NOW)
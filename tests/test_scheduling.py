@@ -0,0 +1,46 @@
+from datetime import date, datetime, timedelta
+
+from scheduling import DaySchedule
+
+DAY = date(2030, 1, 7)
+
+
+def at(hour, minute=0):
+    return datetime.combine(DAY, datetime.min.time()) + timedelta(hours=hour, minutes=minute)
+
+
+def test_short_gap_is_not_offered():
+    # 09:30 - 10:00 is free but shorter than a 90 minute slot
+    schedule = DaySchedule(DAY, [(at(8), at(9, 30)), (at(10), at(12))])
+    assert schedule.next_free_slot(timedelta(minutes=90)) == at(12)
+    assert schedule.next_free_slot(timedelta(minutes=30)) == at(9, 30)
+
+
+def test_no_slot_when_the_day_is_full():
+    schedule = DaySchedule(DAY, [(at(8), at(12)), (at(12), at(17))])
+    assert schedule.next_free_slot(timedelta(minutes=90)) is None
+    assert schedule.free_windows(timedelta(minutes=1)) == [(at(17), at(18))]
+
+
+def test_not_before_skips_past_times():
+    schedule = DaySchedule(DAY, [(at(10), at(11))])
+    assert schedule.next_free_slot(timedelta(minutes=60), not_before=at(9, 15)) == at(11)
+    assert schedule.next_free_slot(timedelta(minutes=30), not_before=at(9, 15)) == at(9, 15)
+    assert schedule.next_free_slot(timedelta(minutes=30), not_before=at(10, 30)) == at(11)
+
+
+def test_overlaps_and_opening_hours():
+    schedule = DaySchedule(DAY, [(at(10), at(11))])
+    assert schedule.overlaps(at(10, 30), at(11, 30))
+    assert not schedule.overlaps(at(11), at(12))
+    assert not schedule.is_free(at(7), at(8, 30))
+    assert not schedule.is_free(at(17), at(18, 30))
+    assert schedule.is_free(at(16, 30), at(18))
+
+
+def test_add_merges_intervals():
+    schedule = DaySchedule(DAY, [(at(9), at(10)), (at(12), at(13))])
+    schedule.add(at(10), at(12))
+    assert schedule.free_windows(timedelta(minutes=1)) == [(at(8), at(9)), (at(13), at(18))]
+    schedule.add(at(15), at(16))
+    assert schedule.free_windows(timedelta(minutes=90)) == [(at(13), at(15)), (at(16), at(18))]
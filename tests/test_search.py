@@ -0,0 +1,62 @@
+from bson.objectid import ObjectId
+
+from inventory import new_title
+from search import CatalogSearchIndex, tokenize
+
+
+# Helper function to add titles and return an index built over them
+def build_index(db, *titles):
+    ids = {}
+    for title, author, genre in titles:
+        ids[title] = db.books.insert_one(new_title(title, author, genre)).inserted_id
+    index = CatalogSearchIndex(db.books, max_age=0)
+    index.rebuild()
+    return index, ids
+
+
+def test_tokenize_lowercases_words():
+    assert tokenize("Hitchhiker's Guide, Vol. 2") == ["hitchhiker", "s", "guide", "vol", "2"]
+    assert tokenize(None) == []
+
+
+def test_prefix_matches_only_tokens_with_the_prefix(db):
+    index, _ = build_index(db, ("Dune", "Frank Herbert", "SciFi"), ("Dusk", "Ann Dunn", "Horror"),
+                           ("Emma", "Jane Austen", "Romance"))
+    assert list(index._prefix_matches("du")) == ["dune", "dunn", "dusk"]
+    assert list(index._prefix_matches("dun")) == ["dune", "dunn"]
+    assert list(index._prefix_matches("zz")) == []
+
+
+def test_every_query_token_must_match(db):
+    index, ids = build_index(db, ("Dune", "Frank Herbert", "SciFi"), ("Dune Messiah", "Frank Herbert", "SciFi"),
+                             ("Emma", "Jane Austen", "Romance"))
+    assert [doc["title"] for doc in index.search("dune mess")] == ["Dune Messiah"]
+    assert index.search("dune austen") == []
+
+
+def test_title_matches_rank_above_author_matches(db):
+    index, _ = build_index(db, ("Herbert's Garden", "Ann Lee", "Fiction"), ("Dune", "Frank Herbert", "SciFi"))
+    assert [doc["title"] for doc in index.search("herbert")] == ["Herbert's Garden", "Dune"]
+
+
+def test_whole_word_beats_prefix(db):
+    index, _ = build_index(db, ("Dunes of Mars", "A", "SciFi"), ("Dune", "A", "SciFi"))
+    assert [doc["title"] for doc in index.search("dune")] == ["Dune", "Dunes of Mars"]
+
+
+def test_genre_filter_and_limit(db):
+    index, _ = build_index(db, ("Dune", "A", "SciFi"), ("Dune Poems", "A", "Poetry"), ("Dune Road", "A", "SciFi"))
+    assert {doc["title"] for doc in index.search("dune", genre="SciFi")} == {"Dune", "Dune Road"}
+    assert len(index.search("dune", limit=1)) == 1
+
+
+def test_add_update_and_remove_keep_the_index_current(db):
+    index, ids = build_index(db, ("Dune", "Frank Herbert", "SciFi"))
+    book_id = ObjectId()
+    index.add({"_id": book_id, "title": "Emma", "author": "Jane Austen", "genre": "Romance"})
+    assert [doc["_id"] for doc in index.search("emma")] == [book_id]
+    index.update({"_id": book_id, "title": "Persuasion", "author": "Jane Austen", "genre": "Romance"})
+    assert index.search("emma") == []
+    index.remove(ids["Dune"])
+    assert index.search("dune") == []
+    assert "dune" not in index._tokens
@@ -0,0 +1,118 @@
+import os
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from metrics import CounterSet
+
+# Students who find every copy of a title out join its waitlist, one document
+# per student in the book_waitlist collection:
+#   {book_id, student_id, seq, joined_at, title, author, genre}
+# seq numbers a title's queue in joining order; a unique (book_id, seq) index
+# rejects two students taking the same number, and a unique student_id index
+# keeps a student on one waitlist at a time. When a copy comes back it goes
+# straight to the first student in the queue who can take it (see
+# hand_to_waitlist in inventory.py).
+
+# How many times joining is retried after another student took the same number
+MAX_WAITLIST_ATTEMPTS = int(os.getenv("MAX_WAITLIST_ATTEMPTS", "5"))
+
+# Places in line are counted up to this many students ahead; a student further
+# back is told they are behind more than this many
+WAITLIST_POSITION_LIMIT = int(os.getenv("WAITLIST_POSITION_LIMIT", "100"))
+
+# Waitlist joins and promotions, exported with the booking counters
+waitlist_counters = CounterSet()
+
+# Helper function to create the book_waitlist indexes: a title's queue in
+# order (the head, positions) and a student's entry
+def ensure_waitlist_indexes(waitlist_collection):
+    waitlist_collection.create_index([("book_id", ASCENDING), ("seq", ASCENDING)], name="book_id_seq", unique=True)
+    waitlist_collection.create_index("student_id", name="student_id_unique", unique=True)
+
+# Helper function to build the query for a student's waitlist entry
+# (optionally only if it is for the given title)
+def student_waitlist_query(student_id, book_id=None):
+    return {"student_id": student_id} if book_id is None else {"book_id": book_id, "student_id": student_id}
+
+# Helper function to build the query for a title's waitlist, optionally only
+# the places after `after_seq` or before `before_seq`
+def title_waitlist_query(book_id, after_seq=None, before_seq=None):
+    query = {"book_id": book_id}
+    if after_seq is not None or before_seq is not None:
+        query["seq"] = {}
+        if after_seq is not None:
+            query["seq"]["$gt"] = after_seq
+        if before_seq is not None:
+            query["seq"]["$lt"] = before_seq
+    return query
+
+# Helper function to build the query for the waitlists of the given titles
+def titles_waitlist_query(book_ids):
+    return {"book_id": {"$in": list(book_ids)}}
+
+# Add a student to the end of a title's waitlist. Returns (entry, joined):
+# the student's entry, and False if they were already waiting (for this or
+# another title), in which case the existing entry is returned.
+def join_waitlist(waitlist_collection, book, student_id, now=None):
+    now = now or datetime.utcnow()
+    for _ in range(MAX_WAITLIST_ATTEMPTS):
+        existing = waitlist_collection.find_one(student_waitlist_query(student_id))
+        if existing:
+            return existing, False
+        last = waitlist_collection.find_one(title_waitlist_query(book["_id"]), {"seq": 1}, sort=[("seq", DESCENDING)])
+        entry = {
+            "book_id": book["_id"],
+            "student_id": student_id,
+            "seq": last["seq"] + 1 if last else 1,
+            "joined_at": now,
+            "title": book.get("title"),
+            "author": book.get("author"),
+            "genre": book.get("genre", "Unknown")
+        }
+        try:
+            waitlist_collection.insert_one(entry)
+            waitlist_counters.inc("book_waitlist_joins_total")
+            return entry, True
+        except DuplicateKeyError:
+            continue  # Another student took the number (or this student joined meanwhile)
+    return waitlist_collection.find_one(student_waitlist_query(student_id)), False
+
+# Helper function to get a student's waitlist entry, if any
+def get_waitlist_entry(waitlist_collection, student_id):
+    return waitlist_collection.find_one(student_waitlist_query(student_id))
+
+# Helper function to get a student's place in line (1 is next), or None when
+# more than `limit` students are ahead. Counted on the (book_id, seq) index
+# alone, walking at most limit + 1 keys and without reading the entries.
+def waitlist_position(waitlist_collection, entry, limit=WAITLIST_POSITION_LIMIT):
+    ahead = waitlist_collection.count_documents(title_waitlist_query(entry["book_id"], before_seq=entry["seq"]),
+                                                limit=limit + 1)
+    return ahead + 1 if ahead <= limit else None
+
+# Take a student off a title's waitlist; returns whether they were on it
+def leave_waitlist(waitlist_collection, book_id, student_id):
+    return waitlist_collection.delete_one(student_waitlist_query(student_id, book_id)).deleted_count == 1
+
+# Helper function to take the first entry of a title's waitlist after place
+# `after_seq` (from the head when None) off the queue, in one atomic write so
+# no other handoff can take it too; None at the end of the queue
+def claim_waitlist_entry(waitlist_collection, book_id, after_seq=None):
+    return waitlist_collection.find_one_and_delete(title_waitlist_query(book_id, after_seq),
+                                                   sort=[("seq", ASCENDING)])
+
+# Helper function to put a claimed entry back in its place. Returns False if
+# the place is gone: the student joined another waitlist meanwhile, or the
+# entry was the last one and a new student took its number.
+def restore_waitlist_entry(waitlist_collection, entry):
+    try:
+        waitlist_collection.insert_one(entry)
+        return True
+    except DuplicateKeyError:
+        waitlist_counters.inc("book_waitlist_places_lost_total")
+        return False
+
+# Helper function to pick the titles (of `book_ids`) someone is waiting for
+def titles_with_waiters(waitlist_collection, book_ids):
+    return set(waitlist_collection.distinct("book_id", titles_waitlist_query(book_ids)))